@@ -0,0 +1,187 @@
+"""
+Benchmark of the quality scorer against local SQLite stand-ins of gamma and geo.
+
+    python benchmarks/bench_quality.py --sizes 1000 10000 100000
+    python benchmarks/bench_quality.py --sizes 1000 --compare benchmarks/results/<commit>.json
+
+For every catalog size it measures the latency of evaluation_spot on a sample of spots, the
+throughput and peak memory of evaluation_spots over the whole catalog, the throughput of
+evaluation_spots_parallel for every number of workers (on the first --parallel-spots spots), and the
+throughput of output_qls / output_qls_batch. Results are saved as json named after the current git commit.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from local_db import seed_catalog
+
+import db_pool
+import quality_spot
+from parallel_scoring import evaluation_spots_parallel
+from quality_Level_scorer.quality_Level_scorer import LOG_FULL, LOG_LAZY, LOG_NONE, output_qls, output_qls_batch
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def use_catalog(gamma_params: dict, geo_params: dict):
+    # points quality_spot to a seeded catalog and drops every cache of the previous one
+    db_pool.close_pools()
+    quality_spot.connection_params_gamma = gamma_params
+    quality_spot.connection_params_geo = geo_params
+    quality_spot.complex_photos.invalidate()
+    quality_spot.qa_limits.refresh()
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def bench_latency(ids, sample_size: int) -> dict:
+    sample = random.Random(0).sample(ids, min(sample_size, len(ids)))
+    times, errors = [], {}
+    for id in sample:
+        start = time.perf_counter()
+        try:
+            quality_spot.evaluation_spot(id)
+        except Exception as e:
+            # e.g. KeyError for spots whose classified photos are none of them public, the spot is not timed
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            continue
+        times.append((time.perf_counter() - start) * 1000)
+    if errors:
+        print(f'evaluation_spot failed for {sum(errors.values())} of {len(sample)} spots: {errors}', flush=True)
+    return {
+        'evaluation_spot_p50_ms': round(percentile(times, 0.5), 3) if times else None,
+        'evaluation_spot_p95_ms': round(percentile(times, 0.95), 3) if times else None,
+        'evaluation_spot_mean_ms': round(statistics.mean(times), 3) if times else None,
+        'evaluation_spot_errors': sum(errors.values())
+    }
+
+def bench_batch(ids, chunk_size: int) -> dict:
+    quality_spot.complex_photos.invalidate()
+    tracemalloc.start()
+    start = time.perf_counter()
+    results = quality_spot.evaluation_spots(ids, chunk_size=chunk_size)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'evaluation_spots_seconds': round(elapsed, 3),
+        'evaluation_spots_spots_per_s': round(len(results) / elapsed, 1),
+        'evaluation_spots_peak_mb': round(peak / 2 ** 20, 1)
+    }
+
+def bench_parallel(ids, workers_list, shard_size: int) -> dict:
+    # spots per second with every number of workers, the speedup is relative to the first one
+    result = {}
+    for workers in workers_list:
+        start = time.perf_counter()
+        results = evaluation_spots_parallel(ids, workers=workers, shard_size=shard_size)
+        elapsed = time.perf_counter() - start
+        if len(results) != len(ids):
+            raise RuntimeError(f'evaluation_spots_parallel returned {len(results)} results for {len(ids)} spots')
+        result[f'parallel_{workers}_spots_per_s'] = round(len(ids) / elapsed, 1)
+    base = result[f'parallel_{workers_list[0]}_spots_per_s']
+    for workers in workers_list[1:]:
+        result[f'parallel_{workers}_speedup'] = round(result[f'parallel_{workers}_spots_per_s'] / base, 2)
+    return result
+
+def bench_qls(n: int) -> dict:
+    import pandas as pd
+
+    rng = random.Random(0)
+    list_input = [{
+        'spot_id': i,
+        'user_industria_role_id': rng.choice([1, 2, 4, 5]),
+        'user_broker_next_id': rng.choice([0, 1]),
+        'user_affiliation_id': rng.choice([0, 1]),
+        'spot_exclusive_id': rng.choice([0, 1]),
+        'user_level_id': rng.choice([0, 1, 2, 3]),
+        'score': rng.uniform(0, 100)
+    } for i in range(n)]
+    data = pd.DataFrame(list_input)
+
+    result = {}
+    for name, run in (('output_qls_none', lambda: output_qls(list_input, LOG_NONE)),
+                      ('output_qls_full', lambda: output_qls(list_input, LOG_FULL)),
+                      ('output_qls_lazy', lambda: output_qls(list_input, LOG_LAZY)),
+                      ('output_qls_batch', lambda: output_qls_batch(data))):
+        start = time.perf_counter()
+        run()
+        result[f'{name}_rows_per_s'] = round(n / (time.perf_counter() - start), 1)
+    return result
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def compare(current: dict, previous: dict):
+    # ratio current / previous of every metric, > 1 is better for throughputs and worse for times and memory
+    print(f"\ncomparison with {previous['commit']}:")
+    for size, metrics in current['sizes'].items():
+        for metric, value in metrics.items():
+            old = previous['sizes'].get(size, {}).get(metric)
+            if old and value:
+                print(f"  {size:>7} {metric:<36} {old:>12} -> {value:>12}  x{value / old:.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of quality_spot and quality_Level_scorer on local stand-ins.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--sample', type=int, default=200, help='spots timed with evaluation_spot')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, nargs='*', default=[1, 2, 4],
+                        help='numbers of worker processes of evaluation_spots_parallel, no value skips it')
+    parser.add_argument('--parallel-spots', type=int, default=10000, help='spots scored with every number of workers')
+    parser.add_argument('--output', default=None, help='json file, by default benchmarks/results/<commit>.json')
+    parser.add_argument('--compare', default=None, help='json of a previous run')
+    args = parser.parse_args(argv)
+
+    report = {
+        'commit': git_commit(),
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'sizes': {}
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            print(f'seeding {size} spots...', flush=True)
+            use_catalog(*seed_catalog(directory, size))
+            ids = list(range(1, size + 1))
+            metrics = {}
+            metrics.update(bench_latency(ids, args.sample))
+            metrics.update(bench_batch(ids, args.chunk_size))
+            if args.workers:
+                metrics.update(bench_parallel(ids[:args.parallel_spots], args.workers, args.chunk_size))
+            metrics.update(bench_qls(size))
+            report['sizes'][str(size)] = metrics
+            print(json.dumps(metrics, indent=2), flush=True)
+        db_pool.close_pools()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'results saved to {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
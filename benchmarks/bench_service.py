@@ -0,0 +1,144 @@
+"""
+End to end check and benchmark of scoring_service against local SQLite stand-ins of gamma and geo.
+
+    python benchmarks/bench_service.py --size 2000 --clients 32 --requests 400
+
+The service runs on a free local port. Clients send bursts of GET /score/<id> concerning a few hot spots
+plus POST /score batches, every answer is compared with score_spots_with_qls run directly, an
+invalidated spot is checked to be scored again, and a child of a complex is checked to see the photos
+added to its complex once it is invalidated. Prints the latency of the requests and the counters of
+the service (cache hits, coalesced requests, batches).
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from local_db import NOW, seed_catalog
+
+import db_pool
+import fused_scoring
+from bench_quality import percentile, use_catalog
+from score_store import jsonable
+from scoring_service import ScoringService, make_server, score_with_qls
+
+
+def request(base: str, method: str, path: str, ids=None):
+    data = json.dumps({'ids': ids}).encode() if ids is not None else None
+    req = urllib.request.Request(f'{base}{path}', data=data, method=method,
+                                 headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+def add_complex_photos(gamma_params: dict, geo_params: dict, spot_id: int, count: int) -> int:
+    # public classified photos added to the complex of the spot, returns the id of the complex
+    with sqlite3.connect(gamma_params['sqlite_path']) as gamma, sqlite3.connect(geo_params['sqlite_path']) as geo:
+        parent_id = gamma.execute("select parent_id from spots where id = ?", (spot_id,)).fetchone()[0]
+        photo_id = gamma.execute("select max(id) from photos").fetchone()[0]
+        classification_id = geo.execute("select max(id) from photos_aiclassification").fetchone()[0]
+        for i in range(1, count + 1):
+            gamma.execute("insert into photos values (?, ?, ?, ?)", (photo_id + i, parent_id, NOW, None))
+            geo.execute("insert into photos_aiclassification values (?, ?, ?, ?, ?, ?)",
+                        (classification_id + i, parent_id, photo_id + i, None, None, 'alta'))
+    return parent_id
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='End to end check of scoring_service on local stand-ins.')
+    parser.add_argument('--size', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=32, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=400, help='requests per kind of client')
+    parser.add_argument('--hot-spots', type=int, default=5, help='spots receiving most of the single requests')
+    parser.add_argument('--batch-size', type=int, default=20, help='spots per POST /score')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f'seeding {args.size} spots...', flush=True)
+        gamma_params, geo_params = seed_catalog(directory, args.size)
+        use_catalog(gamma_params, geo_params)
+        fused_scoring.connection_params_geo = geo_params
+        ids = list(range(1, args.size + 1))
+        # the stand-in lk_spots has the QLS attribute columns
+        attributes_source = fused_scoring.lk_spots_qls_attributes
+        expected = {r['id']: jsonable(r) for r in fused_scoring.score_spots_with_qls(ids, attributes_source)[0]}
+
+        service = ScoringService(lambda batch: score_with_qls(batch, attributes_source))
+        server = make_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{server.server_address[1]}'
+
+        rng = random.Random(0)
+        hot = rng.sample(ids, args.hot_spots)
+        calls = [('GET', f'/score/{rng.choice(hot) if rng.random() < 0.8 else rng.choice(ids)}', None)
+                 for _ in range(args.requests)]
+        calls += [('POST', '/score', rng.sample(ids, args.batch_size)) for _ in range(args.requests // 4)]
+        rng.shuffle(calls)
+
+        def run(call):
+            start = time.perf_counter()
+            status, body = request(base, *call)
+            return call, status, body, (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.clients) as executor:
+            answers = list(executor.map(run, calls))
+        elapsed = time.perf_counter() - start
+
+        mismatches = 0
+        for (method, path, batch), status, body, _ in answers:
+            if method == 'GET':
+                spot_id = int(path.rsplit('/', 1)[1])
+                ok = body == expected[spot_id] if status == 200 else (status == 404 and 'error' in expected[spot_id])
+            else:
+                ok = status == 200 and all(body['results'][str(i)] == expected.get(i) for i in batch)
+            mismatches += not ok
+
+        # an invalidated spot is scored again instead of served from the cache
+        request(base, 'GET', f'/score/{hot[0]}')
+        scored = service.stats['scored']
+        request(base, 'POST', '/invalidate', [hot[0]])
+        status, body = request(base, 'GET', f'/score/{hot[0]}')
+        invalidated_ok = status == 200 and body == expected[hot[0]] and service.stats['scored'] == scored + 1
+
+        # photos added to a complex reach a child that inherits them once the child is invalidated
+        child = next(i for i in ids if expected[i].get('fotos_complejo') == 1)
+        request(base, 'GET', f'/score/{child}')
+        add_complex_photos(gamma_params, geo_params, child, 3)
+        request(base, 'POST', '/invalidate', [child])
+        status, body = request(base, 'GET', f'/score/{child}')
+        complex_ok = status == 200 and body['fotos_publicas'] == expected[child]['fotos_publicas'] + 3
+
+        times = [answer[3] for answer in answers]
+        print(json.dumps({
+            'requests': len(answers),
+            'requests_per_s': round(len(answers) / elapsed, 1),
+            'p50_ms': round(percentile(times, 0.5), 3),
+            'p95_ms': round(percentile(times, 0.95), 3),
+            'mismatches': mismatches,
+            'invalidation_ok': invalidated_ok,
+            'complex_invalidation_ok': complex_ok,
+            'service': service.stats
+        }, indent=2))
+
+        server.shutdown()
+        server.server_close()
+        service.close()
+        db_pool.close_pools()
+    return 0 if mismatches == 0 and invalidated_ok and complex_ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
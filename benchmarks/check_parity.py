@@ -0,0 +1,149 @@
+"""
+Parity checks of the batch paths against the per-spot ones, on local SQLite stand-ins of gamma and geo.
+
+    python benchmarks/check_parity.py --size 2000 --sample 500
+
+- quality_spot.evaluation_spots against evaluation_spot for a sample of spots, the whole json is compared
+  (spots evaluation_spot cannot score are counted apart, they are a known failure of the per-spot path);
+- output_qls_batch against output_qls with LOG_NONE and LOG_FULL, codes outside the known maps included;
+- the quantiles of qa_bounds.KLLSketch, updated at once and merged from pages, against the exact ranks.
+
+Prints a summary and exits with 1 when any check fails.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from local_db import seed_catalog
+
+import db_pool
+import pandas as pd
+import quality_spot
+from bench_quality import use_catalog
+from qa_bounds import KLL_K, QUANTILES, KLLSketch
+from quality_Level_scorer.quality_Level_scorer import LOG_FULL, LOG_NONE, output_qls, output_qls_batch
+from score_store import jsonable
+
+# tolerance of the float fields, the batch path computes them with NumPy
+REL_TOL = 1e-9
+
+
+def same(a, b) -> bool:
+    if isinstance(a, float) or isinstance(b, float):
+        return isinstance(a, (int, float)) and isinstance(b, (int, float)) and math.isclose(a, b, rel_tol=REL_TOL)
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(same(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    return a == b
+
+def check_spots(ids, sample_size: int) -> dict:
+    sample = sorted(random.Random(0).sample(ids, min(sample_size, len(ids))))
+    # an id missing from spots must keep its place in the output as an error entry
+    missing_id = max(ids) + 1
+    results = quality_spot.evaluation_spots(sample + [missing_id])
+    aligned = [r['id'] for r in results] == sample + [missing_id] and not quality_spot.is_scored(results[-1])
+    batch = {r['id']: jsonable(r) for r in results}
+    mismatches, failures = [], {}
+    for spot_id in sample:
+        try:
+            single = quality_spot.evaluation_spot(spot_id)
+        except Exception as e:
+            # e.g. KeyError for spots whose classified photos are none of them public
+            failures[type(e).__name__] = failures.get(type(e).__name__, 0) + 1
+            continue
+        if not same(jsonable(single), batch[spot_id]):
+            mismatches.append(spot_id)
+    return {
+        'spots_compared': len(sample) - sum(failures.values()),
+        'spots_single_failures': failures,
+        'spots_mismatches': len(mismatches),
+        'spots_mismatch_ids': mismatches[:10],
+        'spots_aligned': aligned,
+        'spots_ok': not mismatches and aligned
+    }
+
+def check_qls(n: int) -> dict:
+    rng = random.Random(0)
+    # 3 and 9 are roles outside USER_INDUSTRIA_ROLE_MAP, 4 a level outside USER_LEVEL_MAP
+    list_input = [{
+        'spot_id': i,
+        'user_industria_role_id': rng.choice([1, 2, 2, 2, 3, 4, 5, 9]),
+        'user_broker_next_id': rng.choice([0, 1]),
+        'user_affiliation_id': rng.choice([0, 1]),
+        'spot_exclusive_id': rng.choice([0, 1]),
+        'user_level_id': rng.choice([0, 1, 2, 3, 4]),
+        'score': rng.uniform(0, 100)
+    } for i in range(n)]
+    batch = output_qls_batch(pd.DataFrame(list_input))
+    mismatches = 0
+    for log_level in (LOG_NONE, LOG_FULL):
+        for row, output in zip(batch.itertuples(index=False), output_qls(list_input, log_level)):
+            mismatches += (int(row.spot_id) != output['spot_id'] or int(row.level_class_id) != output['level_class_id']
+                           or not math.isclose(float(row.qls_score), output['qls_score'], rel_tol=REL_TOL))
+    return {'qls_compared': n, 'qls_mismatches': mismatches, 'qls_ok': mismatches == 0}
+
+def rank_error(sketch: KLLSketch, values: np.ndarray, q: float) -> float:
+    # distance between q and the range of ranks of the returned value
+    values = np.sort(values)
+    x = sketch.quantile(q)
+    lower = np.searchsorted(values, x, side='left') / len(values)
+    upper = np.searchsorted(values, x, side='right') / len(values)
+    return max(0., lower - q, q - upper)
+
+def check_kll(n: int, max_rank_error: float, k: int = KLL_K) -> dict:
+    rng = np.random.default_rng(0)
+    distributions = {
+        'uniform': rng.uniform(0, 1000, n),
+        'lognormal': rng.lognormal(8, 1.5, n),
+        'duplicates': rng.integers(0, 50, n).astype(float)
+    }
+    quantiles = sorted(set(QUANTILES) | {0.1, 0.25, 0.5, 0.75, 0.99})
+    errors = {}
+    for name, values in distributions.items():
+        whole = KLLSketch(k)
+        whole.update(values)
+        # pages of lk_spots merged like compute_bounds does
+        merged = KLLSketch(k)
+        for page in np.array_split(values, 37):
+            sketch = KLLSketch(k, seed=len(page))
+            sketch.update(page)
+            merged.merge(sketch)
+        errors[name] = round(max(rank_error(s, values, q) for s in (whole, merged) for q in quantiles), 5)
+    return {'kll_values': n, 'kll_k': k, 'kll_max_rank_error': errors,
+            'kll_ok': all(error <= max_rank_error for error in errors.values())}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parity checks of the batch paths on local stand-ins.')
+    parser.add_argument('--size', type=int, default=2000, help='spots of the seeded catalog')
+    parser.add_argument('--sample', type=int, default=500, help='spots also scored with evaluation_spot')
+    parser.add_argument('--qls-rows', type=int, default=20000)
+    parser.add_argument('--kll-values', type=int, default=200000)
+    parser.add_argument('--max-rank-error', type=float, default=0.01, help='allowed rank error of the sketch')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f'seeding {args.size} spots...', flush=True)
+        gamma_params, geo_params = seed_catalog(directory, args.size)
+        use_catalog(gamma_params, geo_params)
+        summary = check_spots(list(range(1, args.size + 1)), args.sample)
+        db_pool.close_pools()
+    summary.update(check_qls(args.qls_rows))
+    summary.update(check_kll(args.kll_values, args.max_rank_error))
+
+    print(json.dumps(summary, indent=2))
+    return 0 if summary['spots_ok'] and summary['qls_ok'] and summary['kll_ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+Local SQLite stand-ins of the gamma (MySQL) and geo (Postgres) databases with a synthetic catalog.
+
+The tables and columns are the ones used by the queries of quality_spot, querys and completeness:
+spots, prices, spot_amenities, amenities and photos in gamma; photos_aiclassification*,
+photos_phototag, qa_limites_* and the QLS attributes of lk_spots in geo. The connection params
+returned by seed_catalog are understood by db_pool, so execute_query_mysql / execute_query_postgres
+run against them. Import it before the scorer modules: it also provides the credentials modules,
+which are not part of the repository.
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import types
+from typing import Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the credentials modules are not part of the repository, the stand-ins replace them; their params are
+# empty until a catalog is seeded and passed to the modules that read them
+for module_name, variable in (('credenciales_gamma', 'connection_params_gamma'), ('credentials_geo', 'connection_params_geo')):
+    if module_name not in sys.modules:
+        module = types.ModuleType(module_name)
+        setattr(module, variable, {})
+        sys.modules[module_name] = module
+
+from variables_by_sector import sector_map, spot_variables, amenity_variables, photos_map
+
+GAMMA_SCHEMA = f"""
+create table spots (
+    id integer primary key,
+    parent_id integer,
+    is_complex integer,
+    spot_type_id integer,
+    spot_state integer,
+    square_space real,
+    {', '.join(f'{variable} integer' for variable in spot_variables)},
+    updated_at text,
+    deleted_at text
+);
+create table prices (
+    id integer primary key,
+    spot_id integer,
+    price_area integer,
+    currency_type integer,
+    type integer,
+    rate real,
+    updated_at text,
+    deleted_at text
+);
+create index prices_spot_id on prices (spot_id);
+create table amenities (
+    id integer primary key,
+    name text
+);
+create table spot_amenities (
+    spot_id integer,
+    amenity_id integer,
+    updated_at text,
+    deleted_at text
+);
+create index spot_amenities_spot_id on spot_amenities (spot_id);
+create table photos (
+    id integer primary key,
+    spot_id integer,
+    updated_at text,
+    deleted_at text
+);
+create index photos_spot_id on photos (spot_id);
+"""
+
+GEO_SCHEMA = """
+create table photos_aiclassification (
+    id integer primary key,
+    spot_id integer,
+    photo_id integer,
+    additional_information text,
+    short_description text,
+    quality text
+);
+create index photos_aiclassification_spot_id on photos_aiclassification (spot_id);
+create table photos_aiclassification_photo_tag (
+    id integer primary key,
+    aiclassification_id integer,
+    phototag_id integer
+);
+create index photos_aiclassification_photo_tag_ai on photos_aiclassification_photo_tag (aiclassification_id);
+create table photos_phototag (
+    id integer primary key,
+    name text
+);
+create table qa_limites_p_r (sector text, precio_m2_inferior real, precio_m2_superior real);
+create table qa_limites_p_s (sector text, precio_m2_inferior real, precio_m2_superior real);
+create table qa_limites_a_s (sector text, area_limite_inferior real, area_limite_superior real);
+create table lk_spots (
+    spot_id integer primary key,
+    spot_sector text,
+    spot_type text,
+    spot_status_id integer,
+    spot_area_in_sqm real,
+    spot_price_sqm_mxn_rent real,
+    spot_price_sqm_mxn_sale real,
+    user_industria_role_id integer,
+    user_broker_next_id integer,
+    user_affiliation_id integer,
+    spot_exclusive_id integer,
+    user_level_id integer
+);
+"""
+
+NOW = '2025-01-01 00:00:00'
+
+
+def seed_catalog(directory: str, n_spots: int, seed: int = 42) -> Tuple[dict, dict]:
+    """
+    Creates gamma.db and geo.db in directory with n_spots synthetic spots, about 5% of them complexes
+    whose children often have no photos of their own.
+
+    Returns:
+        Tuple[dict, dict]: connection params of gamma and geo
+    """
+    rng = random.Random(seed)
+    # separate generator so the rest of the catalog is the same as before the QLS attributes were added
+    qls_rng = random.Random(seed + 1)
+    gamma_path = os.path.join(directory, 'gamma.db')
+    geo_path = os.path.join(directory, 'geo.db')
+    for path in (gamma_path, geo_path):
+        if os.path.exists(path):
+            os.remove(path)
+    gamma = sqlite3.connect(gamma_path)
+    geo = sqlite3.connect(geo_path)
+    gamma.executescript(GAMMA_SCHEMA)
+    geo.executescript(GEO_SCHEMA)
+
+    amenity_names = list(amenity_variables.values())
+    gamma.executemany("insert into amenities (id, name) values (?, ?)", list(enumerate(amenity_names, 1)))
+    tag_names = list(photos_map) + ['Fachada', 'Interior']
+    geo.executemany("insert into photos_phototag (id, name) values (?, ?)", list(enumerate(tag_names, 1)))
+
+    spots, prices, spot_amenities, photos, classifications, tags, lk_spots = [], [], [], [], [], [], []
+    complexes = []
+    for spot_id in range(1, n_spots + 1):
+        sector_id = rng.choice(list(sector_map))
+        is_complex = rng.random() < 0.05
+        parent_id = rng.choice(complexes) if complexes and not is_complex and rng.random() < 0.3 else None
+        if is_complex:
+            complexes.append(spot_id)
+        square_space = round(rng.lognormvariate(5, 1), 2)
+        variables = [rng.randint(0, 10) if rng.random() < 0.6 else None for _ in spot_variables]
+        spots.append((spot_id, parent_id, int(is_complex), sector_id, 1, square_space, *variables, NOW, None))
+
+        price_sqm = {}
+        for _ in range(rng.randint(1, 2)):
+            price_area = rng.choice([1, 2])
+            rate = square_space * rng.uniform(50, 400) if price_area == 1 else rng.uniform(50, 400)
+            prices.append((len(prices) + 1, spot_id, price_area, rng.choice([1, 2, None]), rng.choice([1, 2]),
+                           round(rate, 2), NOW, None))
+            price_sqm.setdefault(prices[-1][4], rate / square_space if price_area == 1 else rate)
+        lk_spots.append((spot_id, sector_map[sector_id].capitalize(), 'Complex' if is_complex else 'Single', 1,
+                         square_space, price_sqm.get(1), price_sqm.get(2),
+                         qls_rng.choice([1, 2, 4, 5]), qls_rng.choice([0, 1]), qls_rng.choice([0, 1]),
+                         qls_rng.choice([0, 1]), qls_rng.choice([0, 1, 2, 3])))
+
+        for amenity_id in rng.sample(range(1, len(amenity_names) + 1), rng.randint(0, 8)):
+            spot_amenities.append((spot_id, amenity_id, NOW, None))
+
+        # children of complexes usually inherit the photos of the complex
+        n_photos = 0 if parent_id is not None and rng.random() < 0.7 else rng.randint(0, 15)
+        for _ in range(n_photos):
+            photo_id = len(photos) + 1
+            photos.append((photo_id, spot_id, NOW, NOW if rng.random() < 0.1 else None))
+            classification_id = len(classifications) + 1
+            classifications.append((classification_id, spot_id, photo_id, None, None, rng.choice(['alta', 'media', 'baja'])))
+            for phototag_id in rng.sample(range(1, len(tag_names) + 1), rng.randint(0, 2)):
+                tags.append((len(tags) + 1, classification_id, phototag_id))
+
+    gamma.executemany(f"insert into spots values ({', '.join('?' * (8 + len(spot_variables)))})", spots)
+    gamma.executemany("insert into prices values (?, ?, ?, ?, ?, ?, ?, ?)", prices)
+    gamma.executemany("insert into spot_amenities values (?, ?, ?, ?)", spot_amenities)
+    gamma.executemany("insert into photos values (?, ?, ?, ?)", photos)
+    geo.executemany("insert into photos_aiclassification values (?, ?, ?, ?, ?, ?)", classifications)
+    geo.executemany("insert into photos_aiclassification_photo_tag values (?, ?, ?)", tags)
+    geo.executemany(f"insert into lk_spots values ({', '.join('?' * 12)})", lk_spots)
+    for sector in sector_map.values():
+        geo.execute("insert into qa_limites_p_r values (?, ?, ?)", (sector, 80, 300))
+        geo.execute("insert into qa_limites_p_s values (?, ?, ?)", (sector, 100, 350))
+        geo.execute("insert into qa_limites_a_s values (?, ?, ?)", (sector, 30, 2000))
+    gamma.commit()
+    geo.commit()
+    gamma.close()
+    geo.close()
+    return {'sqlite_path': gamma_path}, {'sqlite_path': geo_path}
@@ -0,0 +1,72 @@
+"""
+Completeness of the spots computed from a bitmask of the filled variables.
+
+The query returns, for every spot, one integer with a bit per variable of variables_by_sector
+(spot columns that are not null and amenities the spot has), so the completeness of any sector
+is the share of the sector bits that are set.
+"""
+
+from typing import List
+
+import numpy as np
+
+from prepared import Query, query
+from variables_by_sector import sector_map, variables_map, spot_variables, amenity_variables
+
+# Bit of every variable in variables_mask
+VARIABLES = spot_variables + list(amenity_variables)
+VARIABLE_BITS = {variable: 1 << i for i, variable in enumerate(VARIABLES)}
+
+# Bits of the variables evaluated in every sector, keyed by spot_type_id
+SECTOR_MASKS = {
+    sector_id: sum(VARIABLE_BITS[variable] for variable in variables_map[sector])
+    for sector_id, sector in sector_map.items()
+}
+
+
+def query_variables_mask(ids: List[int]) -> Query:
+    """
+    Query with spot_id, parent_id, spot_type_id and variables_mask for the spots in ids.
+    """
+    spot_bits = ' +\n    '.join(f'((s.{variable} IS NOT NULL) << {i})' for i, variable in enumerate(spot_variables))
+    amenity_bits = '\n        '.join(
+        f"WHEN '{name}' THEN {VARIABLE_BITS[variable]}" for variable, name in amenity_variables.items())
+    sql = f"""
+    SELECT 
+    s.id AS spot_id,
+    s.parent_id,
+    s.spot_type_id,
+    {spot_bits} +
+    BIT_OR(CASE a.name
+        {amenity_bits}
+        ELSE 0 END) AS variables_mask
+    FROM spots s
+    LEFT JOIN spot_amenities sa ON sa.spot_id = s.id
+    LEFT JOIN amenities a ON a.id = sa.amenity_id
+    WHERE s.id = ANY(%s)
+    GROUP BY s.id
+    """
+    return query('variables_mask', sql, ids)
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    # number of bits set in every value
+    values = values.astype(np.uint64)
+    count = np.zeros(values.shape, dtype=np.int64)
+    for i in range(len(VARIABLES)):
+        count += ((values >> np.uint64(i)) & np.uint64(1)).astype(np.int64)
+    return count
+
+def completitud_from_masks(spot_type_id, variables_mask) -> np.ndarray:
+    """
+    Percentage of the sector variables that are filled for every spot, NaN for sectors without variables.
+
+    Args:
+        spot_type_id: array of sector ids
+        variables_mask: array of masks returned by query_variables_mask
+    """
+    spot_type_id = np.asarray(spot_type_id)
+    sector_mask = np.array([SECTOR_MASKS.get(s, 0) for s in spot_type_id.tolist()], dtype=np.uint64)
+    filled = popcount(np.array([int(m) for m in variables_mask], dtype=np.uint64) & sector_mask)
+    total = popcount(sector_mask)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(total > 0, filled / total * 100, np.nan)
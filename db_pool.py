@@ -0,0 +1,253 @@
+"""
+Pool of persistent database connections for execute_query_mysql / execute_query_postgres.
+
+There is one pool per (driver, connection params) pair, created on first use. Connection params
+with a `sqlite_path` key open a local SQLite database instead, used as a stand-in of gamma / geo
+by the benchmarks.
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+import mysql.connector
+import psycopg2
+
+# Maximum number of open connections per pool
+POOL_MAX_SIZE = 5
+# Seconds to wait for a free connection when the pool is exhausted
+POOL_TIMEOUT = 30
+# Connections idle for longer than this many seconds are pinged before being handed out
+HEALTH_CHECK_INTERVAL = 30
+
+
+class ConnectionPool:
+    """
+    Bounded pool of database connections.
+
+    Args:
+        connect (Callable): function that opens a new connection
+        is_alive (Callable): function that returns True if a connection can still be used
+        max_size (int): maximum number of open connections
+        timeout (float): seconds to wait for a free connection
+        health_check_interval (float): idle seconds after which is_alive is checked on checkout
+    """
+
+    def __init__(self, connect: Callable, is_alive: Callable, max_size: int = POOL_MAX_SIZE,
+                 timeout: float = POOL_TIMEOUT, health_check_interval: float = HEALTH_CHECK_INTERVAL):
+        self._connect = connect
+        self._is_alive = is_alive
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        # idle connections with the time they were returned, the last one is handed out first
+        self._idle: List[tuple] = []
+        self._size = 0
+        self._closed = False
+        # guards _idle, _size and _statements, notified whenever a connection or a slot is freed
+        self._condition = threading.Condition()
+        # prepared statements of every open connection, see prepared.py
+        self._statements: Dict[int, OrderedDict] = {}
+        self.stats = {'hits': 0, 'misses': 0, 'reconnects': 0, 'timeouts': 0, 'wait_time': 0.0}
+
+    def _checkout(self):
+        # an idle (connection, last_used), or None once a slot is reserved for a new connection
+        deadline = start = None
+        with self._condition:
+            try:
+                while not self._idle and self._size >= self.max_size:
+                    if self._closed:
+                        raise RuntimeError('the connection pool is closed')
+                    if deadline is None:
+                        deadline, start = time.monotonic() + self.timeout, time.perf_counter()
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats['timeouts'] += 1
+                        raise TimeoutError(f'no free connection after {self.timeout} seconds')
+                    self._condition.wait(remaining)
+            finally:
+                if start is not None:
+                    self.stats['wait_time'] += time.perf_counter() - start
+            if self._idle:
+                return self._idle.pop()
+            self._size += 1
+            self.stats['misses'] += 1
+            return None
+
+    def _discard(self, connection):
+        with self._condition:
+            self._size -= 1
+            self._statements.pop(id(connection), None)
+            self._condition.notify()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def get(self):
+        """Checks out a healthy connection, opening a new one or waiting for a free one if needed."""
+        if self._closed:
+            raise RuntimeError('the connection pool is closed')
+        while True:
+            idle = self._checkout()
+            if idle is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    # the reserved slot is free again for the threads waiting
+                    with self._condition:
+                        self._size -= 1
+                        self._condition.notify()
+                    raise
+
+            connection, last_used = idle
+            if time.monotonic() - last_used < self.health_check_interval or self._is_alive(connection):
+                with self._condition:
+                    self.stats['hits'] += 1
+                return connection
+            # stale connection, drop it and try again
+            with self._condition:
+                self.stats['reconnects'] += 1
+            self._discard(connection)
+
+    def put(self, connection, broken: bool = False):
+        """Returns a connection to the pool, broken connections are closed instead."""
+        if not broken and not self._closed:
+            try:
+                # end the transaction so the next checkout does not read an old snapshot
+                connection.rollback()
+            except Exception:
+                broken = True
+        if broken or self._closed:
+            self._discard(connection)
+        else:
+            with self._condition:
+                self._idle.append((connection, time.monotonic()))
+                self._condition.notify()
+
+    def statements(self, connection) -> OrderedDict:
+        """Cache of the prepared statements of a connection checked out from this pool."""
+        with self._condition:
+            return self._statements.setdefault(id(connection), OrderedDict())
+
+    @contextmanager
+    def connection(self):
+        connection = self.get()
+        try:
+            yield connection
+        except Exception:
+            self.put(connection, broken=True)
+            raise
+        else:
+            self.put(connection)
+
+    def close(self):
+        """Closes every idle connection, connections in use are closed when returned."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            # threads waiting for a connection fail instead of opening one
+            self._condition.notify_all()
+        for connection, _ in idle:
+            self._discard(connection)
+
+
+def _mysql_is_alive(connection) -> bool:
+    try:
+        return connection.is_connected()
+    except Exception:
+        return False
+
+def _postgres_is_alive(connection) -> bool:
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return True
+    except Exception:
+        return False
+
+def _sqlite_is_alive(connection) -> bool:
+    try:
+        connection.execute('SELECT 1')
+        return True
+    except Exception:
+        return False
+
+class _BitOr:
+    # BIT_OR aggregate of MySQL for the SQLite stand-in
+    def __init__(self):
+        self.value = 0
+
+    def step(self, value):
+        if value is not None:
+            self.value |= int(value)
+
+    def finalize(self):
+        return self.value
+
+def sqlite_connect(sqlite_path: str, **kwargs):
+    connection = sqlite3.connect(sqlite_path, check_same_thread=False)
+    connection.create_aggregate('BIT_OR', 1, _BitOr)
+    # to_regclass of Postgres: the name of the table, NULL when it does not exist
+    connection.create_function('to_regclass', 1, lambda name: name if connection.execute(
+        "select 1 from sqlite_master where type in ('table', 'view') and name = ?", (name,)).fetchone() else None)
+    return connection
+
+
+_pools: Dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+# pools of the parent of a forked process, kept referenced so the child never closes (or garbage
+# collects) connections the parent is still using
+_inherited_pools: List[ConnectionPool] = []
+
+def _reset_after_fork():
+    # the child opens its own connections, the lock may have been held by a thread of the parent
+    global _pools_lock
+    _pools_lock = threading.Lock()
+    _inherited_pools.extend(_pools.values())
+    _pools.clear()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _get_pool(driver: str, connection_params: dict, connect: Callable, is_alive: Callable) -> ConnectionPool:
+    key = (driver,) + tuple(sorted(connection_params.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._closed:
+            pool = ConnectionPool(lambda: connect(**connection_params), is_alive)
+            _pools[key] = pool
+    return pool
+
+def mysql_pool(connection_params: dict) -> ConnectionPool:
+    if 'sqlite_path' in connection_params:
+        return _get_pool('sqlite', connection_params, sqlite_connect, _sqlite_is_alive)
+    return _get_pool('mysql', connection_params, mysql.connector.connect, _mysql_is_alive)
+
+def postgres_pool(connection_params: dict) -> ConnectionPool:
+    if 'sqlite_path' in connection_params:
+        return _get_pool('sqlite', connection_params, sqlite_connect, _sqlite_is_alive)
+    return _get_pool('postgres', connection_params, psycopg2.connect, _postgres_is_alive)
+
+def pool_stats() -> Dict[str, dict]:
+    """Returns the hits, misses, reconnects, timeouts and wait time of every pool, keyed by driver and host."""
+    stats = {}
+    for key, pool in _pools.items():
+        params = dict(key[1:])
+        name = f"{key[0]}://{params.get('host', '')}/{params.get('database', params.get('dbname', params.get('sqlite_path', '')))}"
+        stats[name] = dict(pool.stats, size=pool._size, idle=len(pool._idle))
+    return stats
+
+@atexit.register
+def close_pools():
+    """Closes all the pools."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
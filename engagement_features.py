@@ -0,0 +1,266 @@
+"""
+Store of engagement features by spot: views and inquiries in the first 7 / 30 / 60 days after creation.
+
+The counts are kept in a SQLite file and mirrored in memory, so reading the features of a spot is a
+dict lookup. Events are appended once per day: only the spots with events that day are updated and
+days already appended are skipped, so a failed daily run can be repeated safely. Events of spots that
+are not registered yet are kept apart and counted when the spot is registered.
+
+    store = EngagementFeatureStore()
+    store.register_spots(data[['spot_id', 'spot_created_at']])
+    store.append_views_file('views_parquet', start=day, end=day)
+    store.append_inquiries(inquiries_of_day(day, lambda q: execute_query_postgres(q, connection_params_geo)))
+
+The training reads the targets from the store (segment_training.build_threshold_map(..., engagement=store))
+and the scorers add the features of every spot to its json (evaluation_spots(..., engagement=store)).
+"""
+
+import sqlite3
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from prepared import Query, query
+
+ENGAGEMENT_DB = 'engagement_features.db'
+# Days after the creation of a spot of every window
+ENGAGEMENT_WINDOWS = (7, 30, 60)
+SOURCES = ('vistas', 'inquiries')
+
+
+def feature_columns(windows: Tuple[int, ...] = ENGAGEMENT_WINDOWS) -> List[str]:
+    # total_vistas_60_dias is the name used by the training notebook
+    return [f'total_{source}_{window}_dias' for source in SOURCES for window in windows]
+
+def to_days(dates) -> np.ndarray:
+    # days since 1970-01-01
+    return pd.to_datetime(pd.Series(dates)).to_numpy(dtype='datetime64[D]').astype(np.int64)
+
+def query_inquiries_day(day: str):
+    sql = """
+    select spot_id, inquieries_day_created
+    from lk_inquiries
+    where inquieries_day_created::date = %s
+    """
+    return query('inquiries_day', sql, day)
+
+def inquiries_of_day(day: str, execute_query: Callable[[Query], pd.DataFrame]) -> pd.DataFrame:
+    """
+    Inquiries created on day (yyyy-mm-dd) from lk_inquiries.
+
+    Args:
+        day (str): day of the inquiries
+        execute_query (Callable): runs a Query on geo, e.g. lambda q: execute_query_postgres(q, connection_params_geo)
+    """
+    inquiries = execute_query(query_inquiries_day(day))
+    if inquiries is None:
+        raise RuntimeError(f'the inquiries of {day} could not be read')
+    return inquiries
+
+
+class EngagementFeatureStore:
+    """
+    Rolling views and inquiries counts keyed by spot_id.
+
+    Args:
+        path (str): SQLite file
+        windows (Tuple[int, ...]): days after the creation counted by every window, fixed when the file is created
+    """
+
+    def __init__(self, path: str = ENGAGEMENT_DB, windows: Tuple[int, ...] = ENGAGEMENT_WINDOWS):
+        self.windows = tuple(sorted(windows))
+        self.columns = feature_columns(self.windows)
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute("create table if not exists engagement_meta (key text primary key, value text)")
+            self.connection.execute(f"""
+            create table if not exists engagement_features (
+                spot_id integer primary key,
+                created_day integer,
+                {', '.join(f'{column} integer default 0' for column in self.columns)}
+            )
+            """)
+            self.connection.execute("""
+            create table if not exists engagement_days (
+                source text,
+                day integer,
+                primary key (source, day)
+            )
+            """)
+            self.connection.execute("""
+            create table if not exists engagement_pending (
+                source text,
+                spot_id integer,
+                day integer,
+                count integer,
+                primary key (source, spot_id, day)
+            )
+            """)
+            self.connection.execute("insert or ignore into engagement_meta values ('windows', ?)",
+                                    (','.join(map(str, self.windows)),))
+        stored = self.connection.execute("select value from engagement_meta where key = 'windows'").fetchone()[0]
+        if stored != ','.join(map(str, self.windows)):
+            raise ValueError(f'{path} was created with windows {stored}, not {self.windows}')
+
+        self._created: Dict[int, int] = {}
+        self._features: Dict[int, np.ndarray] = {}
+        for spot_id, created_day, *counts in self.connection.execute(
+                f"select spot_id, created_day, {', '.join(self.columns)} from engagement_features"):
+            self._created[spot_id] = created_day
+            self._features[spot_id] = np.array(counts, dtype=np.int64)
+
+    def register_spots(self, spots: pd.DataFrame) -> int:
+        """
+        Adds the spots (spot_id, spot_created_at) whose events will be counted, known spots are left as they are.
+        The events appended before a spot was registered are counted now.
+        """
+        spots = spots.dropna(subset=['spot_id', 'spot_created_at'])
+        ids = spots['spot_id'].astype(int).tolist()
+        days = to_days(spots['spot_created_at']).tolist()
+        new = dict((i, d) for i, d in zip(ids, days) if i not in self._created)
+        pending = pd.read_sql_query("select source, spot_id, day, count from engagement_pending", self.connection)
+        pending = pending[pending['spot_id'].isin(list(new))]
+        updates = {}
+        for source in SOURCES:
+            events = pending[pending['source'] == source]
+            updates[source], _ = self._window_counts(source, events['spot_id'].to_numpy(dtype=np.int64),
+                                                     events['day'].to_numpy(dtype=np.int64),
+                                                     events['count'].to_numpy(dtype=np.int64), set(), new)
+        with self.connection:
+            self.connection.executemany("insert into engagement_features (spot_id, created_day) values (?, ?)",
+                                        list(new.items()))
+            for source in SOURCES:
+                updates[source] = self._store_counts(source, updates[source])
+            self.connection.executemany("delete from engagement_pending where source = ? and spot_id = ?",
+                                        pending[['source', 'spot_id']].drop_duplicates().to_numpy().tolist())
+        for spot_id, created_day in new.items():
+            self._created[spot_id] = created_day
+            self._features[spot_id] = np.zeros(len(self.columns), dtype=np.int64)
+        for source in SOURCES:
+            self._cache_counts(source, updates[source])
+        return len(new)
+
+    def appended_days(self, source: str) -> set:
+        return {day for (day,) in self.connection.execute("select day from engagement_days where source = ?", (source,))}
+
+    def _window_counts(self, source: str, spot_ids: np.ndarray, days: np.ndarray, counts: np.ndarray,
+                       skip_days: set, created: Optional[Dict[int, int]] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Counts of the events by spot and window of source and the events (spot_id, day, count) of the spots
+        missing from created (the registered spots by default). Events of skip_days are ignored.
+        """
+        events = pd.DataFrame({'spot_id': spot_ids, 'day': days, 'count': counts})
+        events = events[~events['day'].isin(skip_days)].copy()
+        events['created_day'] = events['spot_id'].map(self._created if created is None else created)
+        unknown = events['created_day'].isna()
+        pending = events[unknown].groupby(['spot_id', 'day'], as_index=False)['count'].sum()
+        events = events[~unknown]
+        delta = events['day'].to_numpy() - events['created_day'].to_numpy()
+
+        window_columns = self._source_columns(source)
+        for column, window in zip(window_columns, self.windows):
+            events[column] = np.where((delta >= 0) & (delta <= window), events['count'].to_numpy(), 0)
+        return events.groupby('spot_id')[window_columns].sum(), pending
+
+    def _source_columns(self, source: str) -> List[str]:
+        offset = SOURCES.index(source) * len(self.windows)
+        return self.columns[offset:offset + len(self.windows)]
+
+    def _store_counts(self, source: str, updates: pd.DataFrame) -> pd.DataFrame:
+        # adds the window counts to the table inside the transaction of the caller, returns the rows applied
+        updates = updates.groupby(level=0).sum()
+        updates = updates[updates.any(axis=1)]
+        window_columns = self._source_columns(source)
+        self.connection.executemany(
+            f"update engagement_features set {', '.join(f'{c} = {c} + ?' for c in window_columns)} where spot_id = ?",
+            [(*map(int, row), int(spot_id)) for spot_id, row in zip(updates.index, updates.to_numpy())])
+        return updates
+
+    def _cache_counts(self, source: str, updates: pd.DataFrame):
+        # the same counts in memory, once the transaction is committed
+        offset = self.columns.index(self._source_columns(source)[0])
+        for spot_id, row in zip(updates.index, updates.to_numpy()):
+            self._features[int(spot_id)][offset:offset + len(self.windows)] += row.astype(np.int64)
+
+    def _apply(self, source: str, updates: pd.DataFrame, pending: pd.DataFrame, days: set) -> int:
+        """
+        Adds the window counts of updates, keeps the pending events of the unregistered spots and marks the days
+        as appended in one transaction.
+        """
+        pending = pending.groupby(['spot_id', 'day'], as_index=False)['count'].sum()
+        with self.connection:
+            updates = self._store_counts(source, updates)
+            self.connection.executemany(
+                "insert into engagement_pending values (?, ?, ?, ?) "
+                "on conflict (source, spot_id, day) do update set count = count + excluded.count",
+                [(source, int(i), int(d), int(c)) for i, d, c in pending[['spot_id', 'day', 'count']].to_numpy()])
+            self.connection.executemany("insert into engagement_days values (?, ?)", [(source, int(day)) for day in sorted(days)])
+        self._cache_counts(source, updates)
+        return len(updates)
+
+    def _append(self, source: str, spot_ids: np.ndarray, days: np.ndarray, counts: np.ndarray) -> int:
+        """Adds the events of the days not appended yet to the windows of source, returns the number of spots updated."""
+        done = self.appended_days(source)
+        updates, pending = self._window_counts(source, spot_ids, days, counts, done)
+        return self._apply(source, updates, pending, set(np.unique(days).tolist()) - done)
+
+    def append_views(self, views: pd.DataFrame) -> int:
+        """Appends view events (event_date, spot_id, conteo_vistas)."""
+        return self._append('vistas', views['spot_id'].to_numpy(dtype=np.int64), to_days(views['event_date']),
+                            views['conteo_vistas'].to_numpy(dtype=np.int64))
+
+    def append_views_file(self, path: str, start=None, end=None) -> int:
+        """
+        Appends the view events between start and end of views.csv or its Parquet version.
+        The file is read in batches and applied at once, so days split across batches are counted whole.
+        """
+        from views_history import read_views
+
+        done = self.appended_days('vistas')
+        updates, pending, days = [], [], set()
+        for batch in read_views(path, start, end):
+            views = batch.to_pandas()
+            batch_days = to_days(views['event_date'])
+            counts, unknown = self._window_counts('vistas', views['spot_id'].to_numpy(dtype=np.int64), batch_days,
+                                                  views['conteo_vistas'].to_numpy(dtype=np.int64), done)
+            updates.append(counts)
+            pending.append(unknown)
+            days.update(np.unique(batch_days).tolist())
+        if not updates:
+            return 0
+        return self._apply('vistas', pd.concat(updates), pd.concat(pending), days - done)
+
+    def append_inquiries(self, inquiries: pd.DataFrame) -> int:
+        """Appends inquiries (spot_id, inquieries_day_created), every row is one inquiry."""
+        return self._append('inquiries', inquiries['spot_id'].to_numpy(dtype=np.int64),
+                            to_days(inquiries['inquieries_day_created']), np.ones(len(inquiries), dtype=np.int64))
+
+    def get(self, spot_id: int) -> Optional[Dict[str, int]]:
+        """Features of a spot, None if the spot is not registered."""
+        counts = self._features.get(int(spot_id))
+        if counts is None:
+            return None
+        return dict(zip(self.columns, counts.tolist()))
+
+    def to_frame(self, ids: Optional[Iterable[int]] = None) -> pd.DataFrame:
+        """Features of the spots in ids (all the registered spots by default) with a spot_id column."""
+        ids = list(self._features) if ids is None else [int(i) for i in ids if int(i) in self._features]
+        counts = np.array([self._features[i] for i in ids], dtype=np.int64).reshape(len(ids), len(self.columns))
+        frame = pd.DataFrame(counts, columns=self.columns)
+        frame.insert(0, 'spot_id', ids)
+        return frame
+
+    def close(self):
+        self.connection.close()
+
+
+def add_engagement(results: List[dict], store: EngagementFeatureStore) -> List[dict]:
+    """
+    Adds the features of every spot (None if it is not registered) to the json of evaluation_spot,
+    the error entries of evaluation_spots are left as they are.
+    """
+    for result in results:
+        if 'error' not in result:
+            result['engagement'] = store.get(result['id'])
+    return results
@@ -0,0 +1,114 @@
+"""
+Quality score and QLS score of many spots in one batch pass.
+
+For every chunk of ids the QLS user / spot attributes are fetched from an attributes source while the
+quality inputs are fetched and scored by evaluation_spots_chunk, then output_qls_batch turns the scores
+into qls_score and level_class_id. The result rows are the json of evaluation_spot plus both QLS
+columns, and the QLS outputs have the shape score_store.score_rows expects. With an audit_log the
+records of every chunk are written with the QLS attributes, so explain includes the level class.
+
+    results, qls_outputs = score_spots_with_qls(ids, attributes_source)
+    SQLiteScoreStore().write(results, qls_outputs)
+
+The attributes source is a function of the ids returning a DataFrame with spot_id and the QLS_ATTRIBUTES
+columns (user_industria_role_id, user_broker_next_id, user_affiliation_id, spot_exclusive_id, user_level_id),
+it is always given by the caller. Nothing in this repository defines where those attributes live:
+lk_spots_qls_attributes reads them from lk_spots of geo, which only the local_db stand-in is known to have,
+so check the real table before choosing it in production. A source that fails raises, the chunk fails
+instead of scoring its spots with the lowest level.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import quality_spot
+from credentials_geo import connection_params_geo
+from instrumentation import instrumented
+from quality_Level_scorer import quality_Level_scorer
+from quality_spot import execute_query_postgres, evaluation_spots_chunk, is_scored
+from querys import query_qls_attributes
+from engagement_features import EngagementFeatureStore, add_engagement
+from score_audit import QLS_ATTRIBUTES, AuditLog, add_qls
+
+
+# Returns the QLS attributes of the ids: spot_id and QLS_ATTRIBUTES columns, spots may be missing
+AttributesSource = Callable[[List[int]], pd.DataFrame]
+
+
+@instrumented('lk_spots_qls_attributes')
+def lk_spots_qls_attributes(ids: List[int]) -> pd.DataFrame:
+    """Attributes source reading the QLS attributes from lk_spots of geo, see the module docstring."""
+    attributes = execute_query_postgres(query_qls_attributes(ids), connection_params_geo)
+    if attributes is None:
+        # scoring the chunk with 0 everywhere would give every spot class 8, and that score is cached and audited
+        raise RuntimeError(f'the QLS attributes of {len(ids)} spots could not be read from lk_spots')
+    return attributes
+
+# Attributes sources selectable by name, e.g. by scoring_service --attributes-source
+ATTRIBUTE_SOURCES: Dict[str, AttributesSource] = {'lk_spots': lk_spots_qls_attributes}
+
+
+def get_qls_attributes(ids: List[int], attributes_source: AttributesSource) -> pd.DataFrame:
+    """
+    QLS attributes of the spots by spot_id from attributes_source. Spots missing from its output get 0 in
+    every attribute, which output_qls reads as the lowest level.
+    """
+    attributes = attributes_source(ids)
+    if attributes is None:
+        raise RuntimeError(f'the QLS attributes of {len(ids)} spots could not be read')
+    attributes = attributes.drop_duplicates('spot_id').set_index('spot_id')
+    attributes.index = attributes.index.astype(int)
+    return attributes.reindex([int(i) for i in ids])[QLS_ATTRIBUTES].fillna(0).astype(int)
+
+def score_spots_with_qls(ids: List[int], attributes_source: AttributesSource, chunk_size: int = 1000,
+                         audit_log: Optional[AuditLog] = None,
+                         engagement: Optional[EngagementFeatureStore] = None) -> Tuple[List[dict], List[dict]]:
+    """
+    Evaluates the spots with evaluation_spots and output_qls_batch in one pass per chunk of ids.
+
+    Args:
+        ids (List[int]): ids of the spots
+        attributes_source (AttributesSource): function returning the QLS attributes of a chunk of ids
+        chunk_size (int): number of spots fetched per query
+        audit_log (AuditLog): optional log where the audit records of every chunk are appended
+        engagement (EngagementFeatureStore): optional store whose features are added to every json as engagement
+
+    Returns:
+        Tuple[List[dict], List[dict]]: the json of evaluation_spot of every spot with qls_score and
+        level_class_id added, in the order of ids (error entries of evaluation_spots as they are),
+        and the QLS outputs (spot_id, qls_score, level_class_id) of the scored spots
+    """
+    ids = list(ids)
+    limits = quality_spot.qa_limits.snapshot()
+    results, qls_outputs = [], []
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            # the attributes query runs while the quality inputs are fetched and scored
+            attributes = executor.submit(get_qls_attributes, chunk, attributes_source)
+            audit = [] if audit_log is not None else None
+            chunk_results = evaluation_spots_chunk(chunk, limits, audit)
+            results.extend(chunk_results)
+            scored = [r for r in chunk_results if is_scored(r)]
+            if not scored:
+                attributes.result()
+                continue
+
+            data = attributes.result().reindex([r['id'] for r in scored])
+            data.insert(0, 'spot_id', data.index)
+            data['score'] = [r['score'] for r in scored]
+            qls = quality_Level_scorer.output_qls_batch(data.reset_index(drop=True))
+            if audit:
+                audit_log.append(add_qls(audit[0], data, qls, quality_Level_scorer.QLS_CONFIG))
+
+            for result, spot_id, qls_score, level_class_id in zip(scored, qls['spot_id'], qls['qls_score'],
+                                                                   qls['level_class_id']):
+                output = {'spot_id': int(spot_id), 'qls_score': float(qls_score), 'level_class_id': int(level_class_id)}
+                result['qls_score'] = output['qls_score']
+                result['level_class_id'] = output['level_class_id']
+                qls_outputs.append(output)
+    if engagement is not None:
+        add_engagement(results, engagement)
+    return results, qls_outputs
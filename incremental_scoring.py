@@ -0,0 +1,122 @@
+"""
+Incremental rescoring: only the spots whose inputs changed since the last run are evaluated again.
+
+A spot is changed when its spots.updated_at moved past the watermark of the last run, or when
+photos_aiclassification got new rows for it. spots.updated_at is the one per-spot change signal:
+it is touched whenever the spot or one of its prices, amenities or photos is edited, deleted
+included, so hard deletes in the child tables are caught too. The state of the last run
+(the watermark and the last id of photos_aiclassification) is kept in a json file.
+"""
+
+import json
+import os
+from typing import List, Set, Tuple
+
+import pandas as pd
+
+from credenciales_gamma import connection_params_gamma
+from credentials_geo import connection_params_geo
+from prepared import query
+from quality_spot import execute_query_mysql, execute_query_postgres, evaluation_spots, complex_photos
+
+INCREMENTAL_STATE_PATH = 'incremental_state.json'
+# watermark of an empty spots table, every spot added later is newer
+MIN_WATERMARK = '1970-01-01 00:00:00'
+
+
+def load_state(path: str = INCREMENTAL_STATE_PATH) -> dict:
+    # state of the last run, empty on the first run
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_state(state: dict, path: str = INCREMENTAL_STATE_PATH):
+    # the file is replaced at once so a crash never leaves half a state
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def format_watermark(value) -> str:
+    # MySQL returns a datetime and the SQLite stand-in a str, the state keeps the text form of both
+    if value is None or pd.isna(value):
+        return MIN_WATERMARK
+    return pd.Timestamp(value).strftime('%Y-%m-%d %H:%M:%S')
+
+def query_changed_gamma(watermark: str):
+    # >= because the watermark has second precision, spots updated in its second are rescored again
+    sql = """
+    select id as spot_id from spots
+    where updated_at >= %s
+    """
+    return query('changed_gamma', sql, watermark)
+
+def query_changed_aiclassification(last_id: int):
+    sql = """
+    select distinct spot_id
+    from photos_aiclassification
+    where id > %s
+    """
+    return query('changed_aiclassification', sql, last_id)
+
+def changed_spots(state: dict) -> Set[int]:
+    """
+    Returns the ids of the spots updated since the watermark, or with new rows in photos_aiclassification.
+    """
+    changed = execute_query_mysql(query_changed_gamma(state['watermark']), connection_params_gamma)
+    changed_ai = execute_query_postgres(query_changed_aiclassification(state['last_aiclassification_id']), connection_params_geo)
+    return set(changed['spot_id'].dropna().astype(int)) | set(changed_ai['spot_id'].dropna().astype(int))
+
+def active_spots(ids: Set[int] = None) -> List[int]:
+    """
+    Returns the active spots among ids plus the active children of the complexes in ids,
+    whose photos are inherited. Without ids returns the whole active catalog.
+    """
+    if ids is None:
+        active = "select id from spots where spot_state = 1"
+    elif len(ids) == 0:
+        return []
+    else:
+        active = query('active_spots', """
+        select id from spots
+        where spot_state = 1
+        and (id = ANY(%s) or parent_id = ANY(%s))
+        """, ids, ids)
+    spots = execute_query_mysql(active, connection_params_gamma)
+    return sorted(spots['id'].astype(int))
+
+def current_state() -> dict:
+    # the latest updated_at itself is the watermark, so it never runs ahead of the rows and needs no clock function
+    latest = execute_query_mysql("select max(updated_at) as watermark from spots", connection_params_gamma)
+    last_ai = execute_query_postgres("select coalesce(max(id), 0) as last_id from photos_aiclassification", connection_params_geo)
+    return {
+        'watermark': format_watermark(latest['watermark'][0]),
+        'last_aiclassification_id': int(last_ai['last_id'][0])
+    }
+
+def rescore_incremental(state_path: str = INCREMENTAL_STATE_PATH, chunk_size: int = 1000) -> Tuple[List[dict], dict]:
+    """
+    Evaluates the active spots whose inputs changed since the last run, the first run evaluates the whole catalog.
+    The new state is saved only after all the spots were evaluated, so a failed run is repeated entirely.
+
+    Args:
+        state_path (str): json file with the state of the last run
+        chunk_size (int): number of spots per batch of evaluation_spots
+
+    Returns:
+        Tuple[List[dict], dict]: the json of every evaluated spot and the new state
+    """
+    state = load_state(state_path)
+    # taken before looking for changes, so changes made during the run are picked up by the next one
+    new_state = current_state()
+    if state:
+        changed = changed_spots(state)
+        # changed complexes must not be served from the photos cache of a long running worker
+        complex_photos.invalidate(changed)
+        ids = active_spots(changed)
+    else:
+        ids = active_spots()
+    results = evaluation_spots(ids, chunk_size=chunk_size)
+    save_state(new_state, state_path)
+    return results, new_state
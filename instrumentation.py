@@ -0,0 +1,170 @@
+"""
+Timing and query instrumentation of the scorer.
+
+Spans are opened around every execute_query_* call and every evaluation stage of quality_spot. They
+record a latency histogram, the rows and bytes fetched and the errors, grouped by span name and labels.
+Instrumentation is disabled by default: span() then returns a shared no-op object and the decorated
+functions are called directly.
+
+    import instrumentation
+    instrumentation.enable()
+    evaluation_spots(ids)
+    instrumentation.export_prometheus('quality_metrics.prom')
+"""
+
+import contextvars
+import functools
+import json
+import threading
+import time
+from typing import Dict, Tuple
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+_enabled = False
+_lock = threading.Lock()
+_metrics: Dict[Tuple[str, tuple], dict] = {}
+# name of the innermost open span, used as the stage label of the queries
+_current_stage = contextvars.ContextVar('current_stage', default='')
+
+
+def enable(enabled: bool = True):
+    global _enabled
+    _enabled = enabled
+
+def is_enabled() -> bool:
+    return _enabled
+
+def reset():
+    with _lock:
+        _metrics.clear()
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __bool__(self):
+        return False
+
+    def record(self, rows: int = 0, nbytes: int = 0):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """Times a block and records it when the block ends, `record` adds rows and bytes fetched."""
+
+    __slots__ = ('name', 'labels', 'rows', 'nbytes', '_start', '_token')
+
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+        self.rows = 0
+        self.nbytes = 0
+
+    def __enter__(self):
+        self._token = _current_stage.set(self.name)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        _current_stage.reset(self._token)
+        _observe(self.name, self.labels, elapsed, self.rows, self.nbytes, exc_type is not None)
+        return False
+
+    def __bool__(self):
+        return True
+
+    def record(self, rows: int = 0, nbytes: int = 0):
+        self.rows += rows
+        self.nbytes += nbytes
+
+
+def span(name: str, **labels):
+    """
+    Context manager timing a block. Spans named 'query' get the name of the enclosing span as `stage` label.
+    Returns a falsy no-op object when instrumentation is disabled.
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    if name == 'query':
+        labels['stage'] = _current_stage.get()
+    return Span(name, labels)
+
+def instrumented(name: str):
+    """Decorator opening a span named `name` around every call of the function."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with Span(name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def dataframe_nbytes(df) -> int:
+    # memory of the rows fetched, only computed when instrumentation is enabled
+    return int(df.memory_usage(index=False, deep=True).sum())
+
+def _observe(name: str, labels: dict, elapsed: float, rows: int, nbytes: int, error: bool):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        metric = _metrics.get(key)
+        if metric is None:
+            metric = _metrics[key] = {'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0,
+                                      'rows': 0, 'bytes': 0, 'errors': 0}
+        for i, bound in enumerate(BUCKETS):
+            if elapsed <= bound:
+                metric['buckets'][i] += 1
+                break
+        metric['count'] += 1
+        metric['sum'] += elapsed
+        metric['rows'] += rows
+        metric['bytes'] += nbytes
+        metric['errors'] += int(error)
+
+
+def snapshot() -> list:
+    """Copy of the metrics: one dict per span name and labels."""
+    with _lock:
+        return [dict(metric, span=name, labels=dict(labels), buckets=list(metric['buckets']))
+                for (name, labels), metric in _metrics.items()]
+
+def export_json(path: str):
+    with open(path, 'w') as f:
+        json.dump({'buckets': [str(b) for b in BUCKETS], 'spans': snapshot()}, f, indent=2)
+
+def export_prometheus(path: str):
+    """Writes the metrics in the Prometheus text exposition format."""
+    lines = [
+        '# TYPE quality_span_duration_seconds histogram',
+    ]
+    counters = []
+    for metric in snapshot():
+        labels = dict(metric['labels'], span=metric['span'])
+        label_text = ','.join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+        cumulative = 0
+        for bound, count in zip(BUCKETS, metric['buckets']):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'quality_span_duration_seconds_bucket{{{label_text},le="{le}"}} {cumulative}')
+        lines.append(f'quality_span_duration_seconds_sum{{{label_text}}} {metric["sum"]}')
+        lines.append(f'quality_span_duration_seconds_count{{{label_text}}} {metric["count"]}')
+        counters.append((label_text, metric))
+    for counter, field in (('quality_span_rows_total', 'rows'), ('quality_span_bytes_total', 'bytes'),
+                           ('quality_span_errors_total', 'errors')):
+        lines.append(f'# TYPE {counter} counter')
+        for label_text, metric in counters:
+            lines.append(f'{counter}{{{label_text}}} {metric[field]}')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
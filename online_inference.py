@@ -0,0 +1,162 @@
+"""
+Online inference of the per-segment inquiry-probability models trained by segment_training.
+
+The models are loaded once. Inputs are encoded with a plan compiled from the saved feature_columns
+(positions of the numeric columns and of every one-hot value) instead of pd.get_dummies + reindex,
+and the random forests can be flattened into numpy arrays that evaluate all the trees of a micro-batch
+at once instead of going through predict_proba.
+
+    predictor = OnlinePredictor('segment_models/thresholds_number_of_inquiries.json')
+    predictor.predict({'spot_sector': 'Industrial', 'spot_modality': 'Rent', 'spot_type': 'Single', ...})
+"""
+
+from typing import Dict, List, NamedTuple, Union
+
+import joblib
+import numpy as np
+
+from segment_training import COMMON_FEATURES, PRICE_FEATURES, load_threshold_map
+
+RAW_FEATURES = COMMON_FEATURES + [c for columns in PRICE_FEATURES.values() for c in columns]
+
+
+class EncodingPlan(NamedTuple):
+    """
+    Positions of the input values in the encoded row.
+
+    - size: number of feature_columns
+    - numeric: (input column, position) of the columns used as they are
+    - one_hot: input column -> {value: position} of the dummy columns
+    """
+    size: int
+    numeric: List[tuple]
+    one_hot: Dict[str, Dict[str, int]]
+
+    def encode(self, rows: List[dict]) -> np.ndarray:
+        """Same matrix as pd.get_dummies(...).reindex(columns=feature_columns, fill_value=0), missing values are 0."""
+        X = np.zeros((len(rows), self.size), dtype=np.float64)
+        for i, row in enumerate(rows):
+            for column, position in self.numeric:
+                value = row.get(column)
+                if value is not None and value == value:
+                    X[i, position] = value
+            for column, positions in self.one_hot.items():
+                position = positions.get(str(row.get(column)))
+                if position is not None:
+                    X[i, position] = 1
+        return X
+
+def compile_encoding_plan(feature_columns: List[str], raw_features: List[str] = RAW_FEATURES) -> EncodingPlan:
+    """Builds the plan of the columns produced by pd.get_dummies on raw_features."""
+    numeric, one_hot = [], {}
+    for position, name in enumerate(feature_columns):
+        if name in raw_features:
+            numeric.append((name, position))
+            continue
+        # dummies are named <column>_<value>, the longest matching column wins
+        column = max((c for c in raw_features if name.startswith(f'{c}_')), key=len, default=None)
+        if column is None:
+            raise ValueError(f'feature column {name} does not come from {raw_features}')
+        one_hot.setdefault(column, {})[name[len(column) + 1:]] = position
+    return EncodingPlan(len(feature_columns), numeric, one_hot)
+
+
+class CompactForest:
+    """
+    Trees of a fitted RandomForestClassifier flattened into arrays, predict_proba of the positive class
+    evaluated for all the rows and trees at once, one step per level of depth.
+    """
+
+    def __init__(self, model, positive_class=1):
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        classes = list(model.classes_)
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+        self.roots = offsets.astype(np.int64)
+        self.feature = np.concatenate([tree.feature for tree in trees]).astype(np.int64)
+        self.threshold = np.concatenate([tree.threshold for tree in trees])
+        self.left = np.concatenate([np.where(tree.children_left >= 0, tree.children_left + offset, -1)
+                                    for tree, offset in zip(trees, offsets)])
+        self.right = np.concatenate([np.where(tree.children_right >= 0, tree.children_right + offset, -1)
+                                     for tree, offset in zip(trees, offsets)])
+        self.is_leaf = self.left < 0
+        # leaves are nodes without children, their feature is negative
+        self.feature[self.is_leaf] = 0
+        values = np.concatenate([tree.value[:, 0, :] for tree in trees])
+        totals = values.sum(axis=1)
+        if positive_class in classes:
+            self.leaf_proba = np.divide(values[:, classes.index(positive_class)], totals,
+                                        out=np.zeros(len(values)), where=totals > 0)
+        else:
+            self.leaf_proba = np.zeros(len(values))
+        self.depth = max(tree.max_depth for tree in trees)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        # sklearn compares float32 inputs with float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(self.is_leaf[nodes], nodes, np.where(go_left, self.left[nodes], self.right[nodes]))
+        return self.leaf_proba[nodes].mean(axis=1)
+
+
+class SegmentModel(NamedTuple):
+    plan: EncodingPlan
+    model: object
+    forest: Union[CompactForest, None]
+    threshold: float
+
+    def predict_proba(self, rows: List[dict]) -> np.ndarray:
+        X = self.plan.encode(rows)
+        if self.forest is not None:
+            return self.forest.predict_proba(X)
+        return self.model.predict_proba(X)[:, list(self.model.classes_).index(1)]
+
+
+class OnlinePredictor:
+    """
+    Per-segment models loaded from a threshold map saved by segment_training.build_threshold_map.
+
+    Args:
+        threshold_map_path (str): json of build_threshold_map
+        compact (bool): evaluate the forests with CompactForest instead of predict_proba
+    """
+
+    def __init__(self, threshold_map_path: str, compact: bool = True):
+        thresholds, paths = load_threshold_map(threshold_map_path)
+        self.segments: Dict[tuple, SegmentModel] = {}
+        for segment, path in paths.items():
+            saved = joblib.load(path)
+            model = saved['model']
+            self.segments[segment] = SegmentModel(compile_encoding_plan(saved['feature_columns']), model,
+                                                  CompactForest(model) if compact else None, thresholds[segment])
+
+    def predict(self, spots: Union[dict, List[dict]]) -> Union[dict, List[dict]]:
+        """
+        Scores a spot or a micro-batch of spots with the model of their (spot_sector, spot_modality).
+
+        Returns:
+            dict or List[dict]: spot_id, probability, quality_score (probability * 100 rounded to 1 decimal) and
+            has_info (probability >= threshold of the segment), None values for spots without a model
+        """
+        single = isinstance(spots, dict)
+        spots = [spots] if single else list(spots)
+        results = [None] * len(spots)
+        by_segment: Dict[tuple, List[int]] = {}
+        for i, spot in enumerate(spots):
+            by_segment.setdefault((spot.get('spot_sector'), spot.get('spot_modality')), []).append(i)
+
+        for segment, positions in by_segment.items():
+            segment_model = self.segments.get(segment)
+            if segment_model is None:
+                for i in positions:
+                    results[i] = {'spot_id': spots[i].get('spot_id'), 'probability': None, 'quality_score': None,
+                                  'has_info': None}
+                continue
+            probabilities = segment_model.predict_proba([spots[i] for i in positions])
+            for i, probability in zip(positions, probabilities.tolist()):
+                results[i] = {'spot_id': spots[i].get('spot_id'), 'probability': probability,
+                              'quality_score': float(np.round(probability * 100, 1)),
+                              'has_info': probability >= segment_model.threshold}
+        return results[0] if single else results
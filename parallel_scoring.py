@@ -0,0 +1,55 @@
+"""
+Multi-process execution of evaluation_spots for the CPU-bound pandas stages.
+
+The ids are split into shards that are scored by a pool of worker processes. Every worker opens its
+own database connections with the connection params of the parent and receives its qa_limites
+snapshot, so the range tables are not loaded again per worker. Results come back in the order of the ids.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import quality_spot
+from qa_limits import QALimitsSnapshot
+
+
+def init_worker(snapshot: QALimitsSnapshot, connection_params_gamma: dict, connection_params_geo: dict):
+    # the pools inherited from a forked parent are dropped by db_pool without closing their connections,
+    # spawned workers get the connection params of the parent here
+    quality_spot.connection_params_gamma = connection_params_gamma
+    quality_spot.connection_params_geo = connection_params_geo
+    quality_spot.complex_photos.invalidate()
+    quality_spot.qa_limits.set_snapshot(snapshot)
+
+def score_shard(ids: List[int]) -> List[dict]:
+    return quality_spot.evaluation_spots(ids, chunk_size=len(ids) or 1)
+
+def evaluation_spots_parallel(ids: List[int], workers: Optional[int] = None, shard_size: int = 1000,
+                              start_method: str = 'spawn') -> List[dict]:
+    """
+    Evaluates the spots in worker processes.
+
+    Args:
+        ids (List[int]): ids of the spots
+        workers (int): number of processes, by default the number of cores
+        shard_size (int): spots per task, also the chunk of the batch queries
+        start_method (str): multiprocessing start method of the workers
+
+    Returns:
+        List[dict]: the json of evaluation_spot for every spot, in the order of ids
+    """
+    ids = [int(i) for i in ids]
+    shards = [ids[start:start + shard_size] for start in range(0, len(ids), shard_size)]
+    workers = min(workers or os.cpu_count() or 1, max(len(shards), 1))
+    snapshot = quality_spot.qa_limits.snapshot()
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method),
+                             initializer=init_worker,
+                             initargs=(snapshot, quality_spot.connection_params_gamma,
+                                       quality_spot.connection_params_geo)) as executor:
+        for shard_results in executor.map(score_shard, shards):
+            results.extend(shard_results)
+    return results
@@ -0,0 +1,163 @@
+"""
+Photo scoring of many spots at once from a prefetched index of classified and public photos.
+
+The index holds the AI tags of the photos of a set of spots (and of their complexes) and the ids
+of the public photos, so every spot is resolved to its own photos or to the photos of its parent
+without more queries.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from variables_by_sector import photos_map, photos_quantity_bins, photos_quantity_scores
+
+# Maximum number of complexes kept in ComplexPhotoCache
+COMPLEX_CACHE_SIZE = 10000
+# Seconds a complex is served from ComplexPhotoCache before its photos are fetched again
+COMPLEX_CACHE_TTL = 600
+
+
+def photos_quantity_score(fotos_publicas) -> np.ndarray:
+    """Score of the number of public photos: 0, 1, 2-3, 4-5, 6-9 and 10+ photos."""
+    return np.array(photos_quantity_scores)[np.digitize(np.asarray(fotos_publicas), photos_quantity_bins)]
+
+
+def owner_photo_scores(photos: pd.DataFrame) -> pd.DataFrame:
+    """
+    Scores of the photos of every owner (spot or complex), photos must be already filtered by the public photos.
+
+    Returns:
+        pd.DataFrame: indexed by spot_id with fotos (before the complex halving), fotos_publicas and fotos_qa
+    """
+    photos = photos.assign(score_name_photos=photos['name'].map(photos_map))
+    grouped = photos.groupby('spot_id')
+    total = grouped.size() * 3
+    qa = grouped['score_name_photos'].sum()
+    return pd.DataFrame({
+        'fotos': abs((total - qa) / total * 100),
+        'fotos_publicas': grouped['photo_id'].nunique(),
+        'fotos_qa': grouped['name'].agg(list)
+    })
+
+
+class PhotoIndex:
+    """
+    Index spot_id -> public photo ids -> AI tags.
+
+    Args:
+        photos (pd.DataFrame): rows of photos_aiclassification with spot_id, photo_id and name (one row per tag)
+            for the spots and for their complexes
+        public_ids (Iterable[int]): ids of the photos that are public (not deleted)
+    """
+
+    def __init__(self, photos: pd.DataFrame, public_ids: Iterable[int]):
+        self.classified = pd.Index(photos['spot_id'].unique())
+        public_photos = photos[photos['photo_id'].isin(set(public_ids))]
+        self.owner_scores = owner_photo_scores(public_photos)
+
+    def resolve(self, spot_ids, parent_ids) -> pd.DataFrame:
+        """
+        Owner of the photos of every spot: the spot itself when it has classified photos, otherwise its complex.
+
+        Returns:
+            pd.DataFrame: indexed by spot_id with owner_id (NaN without photos) and complex_images
+        """
+        spot_ids = pd.Series(np.asarray(spot_ids))
+        parent_ids = pd.Series(np.asarray(parent_ids, dtype=object))
+        own = spot_ids.isin(self.classified)
+        parent = ~own & parent_ids.notnull() & parent_ids.isin(self.classified)
+        owner_id = spot_ids.where(own, parent_ids.where(parent))
+        return pd.DataFrame({
+            'owner_id': owner_id.to_numpy(),
+            'complex_images': parent.astype(int).to_numpy()
+        }, index=spot_ids.to_numpy())
+
+    def scores(self, spot_ids, parent_ids) -> pd.DataFrame:
+        """
+        Photo scores of many spots.
+
+        Returns:
+            pd.DataFrame: indexed by spot_id with has_photos, complex_images, fotos, fotos_cantidad,
+            fotos_publicas and fotos_qa. Spots with classified photos but none public get zeros.
+        """
+        result = self.resolve(spot_ids, parent_ids)
+        result['has_photos'] = result['owner_id'].notnull()
+        # -1 is not an owner, spots without photos get NaN scores that are filled below
+        owner_scores = self.owner_scores.reindex(result['owner_id'].fillna(-1).astype(np.int64).to_numpy())
+        result['fotos'] = owner_scores['fotos'].fillna(0).to_numpy()
+        result.loc[result['complex_images'] == 1, 'fotos'] = result['fotos'] / 2
+        result['fotos_publicas'] = owner_scores['fotos_publicas'].fillna(0).astype(int).to_numpy()
+        result['fotos_qa'] = [names if isinstance(names, list) else [] for names in owner_scores['fotos_qa']]
+        result['fotos_cantidad'] = photos_quantity_score(result['fotos_publicas'])
+        return result
+
+
+class ComplexPhotoCache:
+    """
+    LRU cache of the classified photos and public photos of the complexes, so the children of a
+    complex reuse the photos fetched for the first one. Complexes without photos are cached too.
+    Entries expire after ttl seconds, so long running processes see new photos of a complex.
+
+    Args:
+        max_size (int): maximum number of complexes, the least recently used are evicted
+        ttl (float): seconds before a complex is fetched again
+    """
+
+    def __init__(self, max_size: int = COMPLEX_CACHE_SIZE, ttl: float = COMPLEX_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    def get(self, parent_id: int) -> Optional[Tuple[pd.DataFrame, pd.DataFrame]]:
+        """Returns (photos, public_photos) of the complex or None when it is not cached or expired."""
+        with self._lock:
+            entry = self._entries.get(int(parent_id))
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                del self._entries[int(parent_id)]
+                self.stats['expirations'] += 1
+                entry = None
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(int(parent_id))
+            self.stats['hits'] += 1
+            return entry[1:]
+
+    def get_many(self, parent_ids: Iterable[int]) -> Tuple[Dict[int, Tuple[pd.DataFrame, pd.DataFrame]], List[int]]:
+        """Returns the cached complexes and the list of the ones that are missing."""
+        found, missing = {}, []
+        for parent_id in parent_ids:
+            entry = self.get(parent_id)
+            if entry is None:
+                missing.append(int(parent_id))
+            else:
+                found[int(parent_id)] = entry
+        return found, missing
+
+    def put(self, parent_id: int, photos: pd.DataFrame, public_photos: pd.DataFrame):
+        """Caches the photos of a complex, public_photos must only hold photos that are in photos."""
+        with self._lock:
+            self._entries[int(parent_id)] = (time.time(), photos, public_photos)
+            self._entries.move_to_end(int(parent_id))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def invalidate(self, parent_ids: Optional[Iterable[int]] = None):
+        """Drops the given complexes, or all of them."""
+        with self._lock:
+            if parent_ids is None:
+                self._entries.clear()
+            else:
+                for parent_id in parent_ids:
+                    self._entries.pop(int(parent_id), None)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,146 @@
+"""
+Named, parameterized statements run by execute_query_mysql / execute_query_postgres.
+
+The builders of querys return a Query (name, sql, params) instead of SQL with the values pasted in.
+The sql uses %s placeholders and `= ANY(%s)` for a list of values:
+
+- MySQL: the list becomes `IN (%s, ...)` and the statement runs in a server-side prepared cursor that
+  stays open with its pooled connection, so the same statement is parsed once per connection. Lists are
+  padded to a power of two length (repeating their last value), so lists of any length share a few statements.
+- Postgres: the statement is created once per connection with PREPARE (lists are arrays) and run
+  with EXECUTE, so the plan is reused across calls.
+- SQLite (the local stand-in): the list becomes `IN (?, ...)`, sqlite3 caches the compiled statements.
+"""
+
+import re
+import sqlite3
+import zlib
+from typing import NamedTuple, Tuple, Union
+
+# Prepared statements kept per connection, the least recently used is closed beyond this
+STATEMENT_CACHE_SIZE = 100
+
+_PLACEHOLDER = re.compile(r'=\s*ANY\(%s\)|%s')
+
+
+class Query(NamedTuple):
+    """
+    - name: name of the statement, also used for the prepared statement on Postgres
+    - sql: SQL with %s placeholders and `= ANY(%s)` for lists
+    - params: values of the placeholders, lists for the ANY placeholders
+    """
+    name: str
+    sql: str
+    params: tuple = ()
+
+
+def plain(value):
+    # numpy scalars are not understood by the drivers
+    if isinstance(value, (list, tuple, set, frozenset)) or (hasattr(value, 'tolist') and hasattr(value, '__len__')):
+        return [plain(v) for v in value]
+    return value.item() if hasattr(value, 'item') else value
+
+def query(name: str, sql: str, *params) -> Query:
+    return Query(name, sql, tuple(plain(p) for p in params))
+
+def padded_length(n: int) -> int:
+    # power of two >= n, a repeated value does not change the rows matched by IN
+    return 1 << (n - 1).bit_length()
+
+def render_in_list(q: Query, placeholder: str = '%s') -> Tuple[str, tuple]:
+    """SQL and flat params with every `= ANY(%s)` expanded to `IN (...)` of padded_length, for MySQL and SQLite."""
+    params = iter(q.params)
+    flat = []
+
+    def replace(match):
+        value = next(params)
+        if match.group(0) == '%s':
+            flat.append(value)
+            return placeholder
+        if not value:
+            # IN () is not valid SQL, NULL matches no row
+            return 'IN (NULL)'
+        size = padded_length(len(value))
+        flat.extend(value)
+        flat.extend([value[-1]] * (size - len(value)))
+        return f"IN ({', '.join([placeholder] * size)})"
+
+    return _PLACEHOLDER.sub(replace, q.sql), tuple(flat)
+
+def render_postgres(q: Query) -> Tuple[str, str, str]:
+    """Name, PREPARE and EXECUTE statements of a query, the name changes with the sql."""
+    count = 0
+
+    def replace(match):
+        nonlocal count
+        count += 1
+        return f'= ANY(${count})' if match.group(0) != '%s' else f'${count}'
+
+    body = _PLACEHOLDER.sub(replace, q.sql)
+    name = f'{q.name}_{zlib.crc32(q.sql.encode()):08x}'
+    arguments = f" ({', '.join(['%s'] * count)})" if count else ''
+    return name, f'PREPARE {name} AS {body}', f'EXECUTE {name}{arguments}'
+
+
+def execute_mysql(pool, connection, q: Query):
+    """
+    Runs q on a MySQL connection of pool with a prepared cursor kept for the connection.
+
+    Returns:
+        cursor, close: the cursor with the results and whether the caller must close it
+    """
+    sql, params = render_in_list(q)
+    cache = pool.statements(connection)
+    entry = cache.get(sql)
+    if entry is None:
+        # mysql-connector prepares again unless the very same str object is executed (an `is` check),
+        # so the cursor is kept with the sql it was prepared with
+        entry = cache[sql] = (connection.cursor(prepared=True), sql)
+        if len(cache) > STATEMENT_CACHE_SIZE:
+            _, (old, _) = cache.popitem(last=False)
+            old.close()
+    else:
+        cache.move_to_end(sql)
+    cursor, statement = entry
+    cursor.execute(statement, params)
+    return cursor, False
+
+def execute_postgres(pool, connection, q: Query):
+    """Runs q on a Postgres connection of pool, preparing it the first time, see execute_mysql."""
+    name, prepare, execute = render_postgres(q)
+    cache = pool.statements(connection)
+    cursor = connection.cursor()
+    if name not in cache:
+        cursor.execute(prepare)
+        cache[name] = True
+        if len(cache) > STATEMENT_CACHE_SIZE:
+            old, _ = cache.popitem(last=False)
+            cursor.execute(f'DEALLOCATE {old}')
+    else:
+        cache.move_to_end(name)
+    cursor.execute(execute, q.params)
+    return cursor, True
+
+def execute_sqlite(connection, q: Query):
+    sql, params = render_in_list(q, '?')
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    return cursor, True
+
+def execute(pool, connection, q: Union[str, Query], dialect: str):
+    """
+    Runs a Query, or plain SQL without parameters, on a connection of pool.
+    dialect is 'mysql' or 'postgres', connections of the SQLite stand-in are detected.
+
+    Returns:
+        cursor, close: the cursor with the results and whether the caller must close it
+    """
+    if isinstance(q, str):
+        cursor = connection.cursor()
+        cursor.execute(q)
+        return cursor, True
+    if isinstance(connection, sqlite3.Connection):
+        return execute_sqlite(connection, q)
+    if dialect == 'mysql':
+        return execute_mysql(pool, connection, q)
+    return execute_postgres(pool, connection, q)
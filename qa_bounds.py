@@ -0,0 +1,231 @@
+"""
+Builds the qa_limites_p_r, qa_limites_p_s and qa_limites_a_s range tables from lk_spots.
+
+The bounds of every sector are the 0.01 and 0.90 quantiles of the rent and sale price per m2 and of
+the area, the filters of prediccion_by_historic.ipynb. The active spots are read in pages of spot_id and
+grouped by sector once per page. Values are kept exactly up to EXACT_MAX_VALUES per sector and modality,
+larger groups are folded into KLL quantile sketches of bounded size.
+
+Each build replaces the three tables in one transaction and adds a row to qa_limites_versions, with
+the bounds kept in qa_limites_history. quality_spot.qa_limits checks that version and reloads the
+new bounds without a restart.
+
+    python qa_bounds.py
+"""
+
+import argparse
+import random
+import sqlite3
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from credentials_geo import connection_params_geo
+from db_pool import postgres_pool
+from qa_limits import QA_LIMITS_COLUMNS
+from quality_spot import execute_query_postgres
+from querys import query_bounds_source
+
+QUANTILES = (0.01, 0.90)
+# Column of lk_spots of every modality of qa_limits
+BOUNDS_COLUMNS = {'rent': 'spot_price_sqm_mxn_rent', 'sale': 'spot_price_sqm_mxn_sale', 'area': 'spot_area_in_sqm'}
+QA_TABLES = {'rent': 'qa_limites_p_r', 'sale': 'qa_limites_p_s', 'area': 'qa_limites_a_s'}
+# Spots read per query
+PAGE_SIZE = 50000
+# Values kept exactly per (sector, modality) before switching to a sketch
+EXACT_MAX_VALUES = 1000000
+# Size of the compactors of the sketch, the rank error is around 1.7 / KLL_K
+KLL_K = 400
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch: level h holds items of weight 2**h, a full level is sorted and every other
+    item (random offset) moves up one level.
+    """
+
+    def __init__(self, k: int = KLL_K, seed: int = 0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self._random = random.Random(seed)
+
+    def _capacity(self, level: int) -> int:
+        # lower levels are smaller, (2/3)**depth like the original paper
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=float)
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: 'KLLSketch'):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.count += other.count
+        self._compress()
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            if len(self.levels[h]) > self._capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(self.levels[h])
+                # an odd item stays in its level
+                keep, items = (items[:1], items[1:]) if len(items) % 2 else (items[:0], items)
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], items[self._random.randint(0, 1)::2]])
+                self.levels[h] = keep
+            h += 1
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return np.nan
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items_h), 2.0 ** h) for h, items_h in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        return float(items[order][np.searchsorted(cumulative, q * cumulative[-1], side='left').clip(max=len(items) - 1)])
+
+
+class BoundsAccumulator:
+    """Values of every (sector, modality), exact until EXACT_MAX_VALUES and a KLLSketch beyond."""
+
+    def __init__(self, exact_max_values: int = EXACT_MAX_VALUES, k: int = KLL_K):
+        self.exact_max_values = exact_max_values
+        self.k = k
+        self.exact: Dict[tuple, list] = {}
+        self.sizes: Dict[tuple, int] = {}
+        self.sketches: Dict[tuple, KLLSketch] = {}
+
+    def add(self, page: pd.DataFrame):
+        """Adds a page of lk_spots, non positive and missing values are ignored."""
+        page = page.assign(sector=page['spot_sector'].astype(str).str.strip().str.lower())
+        for modality, column in BOUNDS_COLUMNS.items():
+            values = pd.to_numeric(page[column], errors='coerce')
+            valid = page.loc[values > 0, ['sector']].assign(value=values[values > 0])
+            for sector, group in valid.groupby('sector')['value']:
+                self._add((sector, modality), group.to_numpy(dtype=float))
+
+    def _add(self, key: tuple, values: np.ndarray):
+        sketch = self.sketches.get(key)
+        if sketch is not None:
+            sketch.update(values)
+            return
+        self.exact.setdefault(key, []).append(values)
+        self.sizes[key] = self.sizes.get(key, 0) + len(values)
+        if self.sizes[key] > self.exact_max_values:
+            sketch = self.sketches[key] = KLLSketch(self.k)
+            sketch.update(np.concatenate(self.exact.pop(key)))
+
+    def bounds(self, quantiles: Tuple[float, float] = QUANTILES) -> Dict[str, pd.DataFrame]:
+        """Tables 'rent', 'sale' and 'area' with the columns of qa_limits.QA_LIMITS_COLUMNS."""
+        rows = {modality: [] for modality in BOUNDS_COLUMNS}
+        for (sector, modality), parts in self.exact.items():
+            lower, upper = np.quantile(np.concatenate(parts), quantiles)
+            rows[modality].append((sector, float(lower), float(upper)))
+        for (sector, modality), sketch in self.sketches.items():
+            rows[modality].append((sector, sketch.quantile(quantiles[0]), sketch.quantile(quantiles[1])))
+        return {modality: pd.DataFrame(sorted(rows[modality]), columns=['sector', *QA_LIMITS_COLUMNS[modality]])
+                for modality in BOUNDS_COLUMNS}
+
+    @property
+    def approximate(self) -> bool:
+        return bool(self.sketches)
+
+
+def source_pages(page_size: int = PAGE_SIZE) -> Iterator[pd.DataFrame]:
+    # active spots of lk_spots by pages of spot_id
+    last_id = 0
+    while True:
+        page = execute_query_postgres(query_bounds_source(last_id, page_size), connection_params_geo)
+        if page is None or page.empty:
+            return
+        yield page
+        last_id = int(page['spot_id'].max())
+
+def compute_bounds(pages: Iterator[pd.DataFrame], quantiles: Tuple[float, float] = QUANTILES,
+                   exact_max_values: int = EXACT_MAX_VALUES) -> Tuple[Dict[str, pd.DataFrame], dict]:
+    """
+    Computes the bounds of every sector in one pass over the pages.
+
+    Returns:
+        Tuple[Dict[str, pd.DataFrame], dict]: the 'rent', 'sale' and 'area' tables and the number of
+        spots read and whether any bound is approximate
+    """
+    accumulator = BoundsAccumulator(exact_max_values)
+    n_spots = 0
+    for page in pages:
+        accumulator.add(page)
+        n_spots += len(page)
+    return accumulator.bounds(quantiles), {'n_spots': n_spots, 'approximate': accumulator.approximate}
+
+def write_bounds(tables: Dict[str, pd.DataFrame], info: dict, connection_params: dict = None) -> int:
+    """
+    Replaces the range tables with tables and records a new version, all in one transaction.
+
+    Returns:
+        int: the new version
+    """
+    connection_params = connection_params or connection_params_geo
+    with postgres_pool(connection_params).connection() as connection:
+        # the local SQLite stand-in uses ? placeholders
+        p = '?' if isinstance(connection, sqlite3.Connection) else '%s'
+        cursor = connection.cursor()
+        try:
+            cursor.execute("""
+            create table if not exists qa_limites_versions (
+                version integer primary key, built_at text, n_spots integer, approximate integer)
+            """)
+            cursor.execute("""
+            create table if not exists qa_limites_history (
+                version integer, modality text, sector text, lower_bound real, upper_bound real)
+            """)
+            cursor.execute("select coalesce(max(version), 0) from qa_limites_versions")
+            version = int(cursor.fetchone()[0]) + 1
+            for modality, table in tables.items():
+                lower, upper = QA_LIMITS_COLUMNS[modality]
+                rows = list(table[['sector', lower, upper]].itertuples(index=False, name=None))
+                cursor.execute(f"delete from {QA_TABLES[modality]}")
+                cursor.executemany(f"insert into {QA_TABLES[modality]} (sector, {lower}, {upper}) values ({p}, {p}, {p})", rows)
+                cursor.executemany(f"insert into qa_limites_history values ({p}, {p}, {p}, {p}, {p})",
+                                   [(version, modality, *row) for row in rows])
+            cursor.execute(f"insert into qa_limites_versions values ({p}, {p}, {p}, {p})",
+                           (version, datetime.now(timezone.utc).isoformat(timespec='seconds'), info['n_spots'],
+                            int(info['approximate'])))
+            connection.commit()
+        finally:
+            cursor.close()
+    return version
+
+def build_qa_limits(page_size: int = PAGE_SIZE, exact_max_values: int = EXACT_MAX_VALUES,
+                    dry_run: bool = False) -> Optional[int]:
+    """Computes the bounds from lk_spots and writes them, returns the new version (None with dry_run)."""
+    tables, info = compute_bounds(source_pages(page_size), exact_max_values=exact_max_values)
+    for modality, table in tables.items():
+        print(f'{QA_TABLES[modality]}:\n{table.to_string(index=False)}')
+    print(f"{info['n_spots']} spots, {'approximate' if info['approximate'] else 'exact'} quantiles")
+    if dry_run:
+        return None
+    version = write_bounds(tables, info)
+    print(f'qa_limites version {version} written')
+    return version
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Regenerates the qa_limites_* range tables from lk_spots.')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+    parser.add_argument('--exact-max-values', type=int, default=EXACT_MAX_VALUES,
+                        help='values per sector and modality kept exactly before using a sketch')
+    parser.add_argument('--dry-run', action='store_true', help='print the bounds without writing them')
+    args = parser.parse_args(argv)
+    build_qa_limits(args.page_size, args.exact_max_values, args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+In-process cache of the qa_limites_p_r, qa_limites_p_s and qa_limites_a_s range tables.
+
+The tables hold a few rows per sector, so they are loaded once and the price / area checks
+are done locally instead of sending a `x BETWEEN lower AND upper` query per spot.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+# Seconds before the tables are loaded again
+QA_LIMITS_TTL = 3600
+# Seconds between checks of the version of the tables written by qa_bounds
+QA_LIMITS_VERSION_CHECK_INTERVAL = 60
+
+# Columns with the lower and upper bound of every table, keyed by modality
+QA_LIMITS_COLUMNS = {
+    'rent': ('precio_m2_inferior', 'precio_m2_superior'),
+    'sale': ('precio_m2_inferior', 'precio_m2_superior'),
+    'area': ('area_limite_inferior', 'area_limite_superior')
+}
+
+
+class QALimitsSnapshot(NamedTuple):
+    """
+    Immutable version of the range tables.
+
+    - version: increases every time the tables are loaded
+    - loaded_at: unix time of the load
+    - sectors: sector name -> row of the bounds arrays
+    - bounds: modality ('rent', 'sale', 'area') -> array (n_sectors + 1, 2) with lower and upper bounds,
+      the last row is NaN and is used for unknown sectors
+    - source_version: version of the tables written by qa_bounds when they were loaded, None if unknown
+    """
+    version: int
+    loaded_at: float
+    sectors: Dict[str, int]
+    bounds: Dict[str, np.ndarray]
+    source_version: Optional[int] = None
+
+    def in_range(self, modality: str, values, sectors) -> Union[bool, np.ndarray]:
+        """
+        Evaluates `values BETWEEN lower AND upper` with the bounds of the sector of every value.
+        Works with a single value and sector or with arrays, unknown sectors and NaN values are out of range.
+        """
+        scalar = np.ndim(values) == 0 and np.ndim(sectors) == 0
+        values = np.asarray(values, dtype=float)
+        unknown = len(self.sectors)
+        idx = np.vectorize(lambda s: self.sectors.get(s, unknown), otypes=[int])(np.asarray(sectors, dtype=object))
+        bounds = self.bounds[modality][idx]
+        result = (values >= bounds[..., 0]) & (values <= bounds[..., 1])
+        return bool(result) if scalar else result
+
+    def price_in_range(self, price_m2, sectors, modality) -> Union[bool, np.ndarray]:
+        """Price per m2 check, modality is 'rent' or 'sale' (scalar or array), other modalities are out of range."""
+        if np.ndim(modality) == 0:
+            if modality not in ('rent', 'sale'):
+                return np.zeros(np.shape(price_m2), dtype=bool) if np.ndim(price_m2) else False
+            return self.in_range(modality, price_m2, sectors)
+        modality = np.asarray(modality, dtype=object)
+        return np.where(modality == 'rent', self.in_range('rent', price_m2, sectors),
+                        np.where(modality == 'sale', self.in_range('sale', price_m2, sectors), False))
+
+    def area_in_range(self, area, sectors) -> Union[bool, np.ndarray]:
+        return self.in_range('area', area, sectors)
+
+
+def build_snapshot(tables: Dict[str, pd.DataFrame], version: int) -> QALimitsSnapshot:
+    """
+    Builds a snapshot from the range tables.
+
+    Args:
+        tables (Dict[str, pd.DataFrame]): 'rent', 'sale' and 'area' tables with a sector column and their bounds
+        version (int): version of the snapshot
+    """
+    sector_names = sorted({s for table in tables.values() for s in table['sector']})
+    sectors = {s: i for i, s in enumerate(sector_names)}
+    bounds = {}
+    for modality, (lower, upper) in QA_LIMITS_COLUMNS.items():
+        array = np.full((len(sectors) + 1, 2), np.nan)
+        table = tables[modality]
+        idx = table['sector'].map(sectors).to_numpy()
+        array[idx, 0] = table[lower].astype(float).to_numpy()
+        array[idx, 1] = table[upper].astype(float).to_numpy()
+        array.setflags(write=False)
+        bounds[modality] = array
+    return QALimitsSnapshot(version, time.time(), sectors, bounds)
+
+
+class QALimitsCache:
+    """
+    Keeps a snapshot of the range tables and loads them again after `ttl` seconds or on refresh().
+    With source_version, the tables are also loaded again as soon as their version changes.
+
+    Args:
+        load (Callable): function returning the 'rent', 'sale' and 'area' tables as DataFrames
+        ttl (float): seconds before the snapshot expires
+        source_version (Callable): function returning the version of the tables, None if unknown
+        version_check_interval (float): seconds between calls of source_version
+    """
+
+    def __init__(self, load: Callable[[], Dict[str, pd.DataFrame]], ttl: float = QA_LIMITS_TTL,
+                 source_version: Optional[Callable[[], Optional[int]]] = None,
+                 version_check_interval: float = QA_LIMITS_VERSION_CHECK_INTERVAL):
+        self._load = load
+        self.ttl = ttl
+        self._source_version = source_version
+        self.version_check_interval = version_check_interval
+        self._loaded_version = None
+        self._checked_at = time.time()
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> QALimitsSnapshot:
+        """Loads the tables now and returns the new snapshot."""
+        with self._lock:
+            if self._source_version is not None:
+                self._loaded_version = self._source_version()
+                self._checked_at = time.time()
+            version = self._snapshot.version + 1 if self._snapshot is not None else 1
+            self._snapshot = build_snapshot(self._load(), version)._replace(source_version=self._loaded_version)
+            return self._snapshot
+
+    def _source_changed(self) -> bool:
+        # asks for the version of the tables at most once per version_check_interval
+        if self._source_version is None or time.time() - self._checked_at < self.version_check_interval:
+            return False
+        self._checked_at = time.time()
+        version = self._source_version()
+        return version is not None and version != self._loaded_version
+
+    def set_snapshot(self, snapshot: QALimitsSnapshot):
+        """Uses a snapshot loaded elsewhere, e.g. by the parent of a worker process."""
+        with self._lock:
+            self._snapshot = snapshot
+            # without it the first version check would reload the tables the snapshot already holds
+            self._loaded_version = snapshot.source_version
+            self._checked_at = time.time()
+
+    def snapshot(self) -> QALimitsSnapshot:
+        """Returns the current snapshot, loading the tables if it is missing or expired."""
+        snapshot = self._snapshot
+        if snapshot is None or time.time() - snapshot.loaded_at > self.ttl or self._source_changed():
+            snapshot = self.refresh()
+        return snapshot
+
+    def price_in_range(self, price_m2, sectors, modality):
+        return self.snapshot().price_in_range(price_m2, sectors, modality)
+
+    def area_in_range(self, area, sectors):
+        return self.snapshot().area_in_range(area, sectors)
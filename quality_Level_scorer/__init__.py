@@ -0,0 +1,8 @@
+"""
+Quality level scorer (QLS): level classification of the spot owner and the score weighted by it.
+
+    from quality_Level_scorer import quality_Level_scorer as qls
+    qls.output_qls_batch(data)
+
+The scorer module is imported as a submodule, set_qls_config replaces the configuration in it.
+"""
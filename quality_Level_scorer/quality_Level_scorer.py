@@ -1,27 +1,110 @@
-import pandas as pd
-from quality_level_scorer_config import QLS_CONFIG_DF, LS_WEIGHT
+from collections.abc import Sequence
+from itertools import product
+
+import numpy as np
+
+try:
+    from .quality_level_scorer_config import QLS_CONFIG, LS_WEIGHT, QLSConfig, load_qls_config
+except ImportError:
+    # run from its own directory, e.g. by the notebook
+    from quality_level_scorer_config import QLS_CONFIG, LS_WEIGHT, QLSConfig, load_qls_config
+
+# Level class ids returned by the classifier
+LEVEL_CLASS_IDS = (1, 2, 3, 4, 5, 6, 7, 8)
+
+
+def level_weights(config: QLSConfig) -> np.ndarray:
+    """Weight of every level class indexed by its id, classes without config weigh 0."""
+    weights = np.zeros(max(len(config.weights), max(LEVEL_CLASS_IDS) + 1))
+    for level_class_id in config.ids:
+        weights[level_class_id] = config.weights[level_class_id]
+    return weights
+
+
+LEVEL_WEIGHTS = level_weights(QLS_CONFIG)
+LEVEL_WEIGHT_BY_ID = tuple(LEVEL_WEIGHTS.tolist())
+
+# Log levels of qls_with_logs / output_qls
+LOG_NONE = "none"    # only the score and the level class id
+LOG_DEBUG = "debug"  # the compact debug record
+LOG_FULL = "full"    # debug record plus the human-readable description (a list, json serializable)
+LOG_LAZY = "lazy"    # like LOG_FULL with the description as a QLSLog rendered on demand
+
+USER_INDUSTRIA_ROLE_MAP = {1: "Tenant", 2: "Broker", 4: "Landlord", 5: "Developer"}
+USER_LEVEL_MAP = {1: "Gold", 2: "Platinum", 3: "Titanium"}
+USER_AFFILIATION_MAP = {1: "Internal User", 0: "External User"}
+USER_BROKER_NEXT_MAP = {1: "Yes", 0: "No"}
+SPOT_EXCLUSIVE_MAP = {1: "Yes", 0: "No"}
 
 
 def get_labels_from_ids(user_industria_role_id, user_broker_next_id, user_affiliation_id,
                         spot_exclusive_id, user_level_id):
     """Returns human-readable labels from numeric codes."""
-    user_industria_role_map = {
-        1: "Tenant", 2: "Broker", 4: "Landlord", 5: "Developer"
-    }
-    user_level_map = {1: "Gold", 2: "Platinum", 3: "Titanium"}
-    user_affiliation_map = {1: "Internal User", 0: "External User"}
-    user_broker_next_map = {1: "Yes", 0: "No"}
-    spot_exclusive_map = {1: "Yes", 0: "No"}
-
     return {
-        "user_industria_role": user_industria_role_map.get(user_industria_role_id, "Unknown"),
-        "user_broker_next": user_broker_next_map.get(user_broker_next_id, "No"),
-        "user_affiliation": user_affiliation_map.get(user_affiliation_id, "Unknown"),
-        "spot_exclusive": spot_exclusive_map.get(spot_exclusive_id, "No"),
-        "user_level": user_level_map.get(user_level_id, "Others")
+        "user_industria_role": USER_INDUSTRIA_ROLE_MAP.get(user_industria_role_id, "Unknown"),
+        "user_broker_next": USER_BROKER_NEXT_MAP.get(user_broker_next_id, "No"),
+        "user_affiliation": USER_AFFILIATION_MAP.get(user_affiliation_id, "Unknown"),
+        "spot_exclusive": SPOT_EXCLUSIVE_MAP.get(spot_exclusive_id, "No"),
+        "user_level": USER_LEVEL_MAP.get(user_level_id, "Others")
     }
 
 
+def set_qls_config(config):
+    """
+    Replaces the configuration used by the scorer.
+
+    Args:
+    - config: QLSConfig or path of a JSON / YAML file accepted by load_qls_config.
+    """
+    global QLS_CONFIG, LS_WEIGHT, LEVEL_WEIGHTS, LEVEL_WEIGHT_BY_ID
+    if isinstance(config, str):
+        config = load_qls_config(config)
+    QLS_CONFIG = config
+    LS_WEIGHT = config.ls_weight
+    LEVEL_WEIGHTS = level_weights(config)
+    LEVEL_WEIGHT_BY_ID = tuple(LEVEL_WEIGHTS.tolist())
+
+
+def level_class_rules(user_industria_role_id: int, user_broker_next_id: int,
+                      user_affiliation_id: int, spot_exclusive_id: int, user_level_id: int) -> int:
+    """Same decision as level_classifier without building the log."""
+    if user_industria_role_id == 5:
+        return 1
+    if user_industria_role_id == 4:
+        return 2
+    if user_industria_role_id == 2:
+        if user_broker_next_id == 1:
+            return 3
+        if user_affiliation_id == 0:
+            if spot_exclusive_id == 1:
+                return 4
+            if user_level_id == 3:
+                return 5
+            if user_level_id == 2:
+                return 6
+            if user_level_id == 1:
+                return 7
+    return 8
+
+
+# Level class of every combination of the known codes: role, broker next, affiliation, exclusive and level
+LEVEL_CLASS_TABLE = {
+    codes: level_class_rules(*codes)
+    for codes in product(USER_INDUSTRIA_ROLE_MAP, USER_BROKER_NEXT_MAP, USER_AFFILIATION_MAP,
+                         SPOT_EXCLUSIVE_MAP, (0,) + tuple(USER_LEVEL_MAP))
+}
+
+
+def level_class_id_from_codes(user_industria_role_id: int, user_broker_next_id: int,
+                              user_affiliation_id: int, spot_exclusive_id: int, user_level_id: int) -> int:
+    """Level class id from the decision table, codes outside the table go through level_class_rules."""
+    codes = (user_industria_role_id, user_broker_next_id, user_affiliation_id, spot_exclusive_id, user_level_id)
+    level_class_id = LEVEL_CLASS_TABLE.get(codes)
+    if level_class_id is None:
+        level_class_id = level_class_rules(*codes)
+    return level_class_id
+
+
 def level_classifier(user_industria_role_id: int, user_broker_next_id: int,
                         user_affiliation_id: int, spot_exclusive_id: int, user_level_id: int):
     """
@@ -79,11 +162,10 @@ def level_classifier(user_industria_role_id: int, user_broker_next_id: int,
         level_class_id = 8
         log_description.append("User role is low-privilege or unrecognized → Level class set to 8 (default classification).")
 
-    # Añadimos descripción del nivel desde el dataframe
-    tag_row = QLS_CONFIG_DF[QLS_CONFIG_DF["id"] == level_class_id]
-    if not tag_row.empty:
-        tag = tag_row["tag"].values[0]
-        desc = tag_row["description"].values[0]
+    # Añadimos descripción del nivel desde la configuración
+    if level_class_id < len(QLS_CONFIG.tags) and QLS_CONFIG.tags[level_class_id] is not None:
+        tag = QLS_CONFIG.tags[level_class_id]
+        desc = QLS_CONFIG.descriptions[level_class_id]
         log_description.append(f"Final level class: {level_class_id} ({tag}) — {desc}")
     else:
         log_description.append(f"Final level class: {level_class_id} (Unknown tag)")
@@ -91,9 +173,10 @@ def level_classifier(user_industria_role_id: int, user_broker_next_id: int,
     return level_class_id, log_description
 
 
-def qls_scorer(score: float, level_class_id: int, qls_weight: float, df_config: pd.DataFrame):
+def qls_scorer(score: float, level_class_id: int, qls_weight: float, df_config=None):
     """
     Calculates the Quality Level Score (QLS) using a weighted average.
+    The weight of the level comes from df_config when given (a DataFrame like QLS_CONFIG_DF), otherwise from QLS_CONFIG.
 
     Returns:
     - qls_score: Final quality level score.
@@ -102,12 +185,15 @@ def qls_scorer(score: float, level_class_id: int, qls_weight: float, df_config:
 
     log_description = ["➋ Computing the Quality Level Score (QLS):"]
 
-    row = df_config[df_config["id"] == level_class_id]
-    if row.empty:
+    if df_config is None:
+        level_weight = QLS_CONFIG.weight(level_class_id)
+    else:
+        row = df_config[df_config["id"] == level_class_id]
+        level_weight = None if row.empty else row["weight"].values[0]
+    if level_weight is None:
         log_description.append(f"⚠️ No config found for level class {level_class_id}. Default weight = 0.")
         level_weight = 0.0
     else:
-        level_weight = row["weight"].values[0]
         log_description.append(f"Level weight from config: {level_weight} (for class {level_class_id})")
 
     qls_score = (1. - qls_weight) * score + qls_weight * level_weight
@@ -116,73 +202,182 @@ def qls_scorer(score: float, level_class_id: int, qls_weight: float, df_config:
     return qls_score, log_description
 
 
-def qls_with_logs(dic_spot_input: dict):
+class QLSLog(Sequence):
     """
-    Main QLS scoring process with logging of decisions and metadata.
+    Human-readable description of a QLS computation, rendered from the debug record the first time it is read.
+    Behaves like the list of log lines, use to_list() (or qls_json_default with json.dumps) to serialize it.
+    It is not a list, json.dumps reads the items of lists directly, so it is only returned with LOG_LAZY.
     """
 
-    df_config = QLS_CONFIG_DF.copy()
-    qls_weight = LS_WEIGHT
+    __slots__ = ("debug", "_lines")
+
+    def __init__(self, debug: dict):
+        self.debug = debug
+        self._lines = None
+
+    def to_list(self) -> list:
+        if self._lines is None:
+            self._lines = render_qls_log(self.debug)
+        return self._lines
+
+    def __getitem__(self, index):
+        return self.to_list()[index]
+
+    def __len__(self):
+        return len(self.to_list())
+
+    def __eq__(self, other):
+        return self.to_list() == list(other)
+
+    def __repr__(self):
+        return repr(self.to_list())
+
+
+def qls_json_default(obj):
+    """`default` for json.dumps so the lazy logs are rendered when serialized."""
+    if isinstance(obj, QLSLog):
+        return obj.to_list()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def render_qls_log(debug: dict) -> list:
+    """Builds the log lines of qls_with_logs from its debug record."""
     log_description = []
-    debug_info = {}
-
-    # Inputs
-    user_industria_role_id = dic_spot_input["user_industria_role_id"]
-    user_broker_next_id = dic_spot_input["user_broker_next_id"]
-    user_affiliation_id = dic_spot_input["user_affiliation_id"]
-    spot_exclusive_id = dic_spot_input["spot_exclusive_id"]
-    user_level_id = dic_spot_input["user_level_id"]
-    score = dic_spot_input["score"]
-    spot_id = dic_spot_input["spot_id"]
-
-    # 1. Level classification
     level_class_id, log_lc = level_classifier(
-        user_industria_role_id, user_broker_next_id, user_affiliation_id,
-        spot_exclusive_id, user_level_id
+        debug["user_industria_role_id"], debug["user_broker_next_id"], debug["user_affiliation_id"],
+        debug["spot_exclusive_id"], debug["user_level_id"]
     )
     log_description.extend(log_lc)
 
-    # 2. QLS scoring
-    qls_score, log_qls = qls_scorer(score, level_class_id, qls_weight, df_config)
+    qls_score, log_qls = qls_scorer(debug["raw_score"], level_class_id, debug["qls_weight"])
     log_description.extend(log_qls)
 
-    # 3. Summary
     log_description.append("➌ Final classification summary:")
-    log_description.append(f"✅ Spot {spot_id} has been classified with a QLS score of {qls_score:.2f}.")
+    log_description.append(f"✅ Spot {debug['spot_id']} has been classified with a QLS score of {qls_score:.2f}.")
+    return log_description
+
+
+def qls_score_and_class(dic_spot_input: dict):
+    """
+    Hot path of the QLS scoring: returns only the qls_score and the level_class_id.
+    """
+    level_class_id = level_class_id_from_codes(
+        dic_spot_input["user_industria_role_id"], dic_spot_input["user_broker_next_id"],
+        dic_spot_input["user_affiliation_id"], dic_spot_input["spot_exclusive_id"], dic_spot_input["user_level_id"]
+    )
+    qls_score = (1. - LS_WEIGHT) * dic_spot_input["score"] + LS_WEIGHT * LEVEL_WEIGHT_BY_ID[level_class_id]
+    return qls_score, level_class_id
+
+
+def qls_with_logs(dic_spot_input: dict, log_level: str = LOG_FULL):
+    """
+    Main QLS scoring process with logging of decisions and metadata.
+
+    Returns:
+    - qls_score: Final quality level score.
+    - log: None with LOG_NONE, {"debug": ...} with LOG_DEBUG and {"description": ..., "debug": ...} with LOG_FULL,
+      where description is the list of log lines. With LOG_LAZY description is a QLSLog rendered when it is read.
+    """
+    qls_score, level_class_id = qls_score_and_class(dic_spot_input)
+    if log_level == LOG_NONE:
+        return qls_score, None
 
     debug_info = {
-        "spot_id": spot_id,
-        "user_industria_role_id": user_industria_role_id,
-        "user_broker_next_id": user_broker_next_id,
-        "user_affiliation_id": user_affiliation_id,
-        "spot_exclusive_id": spot_exclusive_id,
-        "user_level_id": user_level_id,
+        "spot_id": dic_spot_input["spot_id"],
+        "user_industria_role_id": dic_spot_input["user_industria_role_id"],
+        "user_broker_next_id": dic_spot_input["user_broker_next_id"],
+        "user_affiliation_id": dic_spot_input["user_affiliation_id"],
+        "spot_exclusive_id": dic_spot_input["spot_exclusive_id"],
+        "user_level_id": dic_spot_input["user_level_id"],
         "level_class_id": level_class_id,
-        "raw_score": score,
-        "qls_weight": qls_weight
+        "raw_score": dic_spot_input["score"],
+        "qls_weight": LS_WEIGHT
     }
+    if log_level == LOG_DEBUG:
+        return qls_score, {"debug": debug_info}
 
     return qls_score, {
-        "description": log_description,
+        "description": QLSLog(debug_info) if log_level == LOG_LAZY else render_qls_log(debug_info),
         "debug": debug_info
     }
 
 
-def output_qls(list_input: list):
+def output_qls(list_input: list, log_level: str = LOG_FULL):
     """
-    Applies QLS scoring to a list of input spots, returning scores and detailed logs.
+    Applies QLS scoring to a list of input spots, returning scores, level classes and logs of the given log level.
     """
     list_output = []
 
     for dic_spot_input in list_input:
-        qls_score, log = qls_with_logs(dic_spot_input)
+        if log_level == LOG_NONE:
+            qls_score, level_class_id = qls_score_and_class(dic_spot_input)
+            log = None
+        else:
+            qls_score, log = qls_with_logs(dic_spot_input, log_level)
+            level_class_id = log["debug"]["level_class_id"]
         dic_output = {
             "spot_id": dic_spot_input["spot_id"],
             "qls_score": float(qls_score),
+            "level_class_id": level_class_id,
             "qls_log": log
         }
         list_output.append(dic_output)
 
     return list_output
 
-output_qls(list_input)
+
+def level_classifier_batch(user_industria_role_id, user_broker_next_id, user_affiliation_id,
+                           spot_exclusive_id, user_level_id) -> np.ndarray:
+    """
+    Vectorized version of level_classifier, receives arrays of codes and returns the array of level class ids.
+    """
+    role = np.asarray(user_industria_role_id)
+    broker = role == 2
+    broker_next = broker & (np.asarray(user_broker_next_id) == 1)
+    external_broker = broker & ~broker_next & (np.asarray(user_affiliation_id) == 0)
+    exclusive = np.asarray(spot_exclusive_id) == 1
+    user_level = np.asarray(user_level_id)
+
+    conditions = [
+        role == 5,
+        role == 4,
+        broker_next,
+        external_broker & exclusive,
+        external_broker & (user_level == 3),
+        external_broker & (user_level == 2),
+        external_broker & (user_level == 1)
+    ]
+    return np.select(conditions, [1, 2, 3, 4, 5, 6, 7], default=8)
+
+
+def output_qls_batch(data):
+    """
+    Columnar version of output_qls without logs.
+
+    Args:
+    - data: DataFrame or Arrow table with the columns spot_id, user_industria_role_id, user_broker_next_id,
+      user_affiliation_id, spot_exclusive_id, user_level_id and score.
+
+    Returns:
+    - DataFrame with spot_id, level_class_id and qls_score, the same values as output_qls.
+    """
+    import pandas as pd
+
+    if hasattr(data, "column_names"):
+        # pyarrow.Table
+        column = lambda name: data.column(name).to_numpy()
+    else:
+        column = lambda name: data[name].to_numpy()
+
+    level_class_id = level_classifier_batch(
+        column("user_industria_role_id"), column("user_broker_next_id"), column("user_affiliation_id"),
+        column("spot_exclusive_id"), column("user_level_id")
+    )
+    score = column("score").astype(float)
+    qls_score = (1. - LS_WEIGHT) * score + LS_WEIGHT * LEVEL_WEIGHTS[level_class_id]
+
+    return pd.DataFrame({
+        "spot_id": column("spot_id"),
+        "level_class_id": level_class_id,
+        "qls_score": qls_score
+    })
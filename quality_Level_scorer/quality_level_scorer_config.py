@@ -1,35 +1,108 @@
 """
 Configuration of quality level scorer.
+
+The level classes are compiled at import into tuples indexed by class id, so the scorer does not need pandas.
+QLS_CONFIG_DF is still available as a DataFrame, built on first access.
 """
 
-import pandas as pd
+import json
+from typing import NamedTuple, Optional, Tuple
 
-# Weight of the user level in the final score. 
+# Weight of the user level in the final score.
 # This value determines how much the user's hierarchy (level) influences the composite score, along with the quality score.
 LS_WEIGHT = 0.2
 
-# Quality Level Scorer Configuration DataFrame
-QLS_CONFIG_DF = pd.DataFrame({
-    "id": [1, 2, 3, 4, 5, 6, 7, 8],
-    "tag": [
-        "developer",
-        "landlord",
-        "broker_next",
-        "broker_ext_exclusive",
-        "broker_ext_titanium",
-        "broker_ext_platinum",
-        "broker_ext_gold",
-        "other_brokers"
-    ],
-    "description": [
-        "User with developer role",
-        "User with landlord role",
-        "User with broker role and nextagents.mx domain",
-        "User with external broker role with some exclusive spot",
-        "User with external broker role with Titanium level",
-        "User with external broker role with Platinum level",
-        "User with external broker role with Gold level",
-        "Other users with broker role"
-    ],
-    "weight": [50, 50, 40, 40, 30, 20, 10, 0]
-})
+# Quality Level Scorer Configuration: one row per level class
+QLS_CONFIG_ROWS = (
+    {"id": 1, "tag": "developer", "description": "User with developer role", "weight": 50},
+    {"id": 2, "tag": "landlord", "description": "User with landlord role", "weight": 50},
+    {"id": 3, "tag": "broker_next", "description": "User with broker role and nextagents.mx domain", "weight": 40},
+    {"id": 4, "tag": "broker_ext_exclusive", "description": "User with external broker role with some exclusive spot", "weight": 40},
+    {"id": 5, "tag": "broker_ext_titanium", "description": "User with external broker role with Titanium level", "weight": 30},
+    {"id": 6, "tag": "broker_ext_platinum", "description": "User with external broker role with Platinum level", "weight": 20},
+    {"id": 7, "tag": "broker_ext_gold", "description": "User with external broker role with Gold level", "weight": 10},
+    {"id": 8, "tag": "other_brokers", "description": "Other users with broker role", "weight": 0},
+)
+
+
+class QLSConfig(NamedTuple):
+    """
+    Compiled configuration, tags / descriptions / weights are indexed by level class id
+    and hold None for ids without config.
+    """
+    ls_weight: float
+    ids: Tuple[int, ...]
+    tags: Tuple[Optional[str], ...]
+    descriptions: Tuple[Optional[str], ...]
+    weights: Tuple[Optional[float], ...]
+
+    def weight(self, level_class_id: int) -> Optional[float]:
+        if 0 <= level_class_id < len(self.weights):
+            return self.weights[level_class_id]
+        return None
+
+
+def compile_qls_config(rows, ls_weight: float = LS_WEIGHT) -> QLSConfig:
+    """
+    Validates the level class rows and compiles them into a QLSConfig.
+
+    Raises:
+    - ValueError: if a row misses a field, an id is repeated or not a positive integer,
+      a weight is not a number or ls_weight is not between 0 and 1.
+    """
+    if isinstance(ls_weight, bool) or not isinstance(ls_weight, (int, float)) or not 0 <= ls_weight <= 1:
+        raise ValueError(f"ls_weight must be a number between 0 and 1, got {ls_weight!r}")
+    rows = list(rows)
+    if not rows:
+        raise ValueError("the configuration has no level classes")
+    for row in rows:
+        missing = {"id", "tag", "description", "weight"} - set(row)
+        if missing:
+            raise ValueError(f"level class {row} misses {sorted(missing)}")
+        if isinstance(row["id"], bool) or not isinstance(row["id"], int) or row["id"] < 1:
+            raise ValueError(f"level class id must be a positive integer, got {row['id']!r}")
+        if isinstance(row["weight"], bool) or not isinstance(row["weight"], (int, float)):
+            raise ValueError(f"weight of level class {row['id']} must be a number, got {row['weight']!r}")
+        if not isinstance(row["tag"], str) or not isinstance(row["description"], str):
+            raise ValueError(f"tag and description of level class {row['id']} must be strings")
+    ids = [row["id"] for row in rows]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"repeated level class ids in {ids}")
+
+    size = max(ids) + 1
+    tags, descriptions, weights = [None] * size, [None] * size, [None] * size
+    for row in rows:
+        tags[row["id"]] = row["tag"]
+        descriptions[row["id"]] = row["description"]
+        weights[row["id"]] = row["weight"]
+    return QLSConfig(ls_weight, tuple(ids), tuple(tags), tuple(descriptions), tuple(weights))
+
+
+def load_qls_config(path: str) -> QLSConfig:
+    """
+    Loads and validates a configuration from a JSON or YAML file with the shape
+    {"ls_weight": 0.2, "levels": [{"id": 1, "tag": ..., "description": ..., "weight": ...}, ...]}.
+    YAML files need PyYAML.
+    """
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    if not isinstance(data, dict) or "levels" not in data:
+        raise ValueError(f"{path} must have a 'levels' list")
+    return compile_qls_config(data["levels"], data.get("ls_weight", LS_WEIGHT))
+
+
+QLS_CONFIG = compile_qls_config(QLS_CONFIG_ROWS, LS_WEIGHT)
+
+
+def __getattr__(name):
+    # QLS_CONFIG_DF is built only when it is used, so importing the config does not import pandas
+    if name == "QLS_CONFIG_DF":
+        import pandas as pd
+        global QLS_CONFIG_DF
+        QLS_CONFIG_DF = pd.DataFrame(list(QLS_CONFIG_ROWS))
+        return QLS_CONFIG_DF
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,219 +1,145 @@
+import asyncio
 import pandas as pd
 import numpy as np
-from typing import Union,List,Dict
+from typing import Union,List,Dict,Optional
 import mysql.connector
 from mysql.connector import Error
 import psycopg2
 from psycopg2 import Error
+from db_pool import mysql_pool, postgres_pool
+from prepared import Query, execute
+from instrumentation import span, instrumented, dataframe_nbytes
 from credenciales_gamma import connection_params_gamma
 from credentials_geo import connection_params_geo
 from variables_by_sector import retail, office, industrial, land, sector_map, photos_map
-from querys import query_qa_price_rent, query_qa_price_sale, query_qa_area
+from querys import query_completitud, query_photos, query_photos_spots, query_prices, query_prices_spots, query_public_photos, query_public_photos_spots, query_qa_limits_price_rent, query_qa_limits_price_sale, query_qa_limits_area, query_qa_limits_version, query_qa_limits_versions_exists, query_parent_ids
+from qa_limits import QALimitsCache, QALimitsSnapshot
+from completeness import query_variables_mask, completitud_from_masks
+from photo_scoring import PhotoIndex, ComplexPhotoCache
+from score_audit import AuditLog, audit_records
+from engagement_features import EngagementFeatureStore, add_engagement
 
-def execute_query_mysql(query: str, connection_params: dict) -> Union[pd.DataFrame, None]:
+def execute_query_mysql(query: Union[str, Query], connection_params: dict) -> Union[pd.DataFrame, None]:
     """
     Execute a SQL query on the MySQL database and return the results as a pandas DataFrame.
 
     Args:
-        query (str): SQL query to execute
+        query (Union[str, Query]): SQL query to execute, or a parameterized Query of querys
         connection_params (dict): Connection parameters
 
     Returns:
         Union[pd.DataFrame, None]: DataFrame with query results or None if there was an error
     """
     try:
-        # Connect to the database
-        connection = mysql.connector.connect(**connection_params)
-        
-        # Create a cursor
-        cursor = connection.cursor()
-        
-        # Execute the query
-        cursor.execute(query)
-        
-        # If the query returns results, fetch them
-        if cursor.description:
-            columns = [desc[0] for desc in cursor.description]
-            rows = cursor.fetchall()
-            df = pd.DataFrame(rows, columns=columns)
-            return df
-        else:
-            connection.commit()
-            return None
+        # Take a connection from the pool, the query is timed when instrumentation is enabled
+        pool = mysql_pool(connection_params)
+        with span('query', db='mysql') as query_span, pool.connection() as connection:
+            # Execute the query, a Query runs as a prepared statement kept with the connection
+            cursor, close = execute(pool, connection, query, 'mysql')
+            try:
+                # If the query returns results, fetch them
+                if cursor.description:
+                    columns = [desc[0] for desc in cursor.description]
+                    rows = cursor.fetchall()
+                    df = pd.DataFrame(rows, columns=columns)
+                    if query_span:
+                        query_span.record(len(df), dataframe_nbytes(df))
+                    return df
+                else:
+                    connection.commit()
+                    return None
+            finally:
+                # Only the cursor is closed, the connection goes back to the pool with its prepared statements
+                if close:
+                    cursor.close()
             
     except Error as error:
         print(f"Error while connecting to MySQL: {error}")
         return None
-        
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'connection' in locals():
-            connection.close()
 
-def execute_query_postgres(query: str, connection_params: dict) -> Union[pd.DataFrame, None]:
+def execute_query_postgres(query: Union[str, Query], connection_params: dict) -> Union[pd.DataFrame, None]:
     """
     Execute a SQL query on the PostgreSQL database and return the results as a pandas DataFrame.
     
     Args:
-        query (str): SQL query to execute
+        query (Union[str, Query]): SQL query to execute, or a parameterized Query of querys
         
     Returns:
         Union[pd.DataFrame, None]: DataFrame with query results or None if there was an error
     """
     try:
-        # Connection parameters
-        
-        # Connect to the database
-        connection = psycopg2.connect(**connection_params)
-        
-        # Create a cursor
-        cursor = connection.cursor()
-        
-        # Execute the query
-        cursor.execute(query)
-        
-        # If the query returns results, fetch them
-        if cursor.description:
-            # Get column names
-            columns = [desc[0] for desc in cursor.description]
-            
-            # Fetch all rows
-            rows = cursor.fetchall()
-            
-            # Create DataFrame
-            df = pd.DataFrame(rows, columns=columns)
-            
-            return df
-        else:
-            # For queries that don't return results (INSERT, UPDATE, DELETE)
-            connection.commit()
-            return None
+        # Take a connection from the pool, the query is timed when instrumentation is enabled
+        pool = postgres_pool(connection_params)
+        with span('query', db='postgres') as query_span, pool.connection() as connection:
+            # Execute the query, a Query runs as a prepared statement kept with the connection
+            cursor, close = execute(pool, connection, query, 'postgres')
+            try:
+                # If the query returns results, fetch them
+                if cursor.description:
+                    # Get column names
+                    columns = [desc[0] for desc in cursor.description]
+                    
+                    # Fetch all rows
+                    rows = cursor.fetchall()
+                    
+                    # Create DataFrame
+                    df = pd.DataFrame(rows, columns=columns)
+                    if query_span:
+                        query_span.record(len(df), dataframe_nbytes(df))
+                    
+                    return df
+                else:
+                    # For queries that don't return results (INSERT, UPDATE, DELETE)
+                    connection.commit()
+                    return None
+            finally:
+                # Only the cursor is closed, the connection goes back to the pool with its prepared statements
+                if close:
+                    cursor.close()
             
     except (Exception, Error) as error:
         print(f"Error while connecting to PostgreSQL: {error}")
         return None
-        
-    finally:
-        # Close the cursor and connection
-        if 'cursor' in locals():
-            cursor.close()
-        if 'connection' in locals():
-            connection.close()
 
+@instrumented('get_id_spot')
 def get_id_spot(id: int):
-    query_completitud = f"""
-    SELECT 
-    s.id AS spot_id,
-    s.parent_id,
-    s.spot_type_id, 
-    s.natural_light, 
-    s.luminaries, 
-    s.charging_ports, 
-    s.energy, 
-    s.floor_material, 
-    s.fire_protection_system, 
-    s.security_type, 
-    s.vehicle_ramp, 
-    s.land_use, 
-    s.floor_level, 
-    s.vertical_height, 
-    s.parking_spaces, 
-    s.front, 
-    s.height, 
-    s.height_between_floors,
-
-    -- Amenidades
-    MAX(CASE WHEN a.name = 'Baños' THEN 1 ELSE NULL END) AS Banos,
-    MAX(CASE WHEN a.name = 'Wifi' THEN 1 ELSE NULL END) AS Wifi,
-    MAX(CASE WHEN a.name = 'A/C' THEN 1 ELSE NULL END) AS Ac,
-    MAX(CASE WHEN a.name = 'Estacionamiento' THEN 1 ELSE NULL END) AS Estacionamiento,
-    MAX(CASE WHEN a.name = 'Bodega' THEN 1 ELSE NULL END) AS Bodega,
-    MAX(CASE WHEN a.name = 'Accesibilidad' THEN 1 ELSE NULL END) AS Accesibilidad,
-    MAX(CASE WHEN a.name = 'Luz' THEN 1 ELSE NULL END) AS Luz,
-    MAX(CASE WHEN a.name = 'Sistema de seguridad' THEN 1 ELSE NULL END) AS Sistema_de_seguridad,
-    MAX(CASE WHEN a.name = 'Montacargas' THEN 1 ELSE NULL END) AS Montacargas,
-    MAX(CASE WHEN a.name = 'Pizarrón' THEN 1 ELSE NULL END) AS Pizarron,
-    MAX(CASE WHEN a.name = 'Elevador' THEN 1 ELSE NULL END) AS Elevador,
-    MAX(CASE WHEN a.name = 'Terraza' THEN 1 ELSE NULL END) AS Terraza,
-    MAX(CASE WHEN a.name = 'Zona de limpieza' THEN 1 ELSE NULL END) AS Zona_de_limpieza,
-    MAX(CASE WHEN a.name = 'Posibilidad a dividirse' THEN 1 ELSE NULL END) AS Posibilidad_a_dividirse,
-    MAX(CASE WHEN a.name = 'Mezzanine' THEN 1 ELSE NULL END) AS Mezzanine,
-    MAX(CASE WHEN a.name = 'cocina equipada' THEN 1 ELSE NULL END) AS Cocina_equipada,
-    MAX(CASE WHEN a.name = 'Cocina' THEN 1 ELSE NULL END) AS Cocina,
-    MAX(CASE WHEN a.name = 'Planta de luz' THEN 1 ELSE NULL END) AS Planta_de_luz,
-    MAX(CASE WHEN a.name = 'Tapanco' THEN 1 ELSE NULL END) AS Tapanco
-
-    FROM spots s
-    LEFT JOIN spot_amenities sa ON sa.spot_id = s.id
-    LEFT JOIN amenities a ON a.id = sa.amenity_id
-    WHERE s.id = {id}
-    """
-    query_photos = f"""
-    select photo_id, additional_information, short_description, name, quality
-    from photos_aiclassification ai 
-    left join photos_aiclassification_photo_tag aitag on ai.id = aitag. aiclassification_id
-    left join photos_phototag tag on tag.id = aitag.phototag_id
-    where spot_id = {id}
-    """
-    query_prices = f"""
-    select s.id, 
-    case when price_area = 1 then 'total_price'
-    when price_area = 2 then 'price_sqm' end as type_price, 
-    case when currency_type = 1 or currency_type is null then 'MXN'
-    else 'USD' end as currency,
-    case when type = 1 then 'rent'
-    when type = 2 then 'sale' end as modality, 
-    case when currency_type = 1 or currency_type is null then rate 
-    else  rate * 19 end as price,
-    s.square_space
-    from spots s 
-    join prices p on s.id = p.spot_id
-    where type in (1,2)
-    and p.deleted_at is null 
-    and s.id = {id}
-    """
-
-    amenities = execute_query_mysql(query_completitud, connection_params_gamma)
-    photos = execute_query_postgres(query_photos, connection_params_geo)
-    prices = execute_query_mysql(query_prices, connection_params_gamma)
+    amenities = execute_query_mysql(query_completitud(id), connection_params_gamma)
+    photos = execute_query_postgres(query_photos(id), connection_params_geo)
+    prices = execute_query_mysql(query_prices(id), connection_params_gamma)
 
 
     if photos.shape[0] == 0:
         if amenities['parent_id'][0] is not None:
             id_c = amenities['parent_id'][0]
-            query_photos_c = f"""
-            select photo_id, additional_information, short_description, name, quality
-            from photos_aiclassification ai 
-            left join photos_aiclassification_photo_tag aitag on ai.id = aitag. aiclassification_id
-            left join photos_phototag tag on tag.id = aitag.phototag_id
-            where spot_id = {id_c}
-            """
-            photos = execute_query_postgres(query_photos_c, connection_params_geo)
+            photos, public_photos = get_complex_photos(id_c)
             photos['complex_images'] = 1
             if photos.shape[0] == 0:
                 return amenities, None, prices, None
             else:
-                pass
+                return amenities, photos, prices, public_photos
         elif amenities['parent_id'][0] is None:
             return amenities, None, prices, None
     else:
         photos['complex_images'] = 0
 
-    photos_ids = list(photos['photo_id'].unique())
-    photos_ids = str(photos_ids).replace('[', '').replace(']', '')
-
-
-    query_public_photos = f"""
-    select id, deleted_at
-    from photos
-    where id in ({photos_ids})
-    and deleted_at is null
-    """
-
-    public_photos = execute_query_mysql(query_public_photos, connection_params_gamma)
+    public_photos = execute_query_mysql(query_public_photos(photos['photo_id'].unique()), connection_params_gamma)
     return amenities, photos, prices, public_photos
 
+@instrumented('get_complex_photos')
+def get_complex_photos(id_c: int):
+    # photos and public photos of a complex, fetched once and shared by all its children
+    cached = complex_photos.get(id_c)
+    if cached is None:
+        photos = get_photos_spots([id_c])
+        if photos.shape[0] == 0:
+            public_photos = pd.DataFrame(columns=['id', 'deleted_at'])
+        else:
+            public_photos = execute_query_mysql(query_public_photos(photos['photo_id'].unique()), connection_params_gamma)
+        cached = (photos, public_photos)
+        complex_photos.put(id_c, photos, public_photos)
+    return cached[0].copy(), cached[1].copy()
+
+@instrumented('evaluation_by_sector')
 def evaluation_by_sector(data : pd.DataFrame):
     if data['spot_type_id'][0] == 13: #13 es sector retail
         #evaluar amenities del sector retail
@@ -237,31 +163,26 @@ def evaluation_by_sector(data : pd.DataFrame):
     porcentaje_columnas_completas = abs(((columnas_en_cero / total_columnas) * 100)-100)
     return porcentaje_columnas_completas
 
+@instrumented('evaluation_price_area')
 def evaluation_price_area(data:pd.DataFrame, sector_id: int):
     sector = sector_map.get(sector_id)
     if data['type_price'][0] == 'total_price':
         price_m2 = data['price'][0]/data['square_space'][0]
     elif data['type_price'][0] == 'price_sqm':
         price_m2 = data['price'][0]
-    if data['modality'][0] == 'rent':
-        query = query_qa_price_rent(price_m2, sector)
-        result_price = execute_query_postgres(query, connection_params_geo)
-    elif data['modality'][0] == 'sale':
-        query = query_qa_price_sale(price_m2, sector)
-        result_price = execute_query_postgres(query, connection_params_geo)
-    query = query_qa_area(data['square_space'][0], sector)
-    result_area = execute_query_postgres(query, connection_params_geo)
-
+    result_price = qa_limits.price_in_range(price_m2, sector, data['modality'][0])
+    result_area = qa_limits.area_in_range(data['square_space'][0], sector)
 
-    if result_price['dentro_del_rango'][0] == True and result_area['dentro_del_rango'][0] == True:
+    if result_price == True and result_area == True:
         return 100
-    elif result_price['dentro_del_rango'][0] == True and result_area['dentro_del_rango'][0] == False:
+    elif result_price == True and result_area == False:
         return 50
-    elif result_price['dentro_del_rango'][0] == False and result_area['dentro_del_rango'][0] == True:
+    elif result_price == False and result_area == True:
         return 50
     else:
         return 0
     
+@instrumented('evaluation_photos')
 def evaluation_photos(data_photos: pd.DataFrame, data_public_photos: pd.DataFrame):
     # evaluation of the quality of the name photos. 
     data_photos['score_name_photos'] = data_photos['name'].map(photos_map)
@@ -291,9 +212,15 @@ def evaluation_photos(data_photos: pd.DataFrame, data_public_photos: pd.DataFram
         pass
     return score_name_photos, score_quantity_photos
 
+@instrumented('evaluation_spot')
 def evaluation_spot(id: int):
     # main function to evaluate the spot, receives the id of the spot and returns a json with the evaluation of the spot.
     amenities, photos, prices, public_photos = get_id_spot(id)
+    return evaluation_spot_data(id, amenities, photos, prices, public_photos)
+
+@instrumented('evaluation_spot_data')
+def evaluation_spot_data(id: int, amenities: pd.DataFrame, photos: pd.DataFrame, prices: pd.DataFrame, public_photos: pd.DataFrame):
+    # evaluation of the spot from the data returned by get_id_spot
     a = evaluation_by_sector(amenities)
     pa = evaluation_price_area(prices, amenities['spot_type_id'][0])
     if photos is None:
@@ -334,4 +261,240 @@ def evaluation_spot(id: int):
                 'fotos_qa': list(photos['name']),
                 'fotos_complejo': 1
             }
-        return json_response
\ No newline at end of file
+        return json_response
+
+def get_photos_spots(ids: List[int]) -> pd.DataFrame:
+    return execute_query_postgres(query_photos_spots(ids), connection_params_geo)
+
+@instrumented('get_qa_limits')
+def get_qa_limits() -> Dict[str, pd.DataFrame]:
+    # the qa_limites_* tables hold a few rows per sector, they are read whole and kept in qa_limits
+    return {
+        'rent': execute_query_postgres(query_qa_limits_price_rent(), connection_params_geo),
+        'sale': execute_query_postgres(query_qa_limits_price_sale(), connection_params_geo),
+        'area': execute_query_postgres(query_qa_limits_area(), connection_params_geo)
+    }
+
+def get_qa_limits_version() -> Optional[int]:
+    # version of the tables written by qa_bounds, None before the first build (the table does not exist yet)
+    present = execute_query_postgres(query_qa_limits_versions_exists(), connection_params_geo)
+    if present is None or not bool(present['present'][0]):
+        return None
+    version = execute_query_postgres(query_qa_limits_version(), connection_params_geo)
+    if version is None or version.empty or pd.isna(version['version'][0]):
+        return None
+    return int(version['version'][0])
+
+qa_limits = QALimitsCache(get_qa_limits, source_version=get_qa_limits_version)
+
+# photos of the complexes shared by their children, see get_complex_photos and get_id_spots
+complex_photos = ComplexPhotoCache()
+
+def invalidate_complex_photos(ids: List[int]):
+    """
+    Drops the cached photos of the spots that are complexes and of the complexes of the others,
+    so the next scoring of the spots fetches them again. All complexes are dropped when the parents cannot be read.
+    """
+    ids = [int(i) for i in ids]
+    parents = execute_query_mysql(query_parent_ids(ids), connection_params_gamma)
+    if parents is None:
+        complex_photos.invalidate()
+        return
+    complex_photos.invalidate(ids + [int(i) for i in parents['parent_id']])
+
+@instrumented('get_id_spots')
+def get_id_spots(ids: List[int]):
+    """
+    Batch version of get_id_spot, fetches the data of many spots with one query per table.
+
+    Args:
+        ids (List[int]): ids of the spots
+
+    Returns:
+        amenities, photos, prices, public_photos: DataFrames with the rows of all the spots, amenities
+        only has spot_id, parent_id, spot_type_id and the variables_mask of completeness,
+        photos and public_photos hold the photos of the spots and of their complexes, keyed by spot_id.
+    """
+    amenities = execute_query_mysql(query_variables_mask(ids), connection_params_gamma)
+    prices = execute_query_mysql(query_prices_spots(ids), connection_params_gamma)
+
+    # photos of the spots and of their complexes, spots without photos inherit the ones of the complex.
+    # complexes already in complex_photos are not fetched again
+    parents = set(int(i) for i in amenities['parent_id'].dropna()) - set(int(i) for i in ids)
+    cached, missing = complex_photos.get_many(parents)
+    owners = set(int(i) for i in ids) | set(missing)
+    photos = get_photos_spots(owners)
+    public_photos = execute_query_mysql(query_public_photos_spots(owners), connection_params_gamma)
+
+    photos_by_owner = dict(tuple(photos.groupby('spot_id')))
+    for parent_id in missing:
+        photos_c = photos_by_owner.get(parent_id, photos.iloc[:0])
+        public_c = public_photos[public_photos['id'].isin(photos_c['photo_id'])]
+        complex_photos.put(parent_id, photos_c, public_c)
+    if cached:
+        photos = pd.concat([photos] + [c[0] for c in cached.values()], ignore_index=True)
+        public_photos = pd.concat([public_photos] + [c[1] for c in cached.values()], ignore_index=True)
+    return amenities, photos, prices, public_photos
+
+@instrumented('evaluation_by_sector_batch')
+def evaluation_by_sector_batch(data: pd.DataFrame) -> pd.Series:
+    # percentage of the sector variables filled for every spot from its variables_mask, indexed by spot_id
+    return pd.Series(completitud_from_masks(data['spot_type_id'], data['variables_mask']), index=data['spot_id'])
+
+@instrumented('price_area_checks')
+def price_area_checks(data: pd.DataFrame, sector_ids: pd.Series, limits: QALimitsSnapshot) -> pd.DataFrame:
+    # price per m2, area and range checks of the first price of every spot, indexed by spot_id
+    data = data.drop_duplicates(subset='id', keep='first').set_index('id').reindex(sector_ids.index)
+    sector = sector_ids.map(sector_map).to_numpy()
+    price = data['price'].astype(float)
+    square_space = data['square_space'].astype(float)
+    price_m2 = np.where(data['type_price'] == 'total_price', price / square_space,
+                        np.where(data['type_price'] == 'price_sqm', price, np.nan))
+    return pd.DataFrame({
+        'sector': sector,
+        'modality': data['modality'].to_numpy(),
+        'price_m2': price_m2,
+        'square_space': square_space.to_numpy(),
+        'price_in_range': limits.price_in_range(price_m2, sector, data['modality'].to_numpy()),
+        'area_in_range': limits.area_in_range(square_space.to_numpy(), sector)
+    }, index=sector_ids.index)
+
+def evaluation_spots(ids: List[int], chunk_size: int = 1000, audit_log: Optional[AuditLog] = None,
+                     engagement: Optional[EngagementFeatureStore] = None) -> List[dict]:
+    """
+    Batch version of evaluation_spot, evaluates many spots with a few queries per chunk of ids.
+
+    Args:
+        ids (List[int]): ids of the spots
+        chunk_size (int): number of spots fetched per query
+        audit_log (AuditLog): optional log where the audit records of every chunk are appended
+        engagement (EngagementFeatureStore): optional store whose features are added to every json as engagement
+
+    Returns:
+        List[dict]: the same json that evaluation_spot returns, for every spot in the order of ids. Spots that
+        cannot be scored (missing from spots or of an unknown sector) get {'id': id, 'error': message},
+        see is_scored.
+    """
+    ids = list(ids)
+    limits = qa_limits.snapshot()
+    results = []
+    for start in range(0, len(ids), chunk_size):
+        audit = [] if audit_log is not None else None
+        results.extend(evaluation_spots_chunk(ids[start:start + chunk_size], limits, audit))
+        if audit:
+            audit_log.append(audit[0])
+    if engagement is not None:
+        add_engagement(results, engagement)
+    return results
+
+def is_scored(result: dict) -> bool:
+    """False for the entries of evaluation_spots of the spots that cannot be scored."""
+    return 'error' not in result
+
+@instrumented('evaluation_spots_chunk')
+def evaluation_spots_chunk(ids: List[int], limits: QALimitsSnapshot, audit: Optional[list] = None) -> List[dict]:
+    # with an audit list, the audit records of the chunk are appended to it as one DataFrame
+    amenities, photos, prices, public_photos = get_id_spots(ids)
+    completitud = evaluation_by_sector_batch(amenities)
+    sector_ids = amenities.set_index('spot_id')['spot_type_id']
+    checks = price_area_checks(prices, sector_ids, limits)
+    precio = checks['price_in_range'].astype(int) * 50 + checks['area_in_range'].astype(int) * 50
+
+    with span('evaluation_photos_batch'):
+        scores_photos = PhotoIndex(photos, public_photos['id']).scores(amenities['spot_id'], amenities['parent_id'])
+
+    results = []
+    for id in ids:
+        id = int(id)
+        if id not in completitud.index:
+            results.append({'id': id, 'error': 'el spot no existe'})
+            continue
+        if np.isnan(completitud[id]):
+            results.append({'id': id, 'error': 'se provee un sector inexistente'})
+            continue
+        a = float(completitud[id])
+        pa = int(precio[id])
+        photos_spot = scores_photos.loc[id]
+        if not photos_spot['has_photos']:
+            results.append({
+                'id': id,
+                'completitud': round(a, 2),
+                'precio': pa,
+                'fotos': 0,
+                'fotos_cantidad': 0, 
+                'score': round(a*0.3 + pa*0.3 + 0*0.3 + 0*0.1, 2),
+                'fotos_publicas': 'el spot no tiene imagenes asociadas',
+                'fotos_qa': ''
+            })
+            continue
+        p1, p2 = float(photos_spot['fotos']), int(photos_spot['fotos_cantidad'])
+        fotos_publicas, fotos_qa = int(photos_spot['fotos_publicas']), list(photos_spot['fotos_qa'])
+        json_response = {
+            'id': id,
+            'completitud': round(a, 2),
+            'precio': pa,
+            'fotos': round(p1, 2),
+            'fotos_cantidad': p2, 
+            'score': round(a*0.3 + pa*0.3 + p1*0.3 + p2*0.1, 2),
+            'fotos_publicas': fotos_publicas,
+            'fotos_qa': fotos_qa
+        }
+        if photos_spot['complex_images'] == 1:
+            json_response['fotos_complejo'] = 1
+        results.append(json_response)
+
+    if audit is not None:
+        audit.append(audit_records([r for r in results if is_scored(r)], amenities, checks, limits))
+    return results
+
+
+async def get_id_spot_async(id: int):
+    """
+    Async version of get_id_spot. The amenities, prices and photos queries run at the same time
+    in worker threads, only the complex fallback and the public photos wait for the photos.
+    """
+    amenities, photos, prices = await asyncio.gather(
+        asyncio.to_thread(execute_query_mysql, query_completitud(id), connection_params_gamma),
+        asyncio.to_thread(execute_query_postgres, query_photos(id), connection_params_geo),
+        asyncio.to_thread(execute_query_mysql, query_prices(id), connection_params_gamma)
+    )
+
+    if photos.shape[0] == 0:
+        if amenities['parent_id'][0] is None:
+            return amenities, None, prices, None
+        photos, public_photos = await asyncio.to_thread(get_complex_photos, amenities['parent_id'][0])
+        photos['complex_images'] = 1
+        if photos.shape[0] == 0:
+            return amenities, None, prices, None
+        return amenities, photos, prices, public_photos
+    else:
+        photos['complex_images'] = 0
+
+    public_photos = await asyncio.to_thread(execute_query_mysql, query_public_photos(photos['photo_id'].unique()), connection_params_gamma)
+    return amenities, photos, prices, public_photos
+
+async def evaluation_spot_async(id: int, semaphore: Optional[asyncio.Semaphore] = None):
+    """
+    Async version of evaluation_spot, it does not block the event loop while the queries run.
+
+    Args:
+        id (int): id of the spot
+        semaphore (asyncio.Semaphore): optional semaphore shared by the callers to limit the spots evaluated at once
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(1)
+    async with semaphore:
+        # the range tables are loaded in a thread when they expire
+        await asyncio.to_thread(qa_limits.snapshot)
+        amenities, photos, prices, public_photos = await get_id_spot_async(id)
+    return evaluation_spot_data(id, amenities, photos, prices, public_photos)
+
+async def evaluation_spots_async(ids: List[int], concurrency: int = 10) -> List[dict]:
+    """
+    Evaluates many spots concurrently with at most `concurrency` spots querying the databases at once.
+
+    Returns:
+        List[dict]: the json of evaluation_spot for every spot in the order of ids
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*(evaluation_spot_async(id, semaphore) for id in ids))
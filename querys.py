@@ -1,27 +1,193 @@
+from typing import List
 
-def query_qa_price_rent(price_m2: float, sector: str):
-  query = f"""
-    SELECT
-      {price_m2} BETWEEN precio_m2_inferior AND precio_m2_superior AS dentro_del_rango
+from prepared import query
+
+
+def query_qa_limits_price_rent():
+  query = """
+    SELECT sector, precio_m2_inferior, precio_m2_superior
     FROM qa_limites_p_r
-    WHERE sector = '{sector}'
   """
   return query
 
-def query_qa_price_sale(price_m2: float, sector: str):
-  query = f"""
-    SELECT
-      {price_m2} BETWEEN precio_m2_inferior AND precio_m2_superior AS dentro_del_rango
+def query_qa_limits_price_sale():
+  query = """
+    SELECT sector, precio_m2_inferior, precio_m2_superior
     FROM qa_limites_p_s
-    WHERE sector = '{sector}'
   """
   return query
 
-def query_qa_area(area: float, sector: str):
-  query = f"""
-    SELECT
-      {area} BETWEEN area_limite_inferior AND area_limite_superior AS dentro_del_rango
+def query_qa_limits_area():
+  query = """
+    SELECT sector, area_limite_inferior, area_limite_superior
     FROM qa_limites_a_s
-    WHERE sector = '{sector}'
   """
-  return query
\ No newline at end of file
+  return query
+
+def query_qa_limits_versions_exists():
+  # qa_limites_versions is created by the first run of qa_bounds
+  query = """
+    SELECT to_regclass('qa_limites_versions') IS NOT NULL AS present
+  """
+  return query
+
+
+def query_qa_limits_version():
+  query = """
+    SELECT max(version) AS version
+    FROM qa_limites_versions
+  """
+  return query
+
+
+def query_completitud(id: int):
+  sql = """
+    SELECT 
+    s.id AS spot_id,
+    s.parent_id,
+    s.spot_type_id, 
+    s.natural_light, 
+    s.luminaries, 
+    s.charging_ports, 
+    s.energy, 
+    s.floor_material, 
+    s.fire_protection_system, 
+    s.security_type, 
+    s.vehicle_ramp, 
+    s.land_use, 
+    s.floor_level, 
+    s.vertical_height, 
+    s.parking_spaces, 
+    s.front, 
+    s.height, 
+    s.height_between_floors,
+
+    -- Amenidades
+    MAX(CASE WHEN a.name = 'Baños' THEN 1 ELSE NULL END) AS Banos,
+    MAX(CASE WHEN a.name = 'Wifi' THEN 1 ELSE NULL END) AS Wifi,
+    MAX(CASE WHEN a.name = 'A/C' THEN 1 ELSE NULL END) AS Ac,
+    MAX(CASE WHEN a.name = 'Estacionamiento' THEN 1 ELSE NULL END) AS Estacionamiento,
+    MAX(CASE WHEN a.name = 'Bodega' THEN 1 ELSE NULL END) AS Bodega,
+    MAX(CASE WHEN a.name = 'Accesibilidad' THEN 1 ELSE NULL END) AS Accesibilidad,
+    MAX(CASE WHEN a.name = 'Luz' THEN 1 ELSE NULL END) AS Luz,
+    MAX(CASE WHEN a.name = 'Sistema de seguridad' THEN 1 ELSE NULL END) AS Sistema_de_seguridad,
+    MAX(CASE WHEN a.name = 'Montacargas' THEN 1 ELSE NULL END) AS Montacargas,
+    MAX(CASE WHEN a.name = 'Pizarrón' THEN 1 ELSE NULL END) AS Pizarron,
+    MAX(CASE WHEN a.name = 'Elevador' THEN 1 ELSE NULL END) AS Elevador,
+    MAX(CASE WHEN a.name = 'Terraza' THEN 1 ELSE NULL END) AS Terraza,
+    MAX(CASE WHEN a.name = 'Zona de limpieza' THEN 1 ELSE NULL END) AS Zona_de_limpieza,
+    MAX(CASE WHEN a.name = 'Posibilidad a dividirse' THEN 1 ELSE NULL END) AS Posibilidad_a_dividirse,
+    MAX(CASE WHEN a.name = 'Mezzanine' THEN 1 ELSE NULL END) AS Mezzanine,
+    MAX(CASE WHEN a.name = 'cocina equipada' THEN 1 ELSE NULL END) AS Cocina_equipada,
+    MAX(CASE WHEN a.name = 'Cocina' THEN 1 ELSE NULL END) AS Cocina,
+    MAX(CASE WHEN a.name = 'Planta de luz' THEN 1 ELSE NULL END) AS Planta_de_luz,
+    MAX(CASE WHEN a.name = 'Tapanco' THEN 1 ELSE NULL END) AS Tapanco
+
+    FROM spots s
+    LEFT JOIN spot_amenities sa ON sa.spot_id = s.id
+    LEFT JOIN amenities a ON a.id = sa.amenity_id
+    WHERE s.id = %s
+    """
+  return query('completitud', sql, id)
+
+def query_photos(id: int):
+  # same statement as the list variant, the extra spot_id column is also there for the photos of complexes
+  return query_photos_spots([id])
+
+def query_photos_spots(spot_ids: List[int]):
+  sql = """
+    select spot_id, photo_id, additional_information, short_description, name, quality
+    from photos_aiclassification ai 
+    left join photos_aiclassification_photo_tag aitag on ai.id = aitag. aiclassification_id
+    left join photos_phototag tag on tag.id = aitag.phototag_id
+    where spot_id = ANY(%s)
+    """
+  return query('photos_spots', sql, spot_ids)
+
+def query_prices(id: int):
+  return query_prices_spots([id])
+
+def query_prices_spots(spot_ids: List[int]):
+  sql = """
+    select s.id, 
+    case when price_area = 1 then 'total_price'
+    when price_area = 2 then 'price_sqm' end as type_price, 
+    case when currency_type = 1 or currency_type is null then 'MXN'
+    else 'USD' end as currency,
+    case when type = 1 then 'rent'
+    when type = 2 then 'sale' end as modality, 
+    case when currency_type = 1 or currency_type is null then rate 
+    else  rate * 19 end as price,
+    s.square_space
+    from spots s 
+    join prices p on s.id = p.spot_id
+    where type in (1,2)
+    and p.deleted_at is null 
+    and s.id = ANY(%s)
+    """
+  return query('prices_spots', sql, spot_ids)
+
+def query_public_photos(photos_ids: List[int]):
+  sql = """
+    select id, deleted_at
+    from photos
+    where id = ANY(%s)
+    and deleted_at is null
+    """
+  return query('public_photos', sql, photos_ids)
+
+
+def query_public_photos_spots(spot_ids: List[int]):
+  sql = """
+    select id, spot_id
+    from photos
+    where spot_id = ANY(%s)
+    and deleted_at is null
+    """
+  return query('public_photos_spots', sql, spot_ids)
+
+
+def query_parent_ids(spot_ids: List[int]):
+  sql = """
+    select id as spot_id, parent_id
+    from spots
+    where id = ANY(%s)
+    and parent_id is not null
+    """
+  return query('parent_ids', sql, spot_ids)
+
+
+def query_active_ids(last_id: int, limit: int):
+  sql = """
+    select id
+    from spots
+    where spot_state = 1
+    and id > %s
+    order by id
+    limit %s
+    """
+  return query('active_ids', sql, last_id, limit)
+
+
+def query_qls_attributes(spot_ids: List[int]):
+  # the QLS attribute columns of lk_spots are not defined in this repository, see fused_scoring
+  sql = """
+    select spot_id, user_industria_role_id, user_broker_next_id, user_affiliation_id,
+    spot_exclusive_id, user_level_id
+    from lk_spots
+    where spot_id = ANY(%s)
+    """
+  return query('qls_attributes', sql, spot_ids)
+
+
+def query_bounds_source(last_id: int, limit: int):
+  sql = """
+    select spot_id, spot_sector, spot_price_sqm_mxn_rent, spot_price_sqm_mxn_sale, spot_area_in_sqm
+    from lk_spots
+    where spot_status_id = 1
+    and spot_type != 'Complex'
+    and spot_id > %s
+    order by spot_id
+    limit %s
+    """
+  return query('bounds_source', sql, last_id, limit)
@@ -0,0 +1,277 @@
+"""
+Append-only audit records of the scorings, explained offline without touching the databases.
+
+Every chunk scored by evaluation_spots (and fused_scoring with the QLS attributes) can be written as one
+Parquet part file with a compact row per spot: the filled variables mask, the price / area values with
+the bounds they were checked against, the photo tag counts, the score components and the level class.
+explain renders the same kind of description as qls_with_logs from a record, so a disputed score is
+read back as it was computed. The level tag and weight of the QLS configuration are stored with the record,
+explain uses them and flags a level class whose configuration changed since.
+
+    evaluation_spots(ids, audit_log=AuditLog())
+    for record in AuditLog().history(spot_id).to_dict('records'):
+        print('\\n'.join(explain(record)))
+"""
+
+import glob
+import os
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from completeness import SECTOR_MASKS, VARIABLES, VARIABLE_BITS
+from qa_limits import QALimitsSnapshot
+from quality_Level_scorer import quality_Level_scorer
+from quality_Level_scorer.quality_Level_scorer import level_classifier
+from quality_Level_scorer.quality_level_scorer_config import QLSConfig
+from score_store import SCORER_VERSION
+from variables_by_sector import photos_map, sector_map
+
+AUDIT_DIR = 'score_audit'
+# Tags counted in photo_tags, tags outside photos_map (and photos without tag) are counted in the last one
+PHOTO_TAGS = list(photos_map) + ['other']
+QLS_ATTRIBUTES = ['user_industria_role_id', 'user_broker_next_id', 'user_affiliation_id', 'spot_exclusive_id',
+                  'user_level_id']
+
+AUDIT_SCHEMA = pa.schema([
+    ('spot_id', pa.int64()),
+    ('scored_at', pa.timestamp('s', tz='UTC')),
+    ('scorer_version', pa.string()),
+    ('spot_type_id', pa.int16()),
+    ('variables_mask', pa.int64()),
+    ('completitud', pa.float32()),
+    ('modality', pa.string()),
+    ('price_m2', pa.float64()),
+    ('square_space', pa.float64()),
+    ('price_lower', pa.float64()),
+    ('price_upper', pa.float64()),
+    ('area_lower', pa.float64()),
+    ('area_upper', pa.float64()),
+    ('price_in_range', pa.bool_()),
+    ('area_in_range', pa.bool_()),
+    ('precio', pa.int8()),
+    ('photo_tags', pa.list_(pa.uint16())),
+    ('fotos_publicas', pa.uint16()),
+    ('complex_images', pa.bool_()),
+    ('fotos', pa.float32()),
+    ('fotos_cantidad', pa.int8()),
+    ('score', pa.float64()),
+    *[(attribute, pa.int16()) for attribute in QLS_ATTRIBUTES],
+    ('level_class_id', pa.int8()),
+    ('level_tag', pa.string()),
+    ('level_weight', pa.float64()),
+    ('qls_weight', pa.float64()),
+    ('qls_score', pa.float64())
+], metadata={'photo_tags': '\t'.join(PHOTO_TAGS)})
+
+
+def photo_tag_counts(fotos_qa) -> List[int]:
+    # number of public photo tags of every PHOTO_TAGS
+    counts = [0] * len(PHOTO_TAGS)
+    index = {tag: i for i, tag in enumerate(PHOTO_TAGS[:-1])}
+    for tag in fotos_qa or []:
+        counts[index.get(tag, len(PHOTO_TAGS) - 1)] += 1
+    return counts
+
+def audit_records(results: List[dict], amenities: pd.DataFrame, checks: pd.DataFrame,
+                  limits: QALimitsSnapshot) -> pd.DataFrame:
+    """
+    Audit records of a chunk scored by evaluation_spots_chunk, without the QLS columns.
+
+    Args:
+        results (List[dict]): json of evaluation_spot of the spots of the chunk
+        amenities (pd.DataFrame): spot_id, spot_type_id and variables_mask of the spots
+        checks (pd.DataFrame): output of quality_spot.price_area_checks, indexed by spot_id
+        limits (QALimitsSnapshot): bounds the spots were scored with
+    """
+    ids = [r['id'] for r in results]
+    spots = amenities.drop_duplicates('spot_id').set_index('spot_id').reindex(ids)
+    checks = checks.reindex(ids)
+    sectors = checks['sector'].to_numpy(dtype=object)
+    unknown = len(limits.sectors)
+    idx = np.array([limits.sectors.get(s, unknown) for s in sectors], dtype=int)
+    modality = checks['modality'].to_numpy(dtype=object)
+    # price bounds of the modality of every spot, NaN for modalities without bounds
+    price_bounds = np.full((len(ids), 2), np.nan)
+    for name in ('rent', 'sale'):
+        price_bounds[modality == name] = limits.bounds[name][idx[modality == name]]
+    area_bounds = limits.bounds['area'][idx]
+
+    return pd.DataFrame({
+        'spot_id': ids,
+        'scored_at': pd.Timestamp(datetime.now(timezone.utc).replace(microsecond=0)),
+        'scorer_version': SCORER_VERSION,
+        'spot_type_id': spots['spot_type_id'].astype(int).to_numpy(),
+        'variables_mask': [int(m) for m in spots['variables_mask']],
+        'completitud': [r['completitud'] for r in results],
+        'modality': [m if isinstance(m, str) else None for m in modality],
+        'price_m2': checks['price_m2'].to_numpy(dtype=float),
+        'square_space': checks['square_space'].to_numpy(dtype=float),
+        'price_lower': price_bounds[:, 0],
+        'price_upper': price_bounds[:, 1],
+        'area_lower': area_bounds[:, 0],
+        'area_upper': area_bounds[:, 1],
+        'price_in_range': checks['price_in_range'].to_numpy(dtype=bool),
+        'area_in_range': checks['area_in_range'].to_numpy(dtype=bool),
+        'precio': [r['precio'] for r in results],
+        'photo_tags': [photo_tag_counts(r['fotos_qa']) for r in results],
+        'fotos_publicas': [r['fotos_publicas'] if isinstance(r['fotos_publicas'], int) else 0 for r in results],
+        'complex_images': [r.get('fotos_complejo') == 1 for r in results],
+        'fotos': [r['fotos'] for r in results],
+        'fotos_cantidad': [r['fotos_cantidad'] for r in results],
+        'score': [r['score'] for r in results],
+        **{attribute: None for attribute in QLS_ATTRIBUTES},
+        'level_class_id': None,
+        'level_tag': None,
+        'level_weight': None,
+        'qls_weight': None,
+        'qls_score': None
+    })
+
+def add_qls(records: pd.DataFrame, attributes: pd.DataFrame, qls: pd.DataFrame, config: QLSConfig) -> pd.DataFrame:
+    """
+    QLS columns of audit_records filled from the attributes (indexed by spot_id), the output of
+    output_qls_batch and the configuration it was computed with.
+    """
+    attributes = attributes.reindex(records['spot_id'])
+    qls = qls.set_index('spot_id').reindex(records['spot_id'])
+    records = records.copy()
+    for attribute in QLS_ATTRIBUTES:
+        records[attribute] = attributes[attribute].to_numpy()
+    records['level_class_id'] = qls['level_class_id'].to_numpy()
+    # classes without config weigh 0 in output_qls_batch
+    records['level_tag'] = [config.tags[i] if i < len(config.tags) else None for i in records['level_class_id']]
+    records['level_weight'] = [config.weight(i) or 0. for i in records['level_class_id']]
+    records['qls_weight'] = config.ls_weight
+    records['qls_score'] = qls['qls_score'].to_numpy()
+    return records
+
+
+class AuditLog:
+    """
+    Directory of Parquet part files, one per appended chunk. Files are never rewritten, a new scoring
+    of a spot is a new record.
+
+    Args:
+        path (str): directory of the part files
+    """
+
+    def __init__(self, path: str = AUDIT_DIR):
+        self.path = path
+        self._sequence = 0
+        os.makedirs(path, exist_ok=True)
+
+    def append(self, records: pd.DataFrame) -> Optional[str]:
+        """Writes the records as a new part file, returns its path (None without records)."""
+        if records.empty:
+            return None
+        table = pa.Table.from_pandas(records[AUDIT_SCHEMA.names], schema=AUDIT_SCHEMA, preserve_index=False)
+        self._sequence += 1
+        path = os.path.join(self.path, f'part-{time.time_ns()}-{os.getpid()}-{self._sequence}.parquet')
+        # written under a temporary name so readers never see half a file
+        pq.write_table(table, f'{path}.tmp', compression='zstd')
+        os.replace(f'{path}.tmp', path)
+        return path
+
+    def read(self, ids: Optional[List[int]] = None) -> pd.DataFrame:
+        """Records of the spots in ids (all of them by default), the filter is pushed down to the files."""
+        files = sorted(glob.glob(os.path.join(self.path, 'part-*.parquet')))
+        dataset = ds.dataset(files, format='parquet', schema=AUDIT_SCHEMA)
+        where = None if ids is None else ds.field('spot_id').isin([int(i) for i in ids])
+        return dataset.to_table(filter=where).to_pandas()
+
+    def history(self, spot_id: int) -> pd.DataFrame:
+        """Records of a spot sorted by the time they were scored."""
+        return self.read([spot_id]).sort_values('scored_at', kind='stable').reset_index(drop=True)
+
+
+def _missing(value) -> bool:
+    return value is None or value != value
+
+def _bounds(lower, upper) -> str:
+    return 'no bounds' if _missing(lower) or _missing(upper) else f'[{lower:,.2f}, {upper:,.2f}]'
+
+def explain(record: dict) -> List[str]:
+    """
+    Description of a record of AuditLog, the same steps as evaluation_spot followed by the qls_with_logs
+    log when the record has the QLS columns.
+    """
+    description = [f"Spot {record['spot_id']} scored at {record['scored_at']} (scorer {record['scorer_version']})"]
+
+    sector = sector_map.get(int(record['spot_type_id']))
+    sector_bits = SECTOR_MASKS.get(int(record['spot_type_id']), 0)
+    variables = [v for v in VARIABLES if VARIABLE_BITS[v] & sector_bits]
+    filled = [v for v in variables if VARIABLE_BITS[v] & int(record['variables_mask'])]
+    missing = [v for v in variables if v not in filled]
+    description.append(f"➊ Completeness of the {sector} sector: {len(filled)} of {len(variables)} variables "
+                       f"filled, completitud {record['completitud']:.2f}.")
+    if missing:
+        description.append(f"   Missing: {', '.join(missing)}.")
+
+    description.append(f"➋ Price and area, precio {record['precio']}:")
+    if _missing(record['modality']):
+        description.append("   ❌ The spot has no price.")
+    else:
+        hit = '✅' if record['price_in_range'] else '❌'
+        description.append(f"   {hit} Price per m2 ({record['modality']}) {record['price_m2']:,.2f}, sector bounds "
+                           f"{_bounds(record['price_lower'], record['price_upper'])}.")
+    hit = '✅' if record['area_in_range'] else '❌'
+    description.append(f"   {hit} Area {record['square_space']:,.2f} m2, sector bounds "
+                       f"{_bounds(record['area_lower'], record['area_upper'])}.")
+
+    source = 'its complex' if record['complex_images'] else 'the spot'
+    description.append(f"➌ Photos: {record['fotos_publicas']} public photos of {source}, fotos {record['fotos']:.2f}, "
+                       f"fotos_cantidad {record['fotos_cantidad']}.")
+    tags = [f'{tag} x{count}' for tag, count in zip(PHOTO_TAGS, record['photo_tags']) if count]
+    if tags:
+        description.append(f"   Tags: {', '.join(tags)}.")
+    description.append(f"➍ Score: {record['completitud']:.2f}*0.3 + {record['precio']}*0.3 + "
+                       f"{record['fotos']:.2f}*0.3 + {record['fotos_cantidad']}*0.1 = {record['score']:.2f}")
+
+    if not _missing(record['level_class_id']):
+        description.extend(explain_qls(record))
+    return description
+
+def explain_qls(record: dict) -> List[str]:
+    """
+    Log of qls_with_logs for a record with the QLS columns, with the level tag and weight stored in the record
+    instead of the ones of the current configuration.
+    """
+    level_class_id = int(record['level_class_id'])
+    # the decision steps, without the final line taken from the current configuration
+    decided_id, log_lc = level_classifier(*[int(record[attribute]) for attribute in QLS_ATTRIBUTES])
+    description = log_lc[:-1]
+    config = quality_Level_scorer.QLS_CONFIG
+    live_tag = config.tags[level_class_id] if level_class_id < len(config.tags) else None
+    live_weight = config.weight(level_class_id) or 0.
+    # records written before the level columns were stored fall back to the current configuration
+    stored = not _missing(record.get('level_weight'))
+    tag = record['level_tag'] if stored else live_tag
+    tag = tag if isinstance(tag, str) else None
+    level_weight = float(record['level_weight']) if stored else live_weight
+    description.append(f"Final level class: {level_class_id} ({tag or 'Unknown tag'})")
+    if decided_id != level_class_id:
+        description.append(f"⚠️ The current rules classify these attributes as level class {decided_id}.")
+    if not stored:
+        description.append("⚠️ The record has no level weight, the current configuration is used.")
+    elif (tag, level_weight) != (live_tag, live_weight):
+        description.append(f"⚠️ The current configuration has level class {level_class_id} as "
+                           f"{live_tag or 'Unknown tag'} with weight {live_weight}.")
+
+    qls_weight = float(record['qls_weight'])
+    score = float(record['score'])
+    qls_score = (1. - qls_weight) * score + qls_weight * level_weight
+    description.append("➋ Computing the Quality Level Score (QLS):")
+    source = 'stored with the record' if stored else 'from the current config'
+    description.append(f"Level weight {source}: {level_weight} (for class {level_class_id})")
+    description.append(f"QLS = (1 - {qls_weight}) * {score} + {qls_weight} * {level_weight} = {qls_score:.2f}")
+    description.append("➌ Final classification summary:")
+    description.append(f"✅ Spot {record['spot_id']} has been classified with a QLS score of "
+                       f"{float(record['qls_score']):.2f}.")
+    return description
@@ -0,0 +1,150 @@
+"""
+Scores the whole active catalog in chunks and writes the results as they are computed.
+
+    python score_catalog.py --output scores.jsonl --chunk-size 1000
+    python score_catalog.py --output quality_scores --format parquet
+
+The active spot ids are read from `spots` by pages of ids through the connection pool, every chunk goes through
+evaluation_spots and is appended to the output. A checkpoint file keeps the last id written, so an
+interrupted run continues where it stopped.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Iterator, List
+
+from credenciales_gamma import connection_params_gamma
+from prepared import query
+from quality_spot import evaluation_spots, execute_query_mysql, is_scored
+from querys import query_active_ids
+from score_store import ParquetScoreStore, jsonable
+
+
+def stream_active_ids(last_id: int, chunk_size: int) -> Iterator[List[int]]:
+    """
+    Yields the ids of the active spots greater than last_id, in order and in lists of chunk_size.
+    Every list is its own query on the last id of the previous one, so no cursor stays open while it is scored.
+    """
+    while True:
+        page = execute_query_mysql(query_active_ids(last_id, chunk_size), connection_params_gamma)
+        if page is None:
+            raise RuntimeError(f'could not read the active spots after id {last_id}')
+        if page.empty:
+            return
+        ids = [int(id) for id in page['id']]
+        yield ids
+        last_id = ids[-1]
+
+def count_active(last_id: int) -> int:
+    count = execute_query_mysql(query('count_active', "select count(*) as n from spots where spot_state = 1 and id > %s",
+                                      last_id), connection_params_gamma)
+    return int(count['n'][0])
+
+def load_checkpoint(path: str) -> dict:
+    if not os.path.exists(path):
+        return {'last_id': 0, 'scored': 0, 'offset': 0}
+    with open(path) as f:
+        return json.load(f)
+
+def save_checkpoint(checkpoint: dict, path: str):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+class JsonlWriter:
+    """
+    Appends one json per line. The file is truncated to the offset of the checkpoint when it is
+    opened, so a chunk written after the last checkpoint is not duplicated.
+    """
+
+    def __init__(self, path: str, offset: int):
+        self.file = open(path, 'a+b')
+        self.file.truncate(offset)
+        self.file.seek(offset)
+
+    def write(self, results: List[dict]) -> int:
+        for result in results:
+            line = json.dumps(jsonable(result), default=str, ensure_ascii=False, allow_nan=False)
+            self.file.write((line + '\n').encode('utf-8'))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """Writes one Parquet file per chunk through ParquetScoreStore, repeated ids keep the newest row."""
+
+    def __init__(self, path: str):
+        self.store = ParquetScoreStore(path, batch_size=sys.maxsize)
+
+    def write(self, results: List[dict]) -> int:
+        self.store.write(results)
+        return 0
+
+    def close(self):
+        pass
+
+
+def format_eta(seconds: float) -> str:
+    seconds = int(seconds)
+    return f'{seconds // 3600}h{seconds % 3600 // 60:02d}m{seconds % 60:02d}s'
+
+def score_catalog(output: str, output_format: str = 'jsonl', chunk_size: int = 1000, checkpoint_path: str = None):
+    """
+    Scores the active catalog, see the module docstring.
+
+    Args:
+        output (str): jsonl file or directory of Parquet files
+        output_format (str): 'jsonl' or 'parquet'
+        chunk_size (int): spots evaluated at once
+        checkpoint_path (str): checkpoint file, by default the output path with `.checkpoint`
+    """
+    checkpoint_path = checkpoint_path or f'{output.rstrip("/")}.checkpoint'
+    checkpoint = load_checkpoint(checkpoint_path)
+    if output_format == 'jsonl':
+        writer = JsonlWriter(output, checkpoint['offset'])
+    elif output_format == 'parquet':
+        writer = ParquetWriter(output)
+    else:
+        raise ValueError(f"output_format must be 'jsonl' or 'parquet', got {output_format!r}")
+
+    total = count_active(checkpoint['last_id'])
+    print(f"{total} spots to score, starting after id {checkpoint['last_id']}")
+    start = time.monotonic()
+    done = 0
+    try:
+        for ids in stream_active_ids(checkpoint['last_id'], chunk_size):
+            results = evaluation_spots(ids, chunk_size=chunk_size)
+            offset = writer.write(results)
+            done += len(ids)
+            checkpoint = {'last_id': ids[-1], 'scored': checkpoint['scored'] + sum(map(is_scored, results)), 'offset': offset}
+            save_checkpoint(checkpoint, checkpoint_path)
+
+            elapsed = time.monotonic() - start
+            rate = done / elapsed if elapsed > 0 else 0.
+            eta = (total - done) / rate if rate > 0 else 0.
+            print(f"{done}/{total} spots, {rate:.1f} spots/s, ETA {format_eta(eta)}", flush=True)
+    finally:
+        writer.close()
+    print(f"done: {checkpoint['scored']} spots scored in total, last id {checkpoint['last_id']}")
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='Scores the active catalog with quality_spot.evaluation_spots.')
+    parser.add_argument('--output', required=True, help='jsonl file or directory of Parquet files')
+    parser.add_argument('--format', choices=['jsonl', 'parquet'], default='jsonl', dest='output_format')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='spots evaluated at once')
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file, default <output>.checkpoint')
+    args = parser.parse_args(argv)
+    score_catalog(args.output, args.output_format, args.chunk_size, args.checkpoint)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+Store of the results of evaluation_spot / evaluation_spots and the QLS score.
+
+SQLite and Parquet stores are meant for the test harness, the Postgres store for production.
+Every row keeps the scorer version and the time it was computed, so cached scores can be served
+by id without touching the source databases.
+"""
+
+import glob
+import json
+import math
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+# Version of the scoring logic, increase it when the score of a spot can change for the same data
+SCORER_VERSION = '1.0'
+
+SCORE_COLUMNS = ['id', 'completitud', 'precio', 'fotos', 'fotos_cantidad', 'score', 'qls_score', 'level_class_id',
+                 'scorer_version', 'computed_at', 'result']
+
+
+def jsonable(value):
+    """
+    Value with numpy scalars as python values and NaN / infinity as None, NaN (e.g. photos without tag in
+    fotos_qa) is not valid json and jsonb rejects it.
+    """
+    if isinstance(value, dict):
+        return {str(k): jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonable(v) for v in value]
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+def score_rows(results: List[dict], qls_outputs: Optional[List[dict]] = None) -> List[tuple]:
+    """
+    Builds the rows of the store from the json of evaluation_spot and, optionally, the output of output_qls.
+
+    Args:
+        results (List[dict]): json of evaluation_spot for every spot, error entries of evaluation_spots are skipped
+        qls_outputs (List[dict]): output of output_qls, matched by spot_id
+    """
+    qls = {o['spot_id']: o for o in qls_outputs or []}
+    computed_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    rows = []
+    for result in results:
+        if 'error' in result:
+            continue
+        o = qls.get(result['id'])
+        rows.append((
+            int(result['id']),
+            float(result['completitud']),
+            float(result['precio']),
+            float(result['fotos']),
+            float(result['fotos_cantidad']),
+            float(result['score']),
+            float(o['qls_score']) if o else None,
+            int(o['level_class_id']) if o else None,
+            SCORER_VERSION,
+            computed_at,
+            json.dumps(jsonable(result), default=str, allow_nan=False)
+        ))
+    return rows
+
+
+class ScoreStore:
+    """
+    Base class of the stores, subclasses implement _upsert and _read.
+
+    Args:
+        batch_size (int): number of rows written at once
+    """
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+
+    def write(self, results: List[dict], qls_outputs: Optional[List[dict]] = None):
+        """Writes (or replaces) the scores of the spots in batches."""
+        rows = score_rows(results, qls_outputs)
+        for start in range(0, len(rows), self.batch_size):
+            self._upsert(rows[start:start + self.batch_size])
+
+    def get(self, ids: List[int]) -> Dict[int, dict]:
+        """
+        Returns the stored scores by id, spots without a score are missing from the result.
+        Every record has the columns of SCORE_COLUMNS with `result` parsed back to the json of evaluation_spot.
+        """
+        records = {}
+        for row in self._read([int(i) for i in ids]):
+            record = dict(zip(SCORE_COLUMNS, row))
+            record['result'] = json.loads(record['result'])
+            records[record['id']] = record
+        return records
+
+    def close(self):
+        pass
+
+    def _upsert(self, rows: List[tuple]):
+        raise NotImplementedError
+
+    def _read(self, ids: List[int]) -> List[tuple]:
+        raise NotImplementedError
+
+
+class SQLiteScoreStore(ScoreStore):
+    """Scores kept in a local SQLite file."""
+
+    def __init__(self, path: str = 'quality_scores.db', batch_size: int = 1000):
+        super().__init__(batch_size)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+        create table if not exists quality_scores (
+            id integer primary key,
+            completitud real,
+            precio real,
+            fotos real,
+            fotos_cantidad real,
+            score real,
+            qls_score real,
+            level_class_id integer,
+            scorer_version text,
+            computed_at text,
+            result text
+        )
+        """)
+
+    def _upsert(self, rows):
+        with self.connection:
+            self.connection.executemany(
+                f"insert or replace into quality_scores ({', '.join(SCORE_COLUMNS)}) "
+                f"values ({', '.join('?' * len(SCORE_COLUMNS))})", rows)
+
+    def _read(self, ids):
+        rows = []
+        # sqlite limits the number of parameters of a statement
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows.extend(self.connection.execute(
+                f"select {', '.join(SCORE_COLUMNS)} from quality_scores where id in ({', '.join('?' * len(chunk))})",
+                chunk).fetchall())
+        return rows
+
+    def close(self):
+        self.connection.close()
+
+
+class ParquetScoreStore(ScoreStore):
+    """Scores kept in a directory of Parquet files, one file per batch, the newest row of an id wins."""
+
+    def __init__(self, path: str = 'quality_scores', batch_size: int = 1000):
+        super().__init__(batch_size)
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _upsert(self, rows):
+        part = len(glob.glob(os.path.join(self.path, 'part-*.parquet')))
+        df = pd.DataFrame(rows, columns=SCORE_COLUMNS)
+        df.to_parquet(os.path.join(self.path, f'part-{part:06d}.parquet'), index=False)
+
+    def _read(self, ids):
+        files = sorted(glob.glob(os.path.join(self.path, 'part-*.parquet')))
+        if not files:
+            return []
+        df = pd.concat([pd.read_parquet(f, filters=[('id', 'in', ids)]) for f in files], ignore_index=True)
+        df = df.drop_duplicates(subset='id', keep='last')
+        df = df.astype(object).where(df.notnull(), None)
+        return list(df[SCORE_COLUMNS].itertuples(index=False, name=None))
+
+
+class PostgresScoreStore(ScoreStore):
+    """Scores kept in a Postgres table, written with multi-row upserts."""
+
+    def __init__(self, connection_params: dict, table: str = 'quality_scores', batch_size: int = 1000):
+        super().__init__(batch_size)
+        from db_pool import postgres_pool
+        self.pool = postgres_pool(connection_params)
+        self.table = table
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(f"""
+                create table if not exists {table} (
+                    id bigint primary key,
+                    completitud double precision,
+                    precio double precision,
+                    fotos double precision,
+                    fotos_cantidad double precision,
+                    score double precision,
+                    qls_score double precision,
+                    level_class_id integer,
+                    scorer_version text,
+                    computed_at timestamptz,
+                    result jsonb
+                )
+                """)
+            connection.commit()
+
+    def _upsert(self, rows):
+        from psycopg2.extras import execute_values
+        update = ', '.join(f'{c} = excluded.{c}' for c in SCORE_COLUMNS[1:])
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                execute_values(cursor,
+                               f"insert into {self.table} ({', '.join(SCORE_COLUMNS)}) values %s "
+                               f"on conflict (id) do update set {update}",
+                               rows, page_size=self.batch_size)
+            connection.commit()
+
+    def _read(self, ids):
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"select {', '.join(SCORE_COLUMNS[:-2])}, computed_at::text, result::text "
+                    f"from {self.table} where id = any(%s)", (ids,))
+                return cursor.fetchall()
@@ -0,0 +1,328 @@
+"""
+Local HTTP service around quality_spot and quality_Level_scorer for the listing editor.
+
+Requests for the same spot id that arrive while it is being scored share one computation, results are
+kept for a few seconds in a cache invalidated by spot id, and the ids of concurrent requests are
+gathered for up to max_wait seconds into one call of fused_scoring.score_spots_with_qls, so a burst
+of saves runs the batch queries once instead of the evaluation_spot fan-out per request.
+
+    GET  /score/<spot_id>              json of evaluation_spot with qls_score and level_class_id
+                                       (404 with {"id", "error"} for a spot that cannot be scored)
+    POST /score       {"ids": [...]}   {"results": {spot_id: json, {"id", "error"} or null}}
+    POST /invalidate  {"ids": [...]}   drops the cached results and complex photos of the spots, e.g. after a save
+    GET  /stats                        counters of the service
+
+    python scoring_service.py --port 8080 --attributes-source lk_spots
+"""
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+from fused_scoring import ATTRIBUTE_SOURCES, AttributesSource, score_spots_with_qls
+from instrumentation import span
+from quality_spot import invalidate_complex_photos
+from score_audit import AuditLog
+from score_store import jsonable
+
+# Seconds a result is served from the cache
+SERVICE_CACHE_TTL = 5.0
+# Seconds the first pending id waits for more ids before its batch is scored
+SERVICE_MAX_WAIT = 0.01
+# Spots scored per batch
+SERVICE_MAX_BATCH = 500
+# Seconds a request waits for its results
+SERVICE_TIMEOUT = 30.0
+
+
+class ResultCache:
+    """
+    Results by spot id for ttl seconds. Every id has a generation increased by invalidate, a result
+    computed before an invalidation is not stored.
+    """
+
+    def __init__(self, ttl: float = SERVICE_CACHE_TTL):
+        self.ttl = ttl
+        self._results: Dict[int, tuple] = {}
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, spot_id: int):
+        """Cached result of the spot, KeyError when it is missing or expired."""
+        with self._lock:
+            stored_at, result = self._results[spot_id]
+            if time.monotonic() - stored_at > self.ttl:
+                del self._results[spot_id]
+                raise KeyError(spot_id)
+            return result
+
+    def generation(self, spot_id: int) -> int:
+        with self._lock:
+            return self._generations.get(spot_id, 0)
+
+    def put(self, spot_id: int, result, generation: int):
+        with self._lock:
+            if self._generations.get(spot_id, 0) == generation:
+                self._results[spot_id] = (time.monotonic(), result)
+
+    def invalidate(self, ids: List[int]):
+        with self._lock:
+            for spot_id in ids:
+                self._results.pop(spot_id, None)
+                self._generations[spot_id] = self._generations.get(spot_id, 0) + 1
+
+
+class ScoringService:
+    """
+    Coalescing, cache and micro-batching in front of a batch scorer.
+
+    Args:
+        scorer (Callable): function scoring a list of ids, returns the result json of every scored spot
+            (spots missing from its output are answered with None), e.g. score_with_qls with an attributes source
+        cache_ttl (float): seconds a result is served from the cache
+        max_wait (float): seconds the first pending id waits for more ids
+        max_batch (int): maximum number of spots scored at once
+        invalidate_photos (Callable): drops the photos cached by the scorer for a list of ids,
+            by default the complex photos of quality_spot
+    """
+
+    def __init__(self, scorer: Callable[[List[int]], List[dict]],
+                 cache_ttl: float = SERVICE_CACHE_TTL, max_wait: float = SERVICE_MAX_WAIT,
+                 max_batch: int = SERVICE_MAX_BATCH,
+                 invalidate_photos: Optional[Callable[[List[int]], None]] = invalidate_complex_photos):
+        self.scorer = scorer
+        self.invalidate_photos = invalidate_photos
+        self.cache = ResultCache(cache_ttl)
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        # futures of the ids waiting for a batch or being scored, new requests of the same id share them
+        self._futures: Dict[int, Future] = {}
+        self._pending: List[int] = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self.stats = {'requests': 0, 'spots': 0, 'cache_hits': 0, 'coalesced': 0, 'batches': 0, 'scored': 0,
+                      'errors': 0}
+        self._worker = threading.Thread(target=self._run, name='scoring-batcher', daemon=True)
+        self._worker.start()
+
+    def score(self, ids: List[int], timeout: float = SERVICE_TIMEOUT) -> Dict[int, Optional[dict]]:
+        """Results of the spots by id, None for spots that cannot be scored."""
+        ids = list(dict.fromkeys(int(i) for i in ids))
+        results, futures = {}, {}
+        with self._condition:
+            self.stats['requests'] += 1
+            self.stats['spots'] += len(ids)
+            for spot_id in ids:
+                try:
+                    results[spot_id] = self.cache.get(spot_id)
+                    self.stats['cache_hits'] += 1
+                    continue
+                except KeyError:
+                    pass
+                future = self._futures.get(spot_id)
+                if future is not None:
+                    self.stats['coalesced'] += 1
+                else:
+                    future = self._futures[spot_id] = Future()
+                    self._pending.append(spot_id)
+                futures[spot_id] = future
+            if futures:
+                self._condition.notify()
+
+        deadline = time.monotonic() + timeout
+        for spot_id, future in futures.items():
+            results[spot_id] = future.result(max(0., deadline - time.monotonic()))
+        return {spot_id: results[spot_id] for spot_id in ids}
+
+    def invalidate(self, ids: List[int]):
+        """
+        Drops the cached results of the spots and the photos of their complexes. A computation already
+        running for them is not shared with later requests and its result is not cached.
+        """
+        ids = [int(i) for i in ids]
+        # before the results, so the next scoring of the spots reads the photos again
+        if self.invalidate_photos is not None:
+            self.invalidate_photos(ids)
+        with self._condition:
+            self.cache.invalidate(ids)
+            for spot_id in ids:
+                # pending ids are scored after the invalidation, they stay shared
+                if spot_id not in self._pending:
+                    self._futures.pop(spot_id, None)
+
+    def close(self):
+        """Stops the batching thread, requests still waiting for a batch fail."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join()
+        with self._condition:
+            futures = [self._futures.pop(spot_id) for spot_id in self._pending]
+            self._pending = []
+        for future in futures:
+            future.set_exception(RuntimeError('the scoring service is closed'))
+
+    def _next_batch(self) -> Optional[tuple]:
+        # ids of the next batch with their futures and cache generations, None once closed
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                return None
+            # the first id waits up to max_wait for the ids of concurrent requests
+            deadline = time.monotonic() + self.max_wait
+            while len(self._pending) < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            self.stats['batches'] += 1
+            self.stats['scored'] += len(batch)
+            return (batch, {spot_id: self._futures[spot_id] for spot_id in batch},
+                    {spot_id: self.cache.generation(spot_id) for spot_id in batch})
+
+    def _run(self):
+        while True:
+            next_batch = self._next_batch()
+            if next_batch is None:
+                return
+            batch, futures, generations = next_batch
+            try:
+                with span('service_batch') as batch_span:
+                    scored = {int(result['id']): result for result in self.scorer(batch)}
+                    if batch_span:
+                        batch_span.record(rows=len(batch))
+            except Exception as e:
+                print(f'Error scoring a batch of {len(batch)} spots: {e}')
+                with self._condition:
+                    self.stats['errors'] += 1
+                    self._release(futures)
+                for future in futures.values():
+                    future.set_exception(e)
+                continue
+
+            with self._condition:
+                for spot_id in batch:
+                    self.cache.put(spot_id, scored.get(spot_id), generations[spot_id])
+                self._release(futures)
+            for spot_id, future in futures.items():
+                future.set_result(scored.get(spot_id))
+
+    def _release(self, futures: Dict[int, Future]):
+        # the ids can be requested again, unless an invalidation already replaced their future
+        for spot_id, future in futures.items():
+            if self._futures.get(spot_id) is future:
+                del self._futures[spot_id]
+
+
+def score_with_qls(ids: List[int], attributes_source: AttributesSource,
+                   audit_log: Optional[AuditLog] = None) -> List[dict]:
+    # chunks as large as the batches of the service
+    results, _ = score_spots_with_qls(ids, attributes_source, chunk_size=max(len(ids), 1), audit_log=audit_log)
+    return results
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    """Handler of the endpoints of the module docstring, the service is set by make_server."""
+
+    service: ScoringService = None
+
+    def _send(self, status: int, body):
+        data = json.dumps(jsonable(body)).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _ids(self) -> Optional[List[int]]:
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            return [int(i) for i in body['ids']]
+        except (ValueError, KeyError, TypeError):
+            self._send(400, {'error': 'the body must be {"ids": [spot ids]}'})
+            return None
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        if parts == ['stats']:
+            return self._send(200, self.service.stats)
+        if len(parts) != 2 or parts[0] != 'score' or not parts[1].isdigit():
+            return self._send(404, {'error': f'unknown path {self.path}'})
+        spot_id = int(parts[1])
+        try:
+            result = self.service.score([spot_id])[spot_id]
+        except Exception as e:
+            return self._send(500, {'error': str(e)})
+        if result is None:
+            return self._send(404, {'error': f'spot {spot_id} cannot be scored'})
+        if 'error' in result:
+            # entry of evaluation_spots for a spot that cannot be scored
+            return self._send(404, result)
+        self._send(200, result)
+
+    def do_POST(self):
+        if self.path not in ('/score', '/invalidate'):
+            return self._send(404, {'error': f'unknown path {self.path}'})
+        ids = self._ids()
+        if ids is None:
+            return
+        if self.path == '/invalidate':
+            self.service.invalidate(ids)
+            return self._send(200, {'invalidated': ids})
+        try:
+            self._send(200, {'results': self.service.score(ids)})
+        except Exception as e:
+            self._send(500, {'error': str(e)})
+
+    def log_message(self, format, *args):
+        # one line per request on stderr is too much for the editor bursts
+        pass
+
+
+class ScoringServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 resets connections during the bursts of saves
+    request_queue_size = 128
+
+
+def make_server(service: ScoringService, host: str = '127.0.0.1', port: int = 8080) -> ScoringServer:
+    """HTTP server of service, port 0 picks a free port (server.server_address)."""
+    handler = type('Handler', (ScoringHandler,), {'service': service})
+    return ScoringServer((host, port), handler)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='HTTP service of the quality and QLS scores.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--ttl', type=float, default=SERVICE_CACHE_TTL, help='seconds results are cached')
+    parser.add_argument('--max-wait', type=float, default=SERVICE_MAX_WAIT,
+                        help='seconds a request waits for others to share its batch')
+    parser.add_argument('--max-batch', type=int, default=SERVICE_MAX_BATCH)
+    parser.add_argument('--audit-dir', default=None, help='write the audit records of the scorings here')
+    parser.add_argument('--attributes-source', required=True, choices=sorted(ATTRIBUTE_SOURCES),
+                        help='where the QLS attributes of the spots are read, see fused_scoring')
+    args = parser.parse_args(argv)
+
+    audit_log = AuditLog(args.audit_dir) if args.audit_dir else None
+    attributes_source = ATTRIBUTE_SOURCES[args.attributes_source]
+    service = ScoringService(lambda ids: score_with_qls(ids, attributes_source, audit_log),
+                             args.ttl, args.max_wait, args.max_batch)
+    server = make_server(service, args.host, args.port)
+    print(f'scoring service listening on {server.server_address[0]}:{server.server_address[1]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
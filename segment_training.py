@@ -0,0 +1,238 @@
+"""
+Training of the inquiry-probability models of prediccion_by_historic.ipynb, one per (spot_sector, spot_modality).
+
+Segments are trained in parallel processes with joblib. Every fitted model is saved with its
+feature_columns and metrics in a cache directory, under a hash of the segment data, the target and
+the hyperparameters, so segments whose data did not change are loaded instead of trained again.
+build_threshold_map reuses the same results and saves the map next to the models. With an
+engagement_features store the view / inquiry counts (e.g. total_vistas_60_dias) are read from it
+by spot_id instead of being recomputed from views.csv and lk_inquiries.
+
+    results, models = train_and_evaluate_by_segment(data_clean, 'number_of_inquiries')
+    threshold_map, results = build_threshold_map(data_clean, 'total_vistas_60_dias', engagement=store)
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import classification_report, roc_auc_score
+from sklearn.model_selection import train_test_split
+
+from engagement_features import EngagementFeatureStore
+
+MODELS_DIR = 'segment_models'
+# Segments with fewer rows are not trained
+MIN_SEGMENT_ROWS = 50
+COMMON_FEATURES = ["spot_type", "spot_latitude", "spot_longitude", "spot_area_in_sqm"]
+PRICE_FEATURES = {
+    "Rent": ["spot_price_total_mxn_rent", "spot_price_sqm_mxn_rent"],
+    "Sale": ["spot_price_total_mxn_sale", "spot_price_sqm_mxn_sale"]
+}
+MODEL_PARAMS = {'n_estimators': 100, 'max_depth': 8, 'random_state': 42, 'class_weight': 'balanced'}
+TEST_SIZE = 0.2
+THRESHOLDS = tuple(np.round(np.linspace(0.1, 0.9, 9), 2))
+
+
+def train_model_by_modality(df: pd.DataFrame, modality: str, params: Optional[dict] = None) -> Tuple[RandomForestClassifier, List[str]]:
+    """
+    Entrena un RandomForestClassifier para predecir si una publicación tendrá al menos 1 inquiry,
+    diferenciando variables según la modalidad ('Rent' o 'Sale').
+    """
+    if modality not in PRICE_FEATURES:
+        raise ValueError("Modality must be 'Rent' or 'Sale'")
+
+    feature_columns = COMMON_FEATURES + PRICE_FEATURES[modality]
+
+    df_model = df[feature_columns + ["has_info"]].copy()
+    df_model = pd.get_dummies(df_model)
+
+    X = df_model.drop(columns="has_info")
+    y = df_model["has_info"]
+
+    model = RandomForestClassifier(**(params or MODEL_PARAMS))
+    model.fit(X, y)
+
+    return model, X.columns.tolist()
+
+def predict_score_classifier(input_df: pd.DataFrame, model: BaseEstimator, feature_columns: List[str]) -> pd.DataFrame:
+    input_df = input_df.copy()
+    df_encoded = pd.get_dummies(input_df)
+    df_encoded = df_encoded.reindex(columns=feature_columns, fill_value=0)
+
+    y_proba = model.predict_proba(df_encoded)[:, 1]
+    score = (y_proba * 100).round(1)
+
+    input_df["probability"] = y_proba
+    input_df["quality_score"] = score
+
+    return input_df.reset_index(drop=True)
+
+def evaluate_classifier_threshold(df: pd.DataFrame, thresholds: List[float] = [0.5], target_variable: str = "number_of_inquiries") -> dict:
+    y_true = (df[target_variable].fillna(0) >= 1).astype(int)
+    roc = roc_auc_score(y_true, df["probability"])
+
+    best_result = {
+        "threshold": 0.5,
+        "precision": 0.0,
+        "recall": 0.0,
+        "f1-score": 0.0,
+        "roc_auc": round(roc, 3)
+    }
+
+    for t in thresholds:
+        y_pred = (df["probability"] >= t).astype(int)
+        report = classification_report(y_true, y_pred, output_dict=True, zero_division=0)
+
+        f1 = report["1"]["f1-score"]
+        if f1 > best_result["f1-score"]:
+            best_result.update({
+                "threshold": round(float(t), 2),
+                "precision": round(report["1"]["precision"], 3),
+                "recall": round(report["1"]["recall"], 3),
+                "f1-score": round(f1, 3)
+            })
+
+    return best_result
+
+
+def with_engagement_features(df: pd.DataFrame, store: EngagementFeatureStore) -> pd.DataFrame:
+    """df with the columns of the store joined by spot_id, they replace columns of the same name."""
+    features = store.to_frame(df['spot_id'])
+    df = df.drop(columns=[c for c in store.columns if c in df])
+    return df.merge(features, on='spot_id', how='left')
+
+def segment_key(df_segment: pd.DataFrame, sector: str, modality: str, target_variable: str, params: dict) -> str:
+    """Hash of the rows used to train a segment (in order), the target and the hyperparameters."""
+    columns = [c for c in COMMON_FEATURES + PRICE_FEATURES.get(modality, []) + [target_variable] if c in df_segment]
+    digest = hashlib.sha256()
+    digest.update(json.dumps([sector, modality, target_variable, columns, params, TEST_SIZE, THRESHOLDS],
+                             sort_keys=True, default=str).encode())
+    digest.update(pd.util.hash_pandas_object(df_segment[columns], index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:32]
+
+def train_segment(df_segment: pd.DataFrame, sector: str, modality: str, target_variable: str, params: dict,
+                  path: str) -> Optional[dict]:
+    """
+    Trains and evaluates one segment and saves {model, feature_columns, metrics} in path.
+    Runs in a worker process, returns the metrics row or None if the segment fails.
+    """
+    try:
+        df_segment = df_segment.copy()
+        df_segment["has_info"] = (df_segment[target_variable].fillna(0) >= 1).astype(int)
+
+        df_train, df_test = train_test_split(
+            df_segment,
+            test_size=TEST_SIZE,
+            random_state=42,
+            stratify=df_segment["has_info"]
+        )
+
+        model, feature_cols = train_model_by_modality(df_train, modality, params)
+        df_pred = predict_score_classifier(df_test, model, feature_cols)
+        metrics = evaluate_classifier_threshold(df_pred, thresholds=THRESHOLDS, target_variable=target_variable)
+
+        row = {
+            "sector": sector,
+            "modality": modality,
+            "n_train": len(df_train),
+            "n_test": len(df_test),
+            **metrics
+        }
+        # written under a temporary name so an interrupted run never leaves half a model
+        joblib.dump({'model': model, 'feature_columns': feature_cols, 'metrics': row}, f'{path}.tmp')
+        os.replace(f'{path}.tmp', path)
+        return row
+
+    except Exception as e:
+        print(f"Error con sector={sector}, modality={modality}: {e}")
+        return None
+
+def train_and_evaluate_by_segment(df: pd.DataFrame, target_variable: str, params: Optional[dict] = None,
+                                  models_dir: str = MODELS_DIR, n_jobs: int = -1,
+                                  engagement: Optional[EngagementFeatureStore] = None) -> Tuple[pd.DataFrame, Dict[tuple, str]]:
+    """
+    Trains one model per (spot_sector, spot_modality) with at least MIN_SEGMENT_ROWS rows.
+
+    Args:
+        df (pd.DataFrame): spots with the features, spot_sector, spot_modality and the target
+        target_variable (str): column counted as positive when >= 1
+        params (dict): hyperparameters of RandomForestClassifier, MODEL_PARAMS by default
+        models_dir (str): cache directory of the fitted models
+        n_jobs (int): worker processes, -1 uses all the cores
+        engagement (EngagementFeatureStore): optional store of the view / inquiry counts joined by spot_id
+
+    Returns:
+        Tuple[pd.DataFrame, Dict[tuple, str]]: metrics of every segment sorted by roc_auc and the
+        path of the cached model of every (sector, modality)
+    """
+    params = dict(params or MODEL_PARAMS)
+    os.makedirs(models_dir, exist_ok=True)
+    if engagement is not None:
+        df = with_engagement_features(df, engagement)
+
+    results, paths, pending = [], {}, []
+    for (sector, modality), df_segment in df.groupby(["spot_sector", "spot_modality"], sort=False):
+        if len(df_segment) < MIN_SEGMENT_ROWS:
+            print(f"Skipping sector={sector}, modality={modality} because of insufficient data")
+            continue
+        path = os.path.join(models_dir, f'{segment_key(df_segment, sector, modality, target_variable, params)}.joblib')
+        if os.path.exists(path):
+            results.append(joblib.load(path)['metrics'])
+            paths[(sector, modality)] = path
+        else:
+            pending.append((df_segment, sector, modality, path))
+
+    trained = joblib.Parallel(n_jobs=n_jobs)(
+        joblib.delayed(train_segment)(df_segment, sector, modality, target_variable, params, path)
+        for df_segment, sector, modality, path in pending
+    )
+    for (_, sector, modality, path), row in zip(pending, trained):
+        if row is not None:
+            results.append(row)
+            paths[(sector, modality)] = path
+
+    results_df = pd.DataFrame(results)
+    if not results_df.empty:
+        results_df = results_df.sort_values(by="roc_auc", ascending=False).reset_index(drop=True)
+    return results_df, paths
+
+def build_threshold_map(df: pd.DataFrame, target_variable: str = "number_of_inquiries", params: Optional[dict] = None,
+                        models_dir: str = MODELS_DIR, n_jobs: int = -1,
+                        engagement: Optional[EngagementFeatureStore] = None) -> Tuple[dict, pd.DataFrame]:
+    """
+    Construye un diccionario con el mejor threshold para cada combinación (sector, modality).
+    The map and the model paths are saved in models_dir/thresholds_<target_variable>.json.
+    """
+    results_df, paths = train_and_evaluate_by_segment(df, target_variable, params, models_dir, n_jobs, engagement)
+
+    threshold_map = {
+        (row["sector"], row["modality"]): row["threshold"]
+        for _, row in results_df.iterrows()
+    }
+
+    save_threshold_map(threshold_map, paths, os.path.join(models_dir, f'thresholds_{target_variable}.json'))
+    return threshold_map, results_df
+
+def save_threshold_map(threshold_map: dict, paths: Dict[tuple, str], path: str):
+    segments = [{'sector': sector, 'modality': modality, 'threshold': threshold,
+                 'model': os.path.basename(paths[(sector, modality)])}
+                for (sector, modality), threshold in threshold_map.items()]
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump({'segments': segments}, f, indent=2)
+    os.replace(f'{path}.tmp', path)
+
+def load_threshold_map(path: str) -> Tuple[dict, Dict[tuple, str]]:
+    """Reads a map saved by build_threshold_map, returns the thresholds and model paths by (sector, modality)."""
+    with open(path) as f:
+        segments = json.load(f)['segments']
+    directory = os.path.dirname(path)
+    thresholds = {(s['sector'], s['modality']): s['threshold'] for s in segments}
+    paths = {(s['sector'], s['modality']): os.path.join(directory, s['model']) for s in segments}
+    return thresholds, paths
@@ -0,0 +1,144 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+import db_pool
+from db_pool import ConnectionPool
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.alive = True
+        self.closed = False
+
+    def rollback(self):
+        if not self.alive:
+            raise ConnectionError('lost connection')
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**kwargs):
+    opened = []
+
+    def connect():
+        opened.append(FakeConnection(len(opened) + 1))
+        return opened[-1]
+
+    return ConnectionPool(connect, lambda c: c.alive, **kwargs), opened
+
+
+def test_reuses_idle_connections():
+    pool, opened = make_pool(max_size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert len(opened) == 1
+    assert (pool.stats['misses'], pool.stats['hits']) == (1, 1)
+
+def test_times_out_when_exhausted():
+    pool, _ = make_pool(max_size=1, timeout=0.2)
+    pool.get()
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        pool.get()
+    assert time.monotonic() - start >= 0.2
+    assert pool.stats['timeouts'] == 1
+
+def test_waiter_is_woken_when_a_broken_connection_is_discarded():
+    pool, opened = make_pool(max_size=1, timeout=10)
+    held = pool.get()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.get()))
+    waiter.start()
+    time.sleep(0.1)
+    pool.put(held, broken=True)
+    waiter.join(2)
+    assert not waiter.is_alive()
+    assert got[0] is opened[1] and held.closed
+    assert pool._size == 1
+
+def test_waiter_is_woken_when_a_connection_is_returned():
+    pool, _ = make_pool(max_size=1, timeout=10)
+    held = pool.get()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.get()))
+    waiter.start()
+    time.sleep(0.1)
+    pool.put(held)
+    waiter.join(2)
+    assert got == [held]
+
+def test_reconnects_stale_connections():
+    pool, opened = make_pool(max_size=1, health_check_interval=0)
+    first = pool.get()
+    pool.put(first)
+    first.alive = False
+    second = pool.get()
+    assert second is opened[1] and first.closed
+    assert pool.stats['reconnects'] == 1
+
+def test_failed_rollback_discards_the_connection():
+    pool, opened = make_pool(max_size=1)
+    with pytest.raises(RuntimeError):
+        with pool.connection() as connection:
+            raise RuntimeError('query failed')
+    assert connection.closed and pool._size == 0
+    connection = pool.get()
+    connection.alive = False
+    pool.put(connection)
+    assert connection.closed and pool._size == 0
+
+def test_failed_connect_frees_the_slot():
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError('database is down')
+        return FakeConnection(len(attempts))
+
+    pool = ConnectionPool(connect, lambda c: True, max_size=1, timeout=0.2)
+    with pytest.raises(ConnectionError):
+        pool.get()
+    assert pool.get().number == 2
+
+def test_close_fails_waiters():
+    pool, _ = make_pool(max_size=1, timeout=10)
+    pool.get()
+    errors = []
+
+    def wait():
+        try:
+            pool.get()
+        except RuntimeError as e:
+            errors.append(e)
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    time.sleep(0.1)
+    pool.close()
+    waiter.join(2)
+    assert len(errors) == 1
+
+def _pools_in_child(queue):
+    queue.put((len(db_pool._pools), len(db_pool._inherited_pools)))
+
+def test_forked_child_drops_the_pools_of_the_parent(tmp_path):
+    pool = db_pool.mysql_pool({'sqlite_path': str(tmp_path / 'gamma.db')})
+    connection = pool.get()
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    child = context.Process(target=_pools_in_child, args=(queue,))
+    child.start()
+    assert queue.get(timeout=10) == (0, len(db_pool._pools))
+    child.join()
+    # the connection of the parent is still usable
+    assert connection.execute('select 1').fetchone() == (1,)
+    pool.put(connection)
@@ -0,0 +1,51 @@
+import pandas as pd
+
+from engagement_features import EngagementFeatureStore
+
+
+def views(rows):
+    return pd.DataFrame(rows, columns=['event_date', 'spot_id', 'conteo_vistas'])
+
+def inquiries(rows):
+    return pd.DataFrame(rows, columns=['spot_id', 'inquieries_day_created'])
+
+
+def test_window_counts(tmp_path):
+    store = EngagementFeatureStore(str(tmp_path / 'engagement.db'))
+    store.register_spots(pd.DataFrame({'spot_id': [1, 2], 'spot_created_at': ['2025-01-01', '2025-01-20']}))
+    # day 0, 7, 8, 30, 31 and 61 after the creation of spot 1, one view before the creation of spot 2
+    store.append_views(views([('2025-01-01', 1, 1), ('2025-01-08', 1, 2), ('2025-01-09', 1, 4),
+                              ('2025-01-31', 1, 8), ('2025-02-01', 1, 16), ('2025-03-03', 1, 32),
+                              ('2025-01-19', 2, 5), ('2025-01-21', 2, 3)]))
+    store.append_inquiries(inquiries([(1, '2025-01-05'), (1, '2025-01-05'), (2, '2025-03-01')]))
+    assert store.get(1) == {'total_vistas_7_dias': 3, 'total_vistas_30_dias': 15, 'total_vistas_60_dias': 31,
+                            'total_inquiries_7_dias': 2, 'total_inquiries_30_dias': 2, 'total_inquiries_60_dias': 2}
+    assert store.get(2) == {'total_vistas_7_dias': 3, 'total_vistas_30_dias': 3, 'total_vistas_60_dias': 3,
+                            'total_inquiries_7_dias': 0, 'total_inquiries_30_dias': 0, 'total_inquiries_60_dias': 1}
+    assert store.get(3) is None
+
+def test_days_are_appended_once(tmp_path):
+    store = EngagementFeatureStore(str(tmp_path / 'engagement.db'))
+    store.register_spots(pd.DataFrame({'spot_id': [1], 'spot_created_at': ['2025-01-01']}))
+    day = views([('2025-01-02', 1, 5)])
+    store.append_views(day)
+    store.append_views(day)
+    assert store.get(1)['total_vistas_7_dias'] == 5
+
+def test_events_before_registration_are_counted(tmp_path):
+    path = str(tmp_path / 'engagement.db')
+    store = EngagementFeatureStore(path)
+    store.register_spots(pd.DataFrame({'spot_id': [1], 'spot_created_at': ['2025-01-01']}))
+    store.append_views(views([('2025-01-02', 1, 1), ('2025-01-02', 2, 4), ('2025-01-03', 2, 2)]))
+    store.append_inquiries(inquiries([(2, '2025-01-03')]))
+    store.close()
+
+    # spot 2 is registered after its first events were appended, by another process
+    store = EngagementFeatureStore(path)
+    store.register_spots(pd.DataFrame({'spot_id': [2], 'spot_created_at': ['2025-01-02']}))
+    store.append_views(views([('2025-01-04', 2, 8)]))
+    assert store.get(1)['total_vistas_7_dias'] == 1
+    assert store.get(2)['total_vistas_7_dias'] == 14
+    assert store.get(2)['total_inquiries_7_dias'] == 1
+    store.close()
+    assert EngagementFeatureStore(path).get(2)['total_vistas_7_dias'] == 14
@@ -0,0 +1,53 @@
+import sqlite3
+
+import pytest
+
+from local_db import seed_catalog
+
+import db_pool
+import incremental_scoring
+from bench_quality import use_catalog
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    gamma_params, geo_params = seed_catalog(str(tmp_path), 60)
+    use_catalog(gamma_params, geo_params)
+    monkeypatch.setattr(incremental_scoring, 'connection_params_gamma', gamma_params)
+    monkeypatch.setattr(incremental_scoring, 'connection_params_geo', geo_params)
+    gamma = sqlite3.connect(gamma_params['sqlite_path'], isolation_level=None)
+    yield gamma
+    gamma.close()
+    db_pool.close_pools()
+
+def plain_spots(gamma, n: int):
+    # active spots that are neither complexes nor children of one, so a change rescores only themselves
+    rows = gamma.execute("""
+    select id from spots where spot_state = 1 and is_complex = 0 and parent_id is null
+    and id in (select spot_id from photos where deleted_at is null)
+    order by id limit ?
+    """, (n,)).fetchall()
+    return [row[0] for row in rows]
+
+def test_rescores_updated_spots(catalog, tmp_path):
+    state_path = str(tmp_path / 'state.json')
+    first, second = plain_spots(catalog, 2)
+    catalog.execute("update spots set updated_at = '2024-12-01 00:00:00'")
+    catalog.execute("update spots set updated_at = '2025-01-01 00:00:00' where id = ?", (first,))
+
+    results, state = incremental_scoring.rescore_incremental(state_path)
+    assert state['watermark'] == '2025-01-01 00:00:00'
+    assert len(results) == catalog.execute("select count(*) from spots where spot_state = 1").fetchone()[0]
+
+    # a hard delete leaves nothing in photos to compare with the watermark, the spot itself is touched
+    catalog.execute("delete from photos where id = (select min(id) from photos where spot_id = ?)", (second,))
+    catalog.execute("update spots set updated_at = '2025-01-02 00:00:00' where id = ?", (second,))
+    results, state = incremental_scoring.rescore_incremental(state_path)
+    # the first spot is in the second of the previous watermark, so it is rescored again
+    assert [r['id'] for r in results] == [first, second]
+    assert state['watermark'] == '2025-01-02 00:00:00'
+    assert incremental_scoring.load_state(state_path) == state
+
+def test_empty_catalog_watermark(catalog, tmp_path):
+    catalog.execute("delete from spots")
+    assert incremental_scoring.current_state()['watermark'] == incremental_scoring.MIN_WATERMARK
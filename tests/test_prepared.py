@@ -0,0 +1,69 @@
+from collections import OrderedDict
+
+from mysql.connector.cursor import MySQLCursorPrepared
+
+from prepared import execute_mysql, padded_length, query, render_in_list
+
+
+class FakeMySQLConnection:
+    """Server side of a prepared cursor, counts the statements prepared and closed."""
+    charset = 'utf8mb4'
+    get_warnings = False
+
+    def __init__(self):
+        self.prepared = 0
+        self.closed = 0
+
+    def cursor(self, prepared=False):
+        cursor = MySQLCursorPrepared()
+        cursor._connection = self
+        return cursor
+
+    def cmd_stmt_prepare(self, operation, **kwargs):
+        self.prepared += 1
+        return {'statement_id': self.prepared, 'parameters': [None] * operation.count(b'?'), 'columns': []}
+
+    def cmd_stmt_close(self, statement_id, **kwargs):
+        self.closed += 1
+
+    def cmd_stmt_reset(self, statement_id, **kwargs):
+        pass
+
+    def cmd_stmt_execute(self, statement_id, **kwargs):
+        return {'status_flag': 0, 'affected_rows': 0, 'insert_id': 0, 'warning_count': 0}
+
+
+class FakePool:
+    def __init__(self):
+        self._statements = {}
+
+    def statements(self, connection):
+        return self._statements.setdefault(id(connection), OrderedDict())
+
+
+def test_padded_length():
+    assert [padded_length(n) for n in (1, 2, 3, 4, 5, 8, 9, 1000)] == [1, 2, 4, 4, 8, 8, 16, 1024]
+
+def test_render_in_list_pads_with_the_last_value():
+    sql, params = render_in_list(query('q', 'select * from t where a = %s and id = ANY(%s)', 7, [1, 2, 3]))
+    assert sql == 'select * from t where a = %s and id IN (%s, %s, %s, %s)'
+    assert params == (7, 1, 2, 3, 3)
+
+def test_render_in_list_shares_the_sql_of_close_lengths():
+    sqls = {render_in_list(query('q', 'select * from t where id = ANY(%s)', list(range(n))))[0] for n in range(5, 9)}
+    assert len(sqls) == 1
+
+def test_render_in_list_empty_list():
+    sql, params = render_in_list(query('q', 'select * from t where id = ANY(%s)', []), '?')
+    assert sql == 'select * from t where id IN (NULL)'
+    assert params == ()
+
+def test_execute_mysql_reuses_the_prepared_statement():
+    pool, connection = FakePool(), FakeMySQLConnection()
+    statement_ids = set()
+    for ids in ([1, 2, 3], [4, 5, 6, 7], [8, 9, 10]):
+        cursor, close = execute_mysql(pool, connection, query('q', 'select * from t where id = ANY(%s)', ids))
+        assert not close
+        statement_ids.add(cursor._prepared['statement_id'])
+    assert statement_ids == {1}
+    assert (connection.prepared, connection.closed) == (1, 0)
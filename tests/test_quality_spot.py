@@ -0,0 +1,41 @@
+import pytest
+
+from local_db import seed_catalog
+
+import db_pool
+import quality_spot
+from bench_quality import use_catalog
+from check_parity import same
+from score_store import jsonable
+
+N_SPOTS = 120
+
+
+@pytest.fixture(scope='module')
+def catalog(tmp_path_factory):
+    use_catalog(*seed_catalog(str(tmp_path_factory.mktemp('catalog')), N_SPOTS))
+    yield
+    db_pool.close_pools()
+
+def test_evaluation_spots_matches_evaluation_spot(catalog):
+    ids = list(range(1, N_SPOTS + 1))
+    batch = quality_spot.evaluation_spots(ids, chunk_size=32)
+    assert [r['id'] for r in batch] == ids
+    compared = 0
+    for spot_id, result in zip(ids, batch):
+        try:
+            single = quality_spot.evaluation_spot(spot_id)
+        except KeyError:
+            # evaluation_spot fails for spots whose classified photos are none of them public
+            continue
+        assert same(jsonable(single), jsonable(result)), spot_id
+        compared += 1
+    # the seeded catalog has complexes and children without photos, most spots are still compared
+    assert compared > N_SPOTS * 0.8
+
+def test_missing_spots_keep_their_place(catalog):
+    missing = N_SPOTS + 1
+    results = quality_spot.evaluation_spots([3, missing, 5])
+    assert [r['id'] for r in results] == [3, missing, 5]
+    assert [quality_spot.is_scored(r) for r in results] == [True, False, True]
+    assert results[1] == {'id': missing, 'error': 'el spot no existe'}
@@ -0,0 +1,38 @@
+import json
+import sqlite3
+
+import pytest
+
+from local_db import seed_catalog
+
+import db_pool
+import score_catalog
+from bench_quality import use_catalog
+
+
+@pytest.fixture
+def gamma_path(tmp_path, monkeypatch):
+    gamma_params, geo_params = seed_catalog(str(tmp_path), 50)
+    use_catalog(gamma_params, geo_params)
+    monkeypatch.setattr(score_catalog, 'connection_params_gamma', gamma_params)
+    yield gamma_params['sqlite_path']
+    db_pool.close_pools()
+
+def active_ids(path: str, last_id: int = 0):
+    with sqlite3.connect(path) as connection:
+        connection.execute("update spots set spot_state = 0 where id % 9 = 0")
+        rows = connection.execute("select id from spots where spot_state = 1 and id > ? order by id", (last_id,))
+        return [row[0] for row in rows]
+
+def test_stream_active_ids(gamma_path):
+    expected = active_ids(gamma_path, 10)
+    chunks = list(score_catalog.stream_active_ids(10, 7))
+    assert [id for chunk in chunks for id in chunk] == expected
+    assert all(len(chunk) == 7 for chunk in chunks[:-1])
+
+def test_score_catalog_jsonl(gamma_path, tmp_path):
+    expected = active_ids(gamma_path)
+    output = str(tmp_path / 'scores.jsonl')
+    score_catalog.score_catalog(output, chunk_size=16)
+    with open(output) as f:
+        assert [json.loads(line)['id'] for line in f] == expected
@@ -0,0 +1,47 @@
+import os
+import random
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from views_history import convert_views_csv, read_views
+
+
+@pytest.fixture
+def views_csv(tmp_path):
+    rng = random.Random(0)
+    days = pd.date_range('2024-11-20', '2025-02-10').strftime('%Y%m%d')
+    # not in date order, like a history appended by several exports
+    rows = [(rng.choice(days), rng.randint(1, 500), rng.randint(0, 300)) for _ in range(5000)]
+    path = str(tmp_path / 'views.csv')
+    pd.DataFrame(rows, columns=['event_date', 'spot_id', 'conteo_vistas']).to_csv(path, index=False)
+    return path
+
+def read_all(path, start=None, end=None) -> pd.DataFrame:
+    table = pa.Table.from_batches(list(read_views(path, start, end)))
+    return table.to_pandas().sort_values(['event_date', 'spot_id', 'conteo_vistas'], ignore_index=True)
+
+def test_convert_by_month(views_csv, tmp_path):
+    parquet_dir = str(tmp_path / 'views_parquet')
+    assert convert_views_csv(views_csv, parquet_dir, block_size=8192, row_group_size=300) == 5000
+    assert sorted(os.listdir(parquet_dir)) == ['2024-11.parquet', '2024-12.parquet', '2025-01.parquet', '2025-02.parquet']
+    for name in os.listdir(parquet_dir):
+        parquet_file = pq.ParquetFile(os.path.join(parquet_dir, name))
+        sizes = [parquet_file.metadata.row_group(i).num_rows for i in range(parquet_file.num_row_groups)]
+        assert all(size == 300 for size in sizes[:-1]) and sizes[-1] <= 300
+        for i in range(parquet_file.num_row_groups):
+            # every row group is sorted and within the month of its file, so a date range skips the rest
+            dates = parquet_file.read_row_group(i).column('event_date').to_pylist()
+            assert dates == sorted(dates) and {date.strftime('%Y-%m') for date in dates} == {name[:7]}
+
+    pd.testing.assert_frame_equal(read_all(parquet_dir), read_all(views_csv))
+    pd.testing.assert_frame_equal(read_all(parquet_dir, '2024-12-25', '2025-01-05'),
+                                  read_all(views_csv, '2024-12-25', '2025-01-05'))
+
+def test_convert_refuses_existing_files(views_csv, tmp_path):
+    parquet_dir = str(tmp_path / 'views_parquet')
+    convert_views_csv(views_csv, parquet_dir)
+    with pytest.raises(FileExistsError):
+        convert_views_csv(views_csv, parquet_dir)
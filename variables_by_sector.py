@@ -40,3 +40,44 @@ photos_map = {
 }
 
 
+
+variables_map = {
+    'office': office,
+    'land': land,
+    'industrial': industrial,
+    'retail': retail
+}
+
+# Buckets for the number of public photos: 0, 1, 2-3, 4-5, 6-9, 10+
+photos_quantity_bins = [1, 2, 4, 6, 10]
+photos_quantity_scores = [0, 25, 50, 75, 90, 100]
+
+# Variables of the spots table evaluated for completeness
+spot_variables = [
+    'natural_light', 'luminaries', 'charging_ports', 'energy', 'floor_material', 'fire_protection_system',
+    'security_type', 'vehicle_ramp', 'land_use', 'floor_level', 'vertical_height', 'parking_spaces', 'front',
+    'height', 'height_between_floors'
+]
+
+# Amenities evaluated for completeness: column name -> name in the amenities table
+amenity_variables = {
+    'Banos': 'Baños',
+    'Wifi': 'Wifi',
+    'Ac': 'A/C',
+    'Estacionamiento': 'Estacionamiento',
+    'Bodega': 'Bodega',
+    'Accesibilidad': 'Accesibilidad',
+    'Luz': 'Luz',
+    'Sistema_de_seguridad': 'Sistema de seguridad',
+    'Montacargas': 'Montacargas',
+    'Pizarron': 'Pizarrón',
+    'Elevador': 'Elevador',
+    'Terraza': 'Terraza',
+    'Zona_de_limpieza': 'Zona de limpieza',
+    'Posibilidad_a_dividirse': 'Posibilidad a dividirse',
+    'Mezzanine': 'Mezzanine',
+    'Cocina_equipada': 'cocina equipada',
+    'Cocina': 'Cocina',
+    'Planta_de_luz': 'Planta de luz',
+    'Tapanco': 'Tapanco'
+}
@@ -0,0 +1,178 @@
+"""
+Typed, streaming reader of the views.csv event history (event_date, spot_id, conteo_vistas).
+
+The history is read in Arrow record batches with compact types (date32 dates, int32 spot ids,
+uint16 counts) instead of a default pandas read. convert_views_csv writes it once as a directory of
+Parquet files, one per month, whose row groups are sorted by date, so read_views can skip the row
+groups outside a date range. views_window_totals
+computes the views of every spot in the first days after its creation batch by batch, without
+merging the whole history with lk_spots.
+
+    convert_views_csv('views.csv', 'views_parquet')
+    totals = views_window_totals('views_parquet', data[['spot_id', 'spot_created_at']])
+"""
+
+import datetime
+import os
+from typing import Iterator, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+VIEWS_SCHEMA = pa.schema([
+    ('event_date', pa.date32()),
+    ('spot_id', pa.int32()),
+    ('conteo_vistas', pa.uint16())
+])
+
+# Bytes of csv parsed per record batch
+CSV_BLOCK_SIZE = 1 << 24
+# Rows per row group of the Parquet files, every row group keeps min/max statistics of event_date
+ROW_GROUP_SIZE = 1 << 20
+# Days after the creation of a spot counted by views_window_totals
+VIEWS_WINDOW_DAYS = 60
+
+DateLike = Union[str, datetime.date, pd.Timestamp, None]
+
+
+def _csv_batches(csv_path: str, block_size: int = CSV_BLOCK_SIZE) -> Iterator[pa.RecordBatch]:
+    reader = pa_csv.open_csv(
+        csv_path,
+        read_options=pa_csv.ReadOptions(block_size=block_size),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={'event_date': pa.string(), 'spot_id': pa.int32(), 'conteo_vistas': pa.uint16()},
+            include_columns=VIEWS_SCHEMA.names
+        )
+    )
+    for batch in reader:
+        # event_date comes as yyyymmdd
+        dates = pc.cast(pc.strptime(batch.column('event_date'), format='%Y%m%d', unit='s'), pa.date32())
+        yield pa.RecordBatch.from_arrays([dates, batch.column('spot_id'), batch.column('conteo_vistas')],
+                                         schema=VIEWS_SCHEMA)
+
+def convert_views_csv(csv_path: str, parquet_dir: str, block_size: int = CSV_BLOCK_SIZE,
+                      row_group_size: int = ROW_GROUP_SIZE) -> int:
+    """
+    Converts views.csv to a directory of Parquet files, <yyyy-mm>.parquet for every month of event_date.
+
+    The batches are written as they are parsed: the rows of every month are buffered until they fill a
+    row group, which is sorted by event_date and spot_id and appended to the file of the month. At most
+    one row group per month is held in memory.
+
+    Returns:
+        int: number of rows written
+    """
+    os.makedirs(parquet_dir, exist_ok=True)
+    if any(name.endswith('.parquet') for name in os.listdir(parquet_dir)):
+        raise FileExistsError(f'{parquet_dir} already has Parquet files')
+    writers, buffers = {}, {}
+    rows = 0
+
+    def write(month: str, final: bool = False):
+        table = pa.Table.from_batches(buffers.pop(month), schema=VIEWS_SCHEMA)
+        table = table.sort_by([('event_date', 'ascending'), ('spot_id', 'ascending')])
+        # only full row groups are written until the end, the rest waits for more rows of the month
+        full = table.num_rows if final else table.num_rows - table.num_rows % row_group_size
+        if full:
+            if month not in writers:
+                writers[month] = pq.ParquetWriter(os.path.join(parquet_dir, f'{month}.parquet'), VIEWS_SCHEMA)
+            writers[month].write_table(table.slice(0, full), row_group_size=row_group_size)
+        if full < table.num_rows:
+            buffers[month] = table.slice(full).to_batches()
+
+    try:
+        for batch in _csv_batches(csv_path, block_size):
+            rows += batch.num_rows
+            days = batch.column('event_date').cast(pa.int32()).to_numpy(zero_copy_only=False)
+            months = days.astype('datetime64[D]').astype('datetime64[M]')
+            for month in np.unique(months):
+                key = str(month)
+                buffers.setdefault(key, []).append(batch.filter(pa.array(months == month)))
+                if sum(b.num_rows for b in buffers[key]) >= row_group_size:
+                    write(key)
+        for month in list(buffers):
+            write(month, final=True)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return rows
+
+def _to_date(value: DateLike) -> Optional[datetime.date]:
+    return None if value is None else pd.Timestamp(value).date()
+
+def read_views(path: str, start: DateLike = None, end: DateLike = None) -> Iterator[pa.RecordBatch]:
+    """
+    Streams the view events with start <= event_date <= end.
+
+    Parquet files or directories of them, like the one of convert_views_csv, are filtered by the reader, using the row group statistics
+    to skip the data outside the range. Csv files are parsed in blocks and filtered batch by batch.
+    """
+    start, end = _to_date(start), _to_date(end)
+    if path.endswith('.csv'):
+        for batch in _csv_batches(path):
+            mask = None
+            if start is not None:
+                mask = pc.greater_equal(batch.column('event_date'), pa.scalar(start, pa.date32()))
+            if end is not None:
+                upper = pc.less_equal(batch.column('event_date'), pa.scalar(end, pa.date32()))
+                mask = upper if mask is None else pc.and_(mask, upper)
+            yield batch if mask is None else batch.filter(mask)
+        return
+
+    condition = None
+    if start is not None:
+        condition = ds.field('event_date') >= pa.scalar(start, pa.date32())
+    if end is not None:
+        upper = ds.field('event_date') <= pa.scalar(end, pa.date32())
+        condition = upper if condition is None else condition & upper
+    dataset = ds.dataset(path, format='parquet', schema=VIEWS_SCHEMA)
+    yield from dataset.to_batches(columns=VIEWS_SCHEMA.names, filter=condition)
+
+def views_window_totals(path: str, spots: pd.DataFrame, window_days: int = VIEWS_WINDOW_DAYS) -> pd.DataFrame:
+    """
+    Views of every spot from its creation date to window_days days later, both included.
+    Same result as the inner merge of the notebook, grouped by spot_id.
+
+    Args:
+        path (str): views.csv, a Parquet file or the directory written by convert_views_csv
+        spots (pd.DataFrame): spot_id and spot_created_at of the spots
+        window_days (int): days after the creation counted
+
+    Returns:
+        pd.DataFrame: spot_id and total_vistas_<window_days>_dias of the spots with views in the window
+    """
+    column = f'total_vistas_{window_days}_dias'
+    spots = spots.dropna(subset=['spot_id', 'spot_created_at'])
+    if spots.empty:
+        return pd.DataFrame({'spot_id': pd.Series(dtype='int32'), column: pd.Series(dtype='int64')})
+
+    spot_ids = spots['spot_id'].to_numpy(dtype=np.int64)
+    created = pd.to_datetime(spots['spot_created_at']).to_numpy(dtype='datetime64[D]').astype(np.int64)
+    # creation day of every spot indexed by spot_id, -1 for unknown spots
+    created_by_id = np.full(int(spot_ids.max()) + 1, -1, dtype=np.int64)
+    created_by_id[spot_ids] = created
+    totals = np.zeros(len(created_by_id), dtype=np.int64)
+    seen = np.zeros(len(created_by_id), dtype=bool)
+
+    start = np.datetime64(int(created.min()), 'D').astype(datetime.date)
+    end = np.datetime64(int(created.max()) + window_days, 'D').astype(datetime.date)
+    for batch in read_views(path, start, end):
+        ids = batch.column('spot_id').to_numpy(zero_copy_only=False).astype(np.int64)
+        days = batch.column('event_date').cast(pa.int32()).to_numpy(zero_copy_only=False)
+        counts = batch.column('conteo_vistas').to_numpy(zero_copy_only=False)
+        known = (ids >= 0) & (ids < len(created_by_id))
+        ids, days, counts = ids[known], days[known], counts[known]
+        created_at = created_by_id[ids]
+        delta = days - created_at
+        in_window = (created_at >= 0) & (delta >= 0) & (delta <= window_days)
+        totals += np.bincount(ids[in_window], weights=counts[in_window], minlength=len(totals)).astype(np.int64)
+        seen[ids[in_window]] = True
+
+    # spots whose views in the window add up to 0 are kept like in the merge
+    seen = np.flatnonzero(seen)
+    return pd.DataFrame({'spot_id': seen.astype(np.int32), column: totals[seen]})